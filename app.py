@@ -1,30 +1,22 @@
 import streamlit as st
-from supabase import create_client
-from utils import helpers, auth
-from utils.helpers import create_pdf
+from utils import helpers, auth, cache, estimates, revisions, search, aggregates, rollups, payments, analytics, profiling, session_buffers, connection, write_queue, jobs, maintenance, kits, pricing, labor
 
 from datetime import datetime, timedelta
+import os
 import time
 import pandas as pd
 import math
-import textwrap
 
-from streamlit_js_eval import get_geolocation
-import altair as alt
-import plotly.graph_objects as go
-import extra_streamlit_components as stx
+# Heavier UI/report dependencies (plotly, altair, fpdf, streamlit_js_eval,
+# extra_streamlit_components) are imported by the sections that use them so
+# the login screen and cold starts do not pay for them. The Supabase client
+# is created by utils/connection.py on the first query.
 
 # ---------------------------
 # 1. SETUP & CONNECTION
 # ---------------------------
 st.set_page_config(page_title="Jugnoo", page_icon="🏗️", layout="wide")
 
-# === START OF CRITICAL CACHE FIX ===
-if st.session_state.get('cache_fix_needed', True):
-    st.cache_resource.clear()
-    st.session_state.cache_fix_needed = False
-# === END OF CRITICAL CACHE FIX ===
-
 # --- HIDE STREAMLIT ANCHORS & TOOLBAR ---
 st.markdown("""
     <style>
@@ -123,51 +115,290 @@ st.markdown("""
     <meta name="apple-mobile-web-app-capable" content="yes">
     """, unsafe_allow_html=True)
 
-@st.cache_resource(ttl="1h")
+def fake_backend_spec():
+    """Synthetic in-memory data for benchmarks and demos (see utils/fake_backend.py)."""
+    try: fake_spec = st.secrets.get("FAKE_BACKEND")
+    except Exception: fake_spec = None
+    return fake_spec or os.environ.get("JUGNOO_FAKE_BACKEND")
+
+@st.cache_resource
 def init_connection():
+    """One backend connection per process, with retries and a circuit breaker (see utils/connection.py)."""
+    fake_spec = fake_backend_spec()
+    if fake_spec:
+        from utils import fake_backend
+        return connection.Connection(lambda: fake_backend.from_spec(fake_spec))
     try:
         url = st.secrets["SUPABASE_URL"]
         key = st.secrets["SUPABASE_KEY"]
-        return create_client(url, key)
-    except:
+    except Exception:
         return None
+    return connection.Connection(connection.pooled_supabase_factory(url, key))
 
 supabase = init_connection()
+if supabase is None:
+    st.error("Database is not configured: set SUPABASE_URL and SUPABASE_KEY in the app secrets.")
+    st.stop()
+cache.reset_stale_reads()
 
 # ---------------------------
 # 2. CACHED DATA FUNCTIONS
 # ---------------------------
-@st.cache_data(ttl=60)
+# Shared across workers and restarts (see utils/cache.py); CACHE_URL selects the store.
+if not cache.is_configured():
+    try: cache.configure(st.secrets.get("CACHE_URL"))
+    except Exception: cache.configure()
+
+# Local write-behind queue for saves (see utils/write_queue.py); the fake backend gets its own file.
+if not write_queue.is_configured():
+    try: wq_path = st.secrets.get("WRITE_QUEUE_PATH")
+    except Exception: wq_path = None
+    write_queue.configure(os.path.join(".cache", "jugnoo_writes_fake.sqlite3") if fake_backend_spec() else wq_path)
+
+# Background job table and thread pool (see utils/jobs.py); JOBS_PATH moves the table.
+if not jobs.is_configured():
+    try: jobs_path = st.secrets.get("JOBS_PATH")
+    except Exception: jobs_path = None
+    jobs.configure(os.path.join(".cache", "jugnoo_jobs_fake.sqlite3") if fake_backend_spec() else jobs_path)
+
+# Optional local columnar copy for reporting (see utils/analytics.py); ANALYTICS_DIR enables it.
+if not analytics.is_configured():
+    try: analytics.configure(st.secrets.get("ANALYTICS_DIR"))
+    except Exception: analytics.configure()
+
+@cache.shared_cache(ttl=60)
 def get_clients():
     return supabase.table("clients").select("*").order("created_at", desc=True).execute()
 
-@st.cache_data(ttl=300)
+@cache.shared_cache(ttl=300)
 def get_inventory():
     return supabase.table("inventory").select("*").order("item_name").execute()
 
-@st.cache_data(ttl=300)
+@cache.shared_cache(ttl=300)
 def get_suppliers():
     return supabase.table("suppliers").select("*").order("name").execute()
 
-@st.cache_data(ttl=300)
+@cache.shared_cache(ttl=300, default=None)
+def get_kits():
+    """Bill-of-materials kits (see utils/kits.py); None if the table is missing."""
+    return supabase.table("kits").select("*").order("name").execute()
+
+@cache.shared_cache(ttl=300, default=None)
 def get_staff():
-    try:
-        return supabase.table("staff").select("*").order("name").execute()
-    except: return None
+    return supabase.table("staff").select("*").order("name").execute()
 
-@st.cache_data(ttl=300)
+@cache.shared_cache(ttl=300, default=None)
+def get_staff_assignments():
+    """Staff assignment history for labor costing (see utils/labor.py); None if the table is missing."""
+    return supabase.table("staff_assignments").select("*").execute()
+
+@cache.shared_cache(ttl=300, default=None)
 def get_staff_roles():
-    try:
-        return supabase.table("staff_roles").select("*").execute()
-    except: return None
+    return supabase.table("staff_roles").select("*").execute()
 
-@st.cache_data(ttl=3600)
+@cache.shared_cache(ttl=3600, default={})
 def get_settings():
+    res = supabase.table("settings").select("*").eq("id", 1).execute()
+    if res and res.data: return res.data[0]
+    return {}
+
+@cache.shared_cache(ttl=60)
+def get_client_index():
+    """id/name/status of open clients for the Estimator picker (no estimate JSON)."""
+    return supabase.table("clients").select("id, name, status").neq("status", "Closed").order("name").execute()
+
+@cache.shared_cache(ttl=60)
+def get_client_estimate(client_id):
+    res = supabase.table("clients").select("id, name, internal_estimate, updated_at").eq("id", client_id).execute()
+    return res.data[0] if res and res.data else None
+
+@cache.shared_cache(ttl=300, default=None)
+def get_estimate_revisions(client_id):
+    """Stored revisions of one client's estimate (see utils/revisions.py)."""
+    return revisions.get_revisions(supabase, client_id)
+
+@cache.shared_cache(ttl=30)
+def get_dashboard_summary():
+    """Dashboard header counts, recent and top clients in one small query (see utils/aggregates.py)."""
+    return aggregates.dashboard_summary(supabase, recent_n=5, top_n=5)
+
+@cache.shared_cache(ttl=60)
+def get_pl_rollups():
+    """Monthly P&L rows from `pl_monthly` (see utils/rollups.py)."""
+    try: return rollups.get_rollups(supabase)
+    except Exception as e:
+        print(f"P&L rollups unavailable: {e}")
+        return None
+
+@cache.shared_cache(ttl=60)
+def get_client_balances():
+    """Quoted/paid columns of delivered (Work Done / Closed) clients for outstanding and ageing."""
+    return supabase.table("clients").select(payments.BALANCE_COLUMNS).in_("status", helpers.INACTIVE_STATUSES).execute()
+
+@cache.shared_cache(ttl=60)
+def get_project_pl():
+    """Per-project P&L rows of completed clients from a narrow, paged select (see rollups.project_table)."""
+    return rollups.project_table(supabase, get_settings(), get_item_maps()[0])
+
+@cache.shared_cache(ttl=60)
+def get_total_collected():
+    """Cash collected from all clients (payments ledger running totals)."""
+    return payments.total_collected(supabase)
+
+@cache.shared_cache(ttl=300)
+def get_purchase_costs():
+    """supplier_id/cost/purchase_date of all supplier purchases (Suppliers spend, monthly P&L before the rollups are built)."""
+    return rollups.select_all(lambda: supabase.table("supplier_purchases").select("id, supplier_id, cost, purchase_date"))
+
+def refresh_pl_rollups(client_id=None, month=None):
+    """Recomputes the month touched by a client/payment/purchase write."""
     try:
-        res = supabase.table("settings").select("*").eq("id", 1).execute()
-        if res and res.data: return res.data[0]
-        return {}
-    except: return {}
+        if month: rollups.refresh_month(supabase, month, get_settings())
+        elif client_id is not None: rollups.refresh_for_client(supabase, client_id, get_settings())
+    except Exception as e: print(f"P&L rollup not refreshed: {e}")
+    get_pl_rollups.clear()
+
+def clear_client_caches():
+    get_clients.clear()
+    get_dashboard_summary.clear()
+    get_client_balances.clear()
+    get_project_pl.clear()
+    get_total_collected.clear()
+    get_client_index.clear()
+    get_client_estimate.clear()
+
+def get_item_maps():
+    """(names_by_id, ids_by_name) for inventory, used to read/write v2 estimates."""
+    try: inv = get_inventory()
+    except Exception: inv = None
+    return estimates.inventory_maps(inv.data if inv and inv.data else [])
+
+# ---------------------------
+# QUEUED WRITES
+# ---------------------------
+# Status, payment, estimate and staff-status saves return at once: the cached
+# views are patched to show the change and the write-queue thread applies it
+# (see utils/write_queue.py), then refreshes rollups and caches.
+def client_version(client):
+    """Conflict check for a queued client write: the `updated_at` the user saw, when known."""
+    v = client.get('updated_at')
+    return {"updated_at": v} if isinstance(v, str) else None
+
+def patch_cached_row(cached_fn, row_id, values):
+    """Updates one row of a cached response in place (only the columns its query selected)."""
+    def patch_rows(res):
+        for row in res.data or []:
+            if row.get('id') == row_id: row.update({k: v for k, v in values.items() if k in row})
+        return res
+    cached_fn.patch(patch_rows)
+
+def patch_client_views(client_id, values):
+    """Shows a queued client write in the cached client views until it is applied."""
+    patch_cached_row(get_clients, client_id, values)
+    patch_cached_row(get_client_index, client_id, values)
+    get_client_estimate.patch(lambda row: {**row, **{k: v for k, v in values.items() if k in row}} if row else None, client_id)
+
+def apply_client_status(p):
+    write_queue.apply_update(supabase, "clients", p['client_id'], p['values'], p.get('expected'))
+    if p.get('busy'): supabase.table("staff").update({"status": "Busy"}).in_("id", p['busy']).execute()
+    if p.get('available'): supabase.table("staff").update({"status": "Available"}).in_("id", p['available']).execute()
+    try: labor.record_assignment_changes(supabase, p['client_id'], p.get('busy'), p.get('available'), p.get('on') or datetime.now().date(), p.get('wages') or {},
+                                         release_all=p['values'].get('status') in helpers.INACTIVE_STATUSES)
+    except Exception as e: print(f"Assignments not recorded: {e}")
+
+def after_client_status(p):
+    refresh_pl_rollups(month=p.get('month'))
+    clear_client_caches()
+    get_staff.clear()
+    get_staff_assignments.clear()
+
+def apply_payment(p):
+    payments.record_payment(supabase, p['client_id'], p['amount'], datetime.strptime(p['paid_on'], '%Y-%m-%d').date(), p.get('method'), p.get('note'), p.get('username'))
+
+def after_payment(p):
+    write_queue.remember_current(supabase, "clients", p['client_id'])
+    refresh_pl_rollups(month=p.get('month'))
+    clear_client_caches()
+
+def apply_estimate(p):
+    write_queue.apply_update(supabase, "clients", p['client_id'], p['values'], p.get('expected'))
+
+def after_estimate(p):
+    try: revisions.record_revision(supabase, p['client_id'], p.get('previous'), p['values']['internal_estimate'], p.get('username'))
+    except Exception as e: print(f"Revision not recorded: {e}")
+    get_estimate_revisions.clear()
+    if p.get('month'): refresh_pl_rollups(month=p['month'])
+    elif p.get('refresh_client'): refresh_pl_rollups(client_id=p['client_id'])
+    clear_client_caches()
+
+def merge_estimates(earlier, later):
+    """Back-to-back saves of one estimate: write the last one, check against the first, keep one revision."""
+    return {**write_queue.merge_updates(earlier, later), "previous": earlier.get('previous')}
+
+def apply_row_update(p):
+    write_queue.apply_update(supabase, p['table'], p['id'], p['values'], p.get('expected'))
+    if p['table'] == "staff": get_staff.clear()
+
+write_queue.register("client_status", apply_client_status, on_failed=lambda p: (clear_client_caches(), get_staff.clear()), after=after_client_status, idempotent=True)
+write_queue.register("payment", apply_payment, on_failed=lambda p: clear_client_caches(), after=after_payment)
+write_queue.register("estimate", apply_estimate, merge=merge_estimates, on_failed=lambda p: clear_client_caches(), after=after_estimate)
+write_queue.register("row_update", apply_row_update, merge=write_queue.merge_updates, on_failed=lambda p: get_staff.clear(), idempotent=True)
+write_queue.start()
+
+# ---------------------------
+# BACKGROUND JOBS
+# ---------------------------
+# Long operations started from any tab run in the job pool (see utils/jobs.py)
+# and are followed in the jobs panel under the header.
+def job_export_pdfs(ctx, status_filter="All"):
+    """Zip of estimate PDFs for the clients matching the Dashboard filter."""
+    import io, zipfile
+    resp = get_clients()
+    rows = resp.data if resp and resp.data else []
+    if status_filter == "Active": rows = [r for r in rows if r.get('status') not in helpers.INACTIVE_STATUSES]
+    elif status_filter == "Closed": rows = [r for r in rows if r.get('status') in helpers.INACTIVE_STATUSES]
+    parsed, gs = estimates.parse_clients(rows, get_item_maps()[0]), get_settings()
+    buf, written = io.BytesIO(), 0
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i, row in enumerate(rows):
+            est = parsed.get(row['id'])
+            if est is not None and est.items:
+                res = est.calculate(gs)
+                zf.writestr(f"Est_{sanitize_filename(row['name'])}_{row['id']}.pdf",
+                            helpers.create_pdf(row['name'], res["edf_details_df"].to_dict(orient="records"), est.days, res["disp_lt"], res["rounded_grand_total"], res["advance_amount"], is_final=False))
+                written += 1
+            ctx.progress(i + 1, len(rows), f"{i + 1}/{len(rows)} clients")
+    ctx.save_result(buf.getvalue(), f"Estimates_{status_filter}_{datetime.now().strftime('%Y%m%d_%H%M')}.zip", "application/zip")
+    return f"{written} estimate PDFs"
+
+def job_rebuild_rollups(ctx):
+    months = rollups.rebuild(supabase, get_settings(), progress=lambda n: ctx.progress(message=f"{n} months so far"))
+    get_pl_rollups.clear()
+    return f"{months} months rebuilt"
+
+def job_backfill_totals(ctx, only_missing=True):
+    n = maintenance.backfill_estimate_totals(supabase, get_settings(), only_missing=only_missing, progress=lambda done: ctx.progress(message=f"{done} clients updated"))
+    clear_client_caches()
+    return f"{n} clients updated"
+
+def job_backfill_assignments(ctx):
+    n = maintenance.backfill_assignments(supabase, progress=lambda done: ctx.progress(message=f"{done} assignments recorded"))
+    get_staff_assignments.clear()
+    return f"{n} assignments recorded"
+
+def job_migrate_estimates(ctx, dry_run=False):
+    n, before, after = maintenance.migrate_estimates(supabase, dry_run=dry_run, progress=lambda done: ctx.progress(message=f"{done} estimates migrated"))
+    if not dry_run: clear_client_caches()
+    return f"{'Would migrate' if dry_run else 'Migrated'} {n} estimates: {before:,} -> {after:,} bytes"
+
+jobs.register("export_pdfs", job_export_pdfs, "Export estimate PDFs")
+jobs.register("rebuild_rollups", job_rebuild_rollups, "Rebuild P&L rollups")
+jobs.register("backfill_totals", job_backfill_totals, "Backfill estimate totals")
+jobs.register("migrate_estimates", job_migrate_estimates, "Migrate estimates to v2")
+jobs.register("backfill_assignments", job_backfill_assignments, "Backfill staff assignments")
+jobs.start()
+
+cache.warm_start()
 
 import re
 def sanitize_filename(name):
@@ -177,6 +408,7 @@ def sanitize_filename(name):
 # 3. AUTHENTICATION
 # ---------------------------
 def get_manager():
+    import extra_streamlit_components as stx
     return stx.CookieManager(key="auth_cookie_manager")
 
 cookie_manager = get_manager()
@@ -234,6 +466,21 @@ login_section()
 if not st.session_state.get('logged_in'):
     st.stop()
 
+def is_admin():
+    """Admins are listed in the ADMIN_USERS secret."""
+    try: admins = st.secrets.get("ADMIN_USERS", [])
+    except Exception: admins = []
+    return st.session_state.username in admins
+
+# Admin-only profiling of the next N reruns (Settings tab or ?profile=N, see utils/profiling.py)
+if is_admin():
+    if "profile" in st.query_params:
+        try: profiling.request(st.session_state, max(1, min(int(st.query_params["profile"]), 20)))
+        except ValueError: pass
+        del st.query_params["profile"]
+    profiling.start_run(st.session_state)
+session_buffers.begin_run(st.session_state)
+
 # Top Bar
 st.title("🚀 Jugnoo CRM")
 st.markdown(f"""
@@ -242,26 +489,137 @@ st.markdown(f"""
     <span style="font-size: 1.75rem; font-weight: 700; background: linear-gradient(to right, #f8fafc, #94a3b8); -webkit-background-clip: text; -webkit-text-fill-color: transparent;">Welcome back, {st.session_state.username}</span>
 </div>
 """, unsafe_allow_html=True)
+# Filled at the end of the run when data was served from the cache because the backend failed
+stale_banner = st.empty()
+
+# Saves still on their way to the database, and ones it refused (see utils/write_queue.py)
+queued_writes, refused_writes = write_queue.pending(st.session_state.username), write_queue.failures(st.session_state.username)
+if queued_writes:
+    st.caption(f"⏳ {len(queued_writes)} change(s) saving in the background...")
+if refused_writes:
+    with st.expander(f"⚠️ {len(refused_writes)} change(s) could not be saved", expanded=True):
+        for w in refused_writes:
+            is_conflict = w['status'] == write_queue.CONFLICT
+            wc1, wc2, wc3 = st.columns([4, 1, 1])
+            wc1.write(f"**{w['label'] or w['kind']}** ({datetime.fromtimestamp(w['created_at']).strftime('%d %b %H:%M')}): {'changed by someone else meanwhile' if is_conflict else w['error']}")
+            if wc2.button("Overwrite" if is_conflict else "Retry", key=f"wq_retry_{w['id']}", use_container_width=True):
+                write_queue.retry(w['id'])
+                st.rerun()
+            if wc3.button("Discard", key=f"wq_discard_{w['id']}", use_container_width=True):
+                write_queue.discard(w['id'])
+                st.rerun()
+
+# Background jobs started by this user (see utils/jobs.py); polls while any is queued or running
+JOB_ICONS = {jobs.QUEUED: "🕒", jobs.RUNNING: "⏳", jobs.DONE: "✅", jobs.FAILED: "❌", jobs.CANCELLED: "🚫"}
+jobs_active = any(j['status'] in jobs.ACTIVE for j in jobs.list_jobs(st.session_state.username, limit=5))
+
+@st.fragment(run_every=2.0 if jobs_active else None)
+def jobs_panel():
+    my_jobs = jobs.list_jobs(st.session_state.username, limit=5)
+    running = [j for j in my_jobs if j['status'] in jobs.ACTIVE]
+    if jobs_active and not running:
+        st.rerun(scope="app")  # a job finished: refresh the page (and stop polling)
+    if not my_jobs:
+        return
+    with st.expander(f"⚙️ Background Jobs ({len(running)} running)" if running else "⚙️ Background Jobs", expanded=bool(running)):
+        for j in my_jobs:
+            jc1, jc2 = st.columns([4, 1])
+            detail = j['error'] if j['status'] == jobs.FAILED else (j['message'] or "")
+            jc1.write(f"{JOB_ICONS.get(j['status'], '')} **{j['title']}** ({datetime.fromtimestamp(j['created_at']).strftime('%d %b %H:%M')}) {detail}")
+            if j['status'] == jobs.RUNNING:
+                jc1.progress(j['progress'] or 0.0)
+            if j['status'] in jobs.ACTIVE:
+                if jc2.button("Cancel", key=f"job_cancel_{j['id']}", use_container_width=True):
+                    jobs.cancel(j['id'])
+                    st.rerun(scope="app")
+            elif j['status'] in (jobs.FAILED, jobs.CANCELLED):
+                if jc2.button("Retry", key=f"job_retry_{j['id']}", use_container_width=True):
+                    jobs.retry(j['id'])
+                    st.rerun(scope="app")
+            elif j['result_path']:
+                job_file = jobs.result_bytes(j)
+                if job_file is not None:
+                    jc2.download_button("⬇️ Download", job_file, j['result_name'], j['result_mime'], key=f"job_dl_{j['id']}", use_container_width=True)
+
+jobs_panel()
+
+# --- GLOBAL SEARCH ---
+TAB_LABELS = ["📋 Dashboard", "➕ New Client", "🧮 Estimator", "📦 Inventory", "🚚 Suppliers", "👥 Staff", "📈 P&L", "⚙️ Settings"]
+SEARCH_KINDS = {"client": ("👤", "📋 Dashboard"), "estimate": ("🧮", "🧮 Estimator"), "item": ("📦", "📦 Inventory"), "supplier": ("🚚", "🚚 Suppliers"), "staff": ("👥", "👥 Staff")}
+
+def open_search_hit(kind, doc_id):
+    """Deep link to a search hit via ?goto=kind:id (also works as a shared URL)."""
+    st.query_params["goto"] = f"{kind}:{doc_id}"
+    st.session_state.pop('_goto_applied', None)
+
+def apply_deep_link():
+    """Pre-selects the tab and entity named in ?goto= once per link. Returns (tab label, (kind, id))."""
+    goto = st.query_params.get("goto")
+    if not goto or ":" not in goto: return None, None
+    kind, _, raw_id = goto.partition(":")
+    if kind not in SEARCH_KINDS: return None, None
+    try: doc_id = int(raw_id)
+    except ValueError: return None, None
+    tab_label = SEARCH_KINDS[kind][1]
+    if kind == "estimate":
+        try: open_ids = {r['id'] for r in (get_client_index().data or [])}
+        except Exception: open_ids = set()
+        if doc_id not in open_ids: kind, tab_label = "client", SEARCH_KINDS["client"][1]
+    if st.session_state.get('_goto_applied') != goto:
+        st.session_state['_goto_applied'] = goto
+        if kind == "client": st.session_state['dash_filter'] = "All"
+        elif kind == "estimate":
+            st.session_state['est_client_q'] = ""
+            st.session_state['est_sel'] = doc_id
+        elif kind == "item":
+            try: st.session_state['inv_manage_sel'] = next(i['item_name'] for i in get_inventory().data if i['id'] == doc_id)
+            except Exception: pass
+    return tab_label, (kind, doc_id)
+
+search_tab, search_focus = apply_deep_link()
+
+with st.popover("🔎 Search", use_container_width=False):
+    gs_q = st.text_input("Search", key="global_search_q", placeholder="Clients, estimate items, inventory, suppliers, staff...", label_visibility="collapsed")
+    if gs_q:
+        try:
+            cl_rows = get_clients().data or []
+            staff_res = get_staff()
+            gs_idx = search.global_index(
+                clients=cl_rows,
+                inventory=(get_inventory().data or []),
+                suppliers=(get_suppliers().data or []),
+                staff=(staff_res.data if staff_res and staff_res.data else []),
+                parsed_estimates=estimates.parse_clients(cl_rows, get_item_maps()[0]),
+            )
+            hits = gs_idx.search(gs_q, limit=10)
+        except Exception as e:
+            hits = []
+            st.error(f"Search Error: {e}")
+        for h in hits:
+            icon = SEARCH_KINDS[h['kind']][0]
+            st.button(f"{icon} {h['title']}" + (f" · {h['subtitle']}" if h['subtitle'] else ""), key=f"gs_{h['kind']}_{h['id']}", on_click=open_search_hit, args=(h['kind'], h['id']), use_container_width=True)
+        if not hits: st.caption("No matches.")
 
 # Define Tabs
-tab1, tab2, tab3, tab_inv, tab5, tab8, tab6, tab4 = st.tabs(["📋 Dashboard", "➕ New Client", "🧮 Estimator", "📦 Inventory", "🚚 Suppliers", "👥 Staff", "📈 P&L", "⚙️ Settings"])
+tab1, tab2, tab3, tab_inv, tab5, tab8, tab6, tab4 = st.tabs(TAB_LABELS, default=search_tab)
 
 # --- TAB 1: DASHBOARD ---
 with tab1:
+    from streamlit_js_eval import get_geolocation
     st.subheader("📋 Project Dashboard")
     
     # Dashboard Metrics
     try:
-        cl_data = get_clients().data
-        if cl_data:
-            df_dash = pd.DataFrame(cl_data)
-            total_clients = len(df_dash)
-            active_clients = len(df_dash[df_dash['status'].isin(helpers.ACTIVE_STATUSES)])
+        summary = get_dashboard_summary()
+        status_counts = summary.get('status_counts', {}) if summary else {}
+        total_clients = sum(status_counts.values())
+        if total_clients:
+            active_clients = sum(status_counts.get(sname, 0) for sname in helpers.ACTIVE_STATUSES)
             
             d1, d2, d3 = st.columns(3)
             d1.metric("Total Clients", total_clients)
             d2.metric("Active Projects", active_clients)
-            d3.metric("Completion Rate", f"{(len(df_dash[df_dash['status']=='Closed'])/total_clients*100):.1f}%" if total_clients > 0 else "0%")
+            d3.metric("Completion Rate", f"{(status_counts.get('Closed', 0)/total_clients*100):.1f}%")
             
             st.divider()
             
@@ -269,33 +627,32 @@ with tab1:
             c_act, c_top = st.columns(2)
             with c_act:
                 st.markdown("#### 🕒 Recent Activity")
-                if 'created_at' in df_dash.columns:
-                    rec_df = df_dash.sort_values('created_at', ascending=False).head(5)
-                    for _, r in rec_df.iterrows():
-                        st.text(f"{r['created_at'][:10]} - {r['name']} ({r['status']})")
+                if summary.get('recent'):
+                    for r in summary['recent']:
+                        st.text(f"{str(r['created_at'])[:10]} - {r['name']} ({r['status']})")
                 else: st.info("No activity data.")
             
             with c_top:
                 st.markdown("#### 🏆 Top Clients (Value)")
-                if 'internal_estimate' in df_dash.columns:
-                    def get_val(x):
-                        try: return float(x.get('total', 0)) if x else 0
-                        except: return 0
-                    
-                    df_dash['est_val'] = df_dash['internal_estimate'].apply(get_val)
-                    top_df = df_dash.sort_values('est_val', ascending=False).head(5)
-                    st.dataframe(top_df[['name', 'est_val']], column_config={"name": "Client", "est_val": st.column_config.NumberColumn("Est. Value", format="₹%.2f")}, hide_index=True, use_container_width=True)
+                if summary.get('top_value'):
+                    top_df = pd.DataFrame(summary['top_value'])
+                    st.dataframe(top_df[['name', 'est_grand_total']], column_config={"name": "Client", "est_grand_total": st.column_config.NumberColumn("Est. Value", format="₹%.2f")}, hide_index=True, use_container_width=True)
                 else: st.info("No value data.")
             
             st.markdown("---") # Use a thinner separator or just margin
     except: pass
 
     st.markdown("### 📂 Client Projects")
-    status_filter = st.radio("Filter", ["Active", "All", "Closed"], horizontal=True, label_visibility="collapsed")
+    status_filter = st.radio("Filter", ["Active", "All", "Closed"], horizontal=True, label_visibility="collapsed", key="dash_filter")
+    if st.button(f"📦 Export {status_filter} Estimates (PDF zip)", key="dash_export_pdfs"):
+        jobs.submit("export_pdfs", {"status_filter": status_filter}, user=st.session_state.username, title=f"Export estimate PDFs: {status_filter}")
+        st.rerun()
     
     try:
         all_clients_resp = get_clients()
         if all_clients_resp and all_clients_resp.data:
+            item_names, item_ids = get_item_maps()
+            parsed_estimates = estimates.parse_clients(all_clients_resp.data, item_names)
             df = pd.DataFrame(all_clients_resp.data)
             if status_filter == "Active":
                 df = df[~df['status'].isin(["Closed", "Work Done"])]
@@ -304,7 +661,7 @@ with tab1:
             
             if not df.empty:
                 for idx, client in df.iterrows():
-                    with st.expander(f"{client['name']} - {client['status']}"):
+                    with st.expander(f"{client['name']} - {client['status']}", expanded=(search_focus == ("client", client['id']))):
                         st.markdown("### 🛠️ Manage Client")
                         c1, c2 = st.columns([1.5, 1])
                         with c1:
@@ -319,6 +676,7 @@ with tab1:
                             # Check if we have a pending update from the button
                             if loc_update_key in st.session_state:
                                 current_loc_val = st.session_state[loc_update_key]
+                                session_buffers.track(st.session_state, client['id'], loc_update_key)
 
                             if loc_edit:
                                 if st.button("📍 Use Current Location", key=f"paste_loc_{client['id']}"):
@@ -346,7 +704,7 @@ with tab1:
                                             # Clear the temp session state if it exists
                                             if loc_update_key in st.session_state:
                                                 del st.session_state[loc_update_key]
-                                            get_clients.clear()
+                                            clear_client_caches()
                                             st.rerun()
                                         except Exception as e:
                                             st.error(f"Error: {e}")
@@ -383,7 +741,7 @@ with tab1:
                                             id_to_name = {s['id']: s['name'] for s in staff_res.data}
                                             curr_assigned_names = [id_to_name.get(sid) for sid in curr_assigned if sid in id_to_name]
                                         
-                                        sel_staff_names = st.multiselect("Select Team", list(staff_opts.keys()), default=curr_assigned_names, key=f"staff_{client['id']}")
+                                        sel_staff_names = st.multiselect("Select Team", list(staff_opts.keys()), default=[n for n in curr_assigned_names if n in staff_opts], key=f"staff_{client['id']}")
                                         assigned_staff_ids = [staff_opts[n] for n in sel_staff_names]
                                 except: st.error("Could not load staff.")
 
@@ -391,106 +749,95 @@ with tab1:
                             if st.button(btn_text, key=f"btn_{client['id']}"):
                                 upd = {"status": n_stat}
                                 if s_date: upd["start_date"] = s_date.isoformat()
+                                busy, available = [], []
                                 
                                 if show_staff_assign:
                                     upd["assigned_staff"] = assigned_staff_ids
-                                    try:
-                                        if assigned_staff_ids:
-                                            supabase.table("staff").update({"status": "Busy"}).in_("id", assigned_staff_ids).execute()
-                                        
-                                        prev_assigned = client.get('assigned_staff', [])
-                                        removed = [pid for pid in prev_assigned if pid not in assigned_staff_ids]
-                                        if removed:
-                                            supabase.table("staff").update({"status": "Available"}).in_("id", removed).execute()
-                                    except Exception as e: print(e)
+                                    busy = assigned_staff_ids
+                                    prev_assigned = client.get('assigned_staff') or []
+                                    available = [pid for pid in prev_assigned if pid not in assigned_staff_ids]
 
                                 elif n_stat == "Work Done":
-                                    curr_assigned = client.get('assigned_staff', [])
+                                    curr_assigned = client.get('assigned_staff') or []
                                     if curr_assigned:
-                                        try:
-                                            supabase.table("staff").update({"status": "Available"}).in_("id", curr_assigned).execute()
-                                            upd["assigned_staff"] = []
-                                        except: pass
+                                        available = list(curr_assigned)
+                                        upd["assigned_staff"] = []
 
                                 try:
-                                    supabase.table("clients").update(upd).eq("id", client['id']).execute()
+                                    staff_res = get_staff() if busy else None
+                                    wages = {s['id']: s.get('salary') for s in (staff_res.data if staff_res and staff_res.data else []) if s['id'] in busy}
+                                    write_queue.enqueue("client_status", {"client_id": int(client['id']), "values": upd, "expected": client_version(client), "busy": busy, "available": available,
+                                                                          "wages": wages, "on": datetime.now().date().isoformat(), "month": rollups.month_of(client.get('created_at'))},
+                                                        entity=f"clients:{client['id']}", label=f"{client['name']}: status {n_stat}", user=st.session_state.username)
+                                    patch_client_views(int(client['id']), upd)
                                     st.success("Updated!")
-                                    get_clients.clear()
-                                    get_staff.clear()
                                     st.rerun()
                                 except Exception as e:
                                     st.error(f"Error: {e}")
 
-                            # Payment Section
-                            if client.get('status') == "Closed":
+                            # Payment Section (ledger: advances, installments, final settlement)
+                            if client.get('status') != "New Lead":
                                 st.divider()
-                                st.write("💰 **Record Payment Received**")
-                                est_data = client.get('internal_estimate', {})
-                                est_advance = 0
-                                if est_data:
-                                    try:
-                                        gs = get_settings()
-                                        am_normalized = helpers.normalize_margins(est_data.get('margins'), gs)
-                                        calc_results = helpers.calculate_estimate_details(
-                                            edf_items_list=est_data.get('items', []),
-                                            days=est_data.get('days', 1.0),
-                                            margins=am_normalized,
-                                            global_settings=gs
-                                        )
-                                        est_advance = calc_results["rounded_grand_total"]
-                                    except: pass
+                                st.write("💰 **Payments**")
+                                est_total = 0.0
+                                try:
+                                    est_totals = helpers.get_estimate_totals(client, get_settings(), est=parsed_estimates.get(client['id']))
+                                    if est_totals: est_total = est_totals["est_grand_total"]
+                                except: pass
                                 
-                                curr_pay = client.get('final_settlement_amount', 0.0)
-                                val_to_show = float(curr_pay) if curr_pay else float(est_advance)
-                                if pd.isna(val_to_show) or val_to_show == 0:
-                                    val_to_show = int(est_advance) if not pd.isna(est_advance) else 0
-                                else:
-                                    val_to_show = int(math.ceil(val_to_show / 100) * 100)
+                                paid_so_far = payments.paid_amount(client)
+                                balance_due = est_total - paid_so_far
+                                pm1, pm2, pm3 = st.columns(3)
+                                pm1.metric("Estimated Grand Total", f"₹{est_total:,.0f}")
+                                pm2.metric("Received", f"₹{paid_so_far:,.0f}")
+                                pm3.metric("Balance Due", f"₹{balance_due:,.0f}")
                                 
-                                payment_col1, payment_col2 = st.columns(2)
-                                with payment_col1:
-                                    st.metric("Estimated Grand Total", f"₹{est_advance:,.0f}")
-                                with payment_col2:
-                                    new_pay_key = f"pay_{client['id']}"
-                                    if new_pay_key not in st.session_state or (st.session_state[new_pay_key] == 0 and val_to_show > 0):
-                                        st.session_state[new_pay_key] = val_to_show
-                                    
-                                    new_pay = st.number_input("Final Amount Received (₹)", min_value=0, value=val_to_show, step=100, key=new_pay_key)
+                                payment_col1, payment_col2, payment_col3 = st.columns(3)
+                                new_pay = payment_col1.number_input("Amount Received (₹)", min_value=0, value=int(math.ceil(max(balance_due, 0) / 100) * 100), step=100, key=f"pay_{client['id']}")
+                                pay_date = payment_col2.date_input("Date", value=datetime.now().date(), key=f"pay_date_{client['id']}")
+                                pay_method = payment_col3.selectbox("Method", ["Cash", "UPI", "Bank Transfer", "Cheque"], key=f"pay_method_{client['id']}")
+                                pay_note = st.text_input("Note", key=f"pay_note_{client['id']}", placeholder="e.g. Advance, 2nd installment")
                                 
-                                if st.button("Save Final Payment", key=f"save_pay_{client['id']}"):
-                                    new_pay_rounded = int(math.ceil(new_pay / 100) * 100)
-                                    supabase.table("clients").update({"final_settlement_amount": new_pay_rounded}).eq("id", client['id']).execute()
-                                    st.toast("Payment Saved Successfully!", icon="✅")
-                                    time.sleep(1.0)
-                                    get_clients.clear()
-                                    st.rerun()
+                                if st.button("Record Payment", key=f"save_pay_{client['id']}"):
+                                    if new_pay > 0:
+                                        try:
+                                            write_queue.enqueue("payment", {"client_id": int(client['id']), "amount": new_pay, "paid_on": pay_date.isoformat(), "method": pay_method, "note": pay_note or None,
+                                                                            "username": st.session_state.username, "month": rollups.month_of(client.get('created_at'))},
+                                                                entity=f"clients:{client['id']}", label=f"{client['name']}: payment ₹{new_pay:,.0f}", user=st.session_state.username)
+                                            patch_client_views(int(client['id']), {"amount_paid": paid_so_far + new_pay})
+                                            st.toast("Payment Saved Successfully!", icon="✅")
+                                            st.session_state.pop(f"pay_{client['id']}", None)
+                                            st.rerun()
+                                        except Exception as e: st.error(f"Error: {e}")
+                                    else: st.warning("Enter an amount greater than zero.")
+                                
+                                if st.toggle("Show payment history", key=f"pay_hist_{client['id']}"):
+                                    try: ledger = payments.get_payments(supabase, client['id'])
+                                    except Exception as e:
+                                        ledger = []
+                                        st.caption(f"History unavailable: {e}")
+                                    if ledger:
+                                        st.dataframe(pd.DataFrame([{"Date": p.get('paid_on'), "Amount": float(p.get('amount') or 0), "Method": p.get('method') or '', "Note": p.get('note') or '', "By": p.get('created_by') or ''} for p in ledger]), column_config={"Amount": st.column_config.NumberColumn(format="₹%.0f")}, hide_index=True, use_container_width=True)
+                                    else: st.info("No payments recorded yet.")
 
                         st.expander("Danger Zone").button("Delete Client", type="secondary", use_container_width=True, on_click=lambda id=client['id']: (
                             supabase.table("clients").delete().eq("id", id).execute()
                         ), key=f"del_{client['id']}")
                         
                         if st.session_state.get(f"del_{client['id']}"):
-                             get_clients.clear()
+                             refresh_pl_rollups(month=rollups.month_of(client.get('created_at')))
+                             clear_client_caches()
                              st.rerun()
 
                         # Manage Estimate Section
-                        if client.get('internal_estimate'):
+                        est_model = parsed_estimates.get(client['id'])
+                        if est_model is not None:
                             st.divider()
                             st.subheader("📋 Manage Estimate")
-                            est_data = client['internal_estimate']
-                            s_items_raw = est_data.get('items', [])
-                            s_days = float(est_data.get('days', 1.0))
-                            
-                            s_items_sanitized = []
-                            for item in s_items_raw:
-                                sanitized_item = item.copy()
-                                sanitized_item['Qty'] = float(sanitized_item.get('Qty', 0))
-                                sanitized_item['Base Rate'] = float(sanitized_item.get('Base Rate', 0))
-                                s_items_sanitized.append(sanitized_item)
+                            s_days = est_model.days
                             
                             ssk_dash = f"dash_est_{client['id']}"
-                            if ssk_dash not in st.session_state:
-                                st.session_state[ssk_dash] = s_items_sanitized
+                            session_buffers.ensure(st.session_state, client['id'], ssk_dash, est_model.item_records())
 
                             if st.session_state[ssk_dash]:
                                 idf = helpers.create_item_dataframe(st.session_state[ssk_dash])
@@ -507,7 +854,7 @@ with tab1:
                                                             })
                                 
                                 gs = get_settings()
-                                am_normalized = helpers.normalize_margins(est_data.get('margins'), gs)
+                                am_normalized = est_model.effective_margins(gs)
                                 
                                 calculated_results = helpers.calculate_estimate_details(
                                     edf_items_list=edited_est.to_dict(orient="records"),
@@ -531,9 +878,45 @@ with tab1:
                                     for col in ['Qty', 'Base Rate', 'Total Price', "Unit Price"]:
                                         df_to_save[col] = pd.to_numeric(df_to_save[col].fillna(0))
                                     for col in ['Item', 'Unit']: df_to_save[col] = df_to_save[col].fillna("")
-                                    
-                                    st.dataframe(df_profit[['Item', 'Qty', 'Unit', 'Base Rate', 'Total Sell Price', 'Row Profit']], use_container_width=True, hide_index=True)
-                                    st.metric("Net Profit (from Grand Total)", f"₹{total_profit:,.0f}")
+                                    sobj = estimates.serialize_estimate(estimates.Estimate.from_records(df_to_save.to_dict(orient="records"), s_days, est_model.margins), item_ids)
+                                    try:
+                                        est_values = {"internal_estimate": sobj, **helpers.estimate_totals(calculated_results)}
+                                        write_queue.enqueue("estimate", {"client_id": int(client['id']), "values": est_values, "expected": client_version(client), "previous": estimates.serialize_estimate(est_model, item_ids),
+                                                                         "username": st.session_state.username, "month": rollups.month_of(client.get('created_at')) if client.get('status') in helpers.INACTIVE_STATUSES else None},
+                                                            entity=f"clients:{client['id']}", label=f"{client['name']}: estimate", user=st.session_state.username)
+                                        patch_client_views(int(client['id']), est_values)
+                                        st.toast("Saved!", icon="✅")
+                                        del st.session_state[ssk_dash]
+                                        st.rerun()
+                                    except Exception as e:
+                                        st.error(f"Database Error: {e}")
+
+                                if client.get('status') in helpers.INACTIVE_STATUSES:
+                                    # Internal profit with actual labor: wages of the staff assigned to this project (utils/labor.py)
+                                    st.write("**📊 Internal Profit Analysis**")
+                                    try:
+                                        asg_resp, staff_resp = get_staff_assignments(), get_staff()
+                                        labor_costs = labor.compute(asg_resp.data if asg_resp else [], staff_resp.data if staff_resp else [])
+                                    except Exception as e:
+                                        print(f"Labor costing unavailable: {e}")
+                                        labor_costs = labor.compute([], [])
+                                    actual_labor = labor_costs.project_cost(client['id'])
+                                    labor_cost = calculated_results["labor_actual_cost"] if actual_labor is None else actual_labor
+                                    real_profit = total_profit + calculated_results["labor_actual_cost"] - labor_cost
+                                    breakdown = labor_costs.project_breakdown(client['id'])
+                                    ip1, ip2, ip3 = st.columns(3)
+                                    ip1.metric("Labor Cost (Actual)" if actual_labor is not None else "Labor Cost (Est)", f"₹{labor_cost:,.0f}",
+                                               delta=f"Est: ₹{calculated_results['labor_actual_cost']:,.0f}", delta_color="off")
+                                    ip2.metric("Net Profit", f"₹{real_profit:,.0f}", delta=f"₹{real_profit - total_profit:,.0f} vs estimate")
+                                    ip3.download_button("📊 Internal Profit Report", key=f"int_pdf_{client['id']}", use_container_width=True,
+                                                        data=lambda args=(client['name'], edited_est_with_prices.to_dict(orient="records"), s_days, labor_cost, labor_charged_display, rounded_grand_total, real_profit), rows=breakdown:
+                                                            helpers.create_internal_pdf(*args, labor_breakdown=rows),
+                                                        file_name=f"Internal_{sanitize_filename(client['name'])}.pdf", mime="application/pdf")
+                                    if breakdown:
+                                        st.dataframe(pd.DataFrame(breakdown, columns=["Staff", "Days", "Cost"]), column_config={"Cost": st.column_config.NumberColumn(format="₹%.0f")},
+                                                     hide_index=True, use_container_width=True)
+                                    else:
+                                        st.caption("No staff assignments recorded for this project; labor is costed from the estimate.")
                                 else:
                                     st.info("Mark status as 'Work Done' or 'Closed' to view Internal Profit Analysis.")
                             else:
@@ -547,6 +930,7 @@ with tab1:
 
 # --- TAB 2: NEW CLIENT ---
 with tab2:
+    from streamlit_js_eval import get_geolocation
     st.subheader("Add New Client")
     loc_new_client = get_geolocation(component_key="geo_tab2_new_client")
     gmaps_new_client = ""
@@ -581,7 +965,7 @@ with tab2:
                     res = supabase.table("clients").insert({"name": nm, "phone": ph, "address": ad, "location": ml_new_client, "status": "New Lead", "created_at": datetime.now().isoformat()}).execute()
                     if res and res.data: 
                         st.success(f"Client {nm} Added!")
-                        get_clients.clear()
+                        clear_client_caches()
                         st.rerun()
                     else: st.error("Save Failed.")
                 except Exception as e:
@@ -590,23 +974,37 @@ with tab2:
 # --- TAB 3: ESTIMATOR ---
 with tab3:
     st.subheader("Estimator Engine")
-    with st.spinner("Loading Estimator..."):
-        try:
-            ac = supabase.table("clients").select("id, name, internal_estimate").neq("status", "Closed").execute()
-        except Exception as e:
-            st.error(f"Database Error: {e}")
-            ac = None
-    cd = {c['name']: c for c in ac.data} if ac and ac.data else {}
-    tn = st.selectbox("Select Client", list(cd.keys()), key="est_sel")
-    
-    if tn:
-        tc = cd[tn]
-        se, li = tc.get('internal_estimate'), []
-        if se: li = se.get('items', [])
-        sm = se.get('margins') if se else None
-        sd = se.get('days', 1.0) if se else 1.0
+    try:
+        picker_rows = get_client_index().data or []
+    except Exception as e:
+        st.error(f"Database Error: {e}")
+        picker_rows = []
+    pc1, pc2 = st.columns([1, 2])
+    est_q = pc1.text_input("🔍 Search Client", key="est_client_q", placeholder="Type a name...")
+    picker_matches = search.filter_rows(picker_rows, est_q)
+    picker_label = search.picker_labels(picker_rows)
+    sel_client_id = pc2.selectbox("Select Client", [r['id'] for r in picker_matches], format_func=lambda cid: picker_label.get(cid, str(cid)), key="est_sel")
+
+    tc = None
+    if sel_client_id is not None:
+        with st.spinner("Loading Estimate..."):
+            try: tc = get_client_estimate(sel_client_id)
+            except Exception as e: st.error(f"Database Error: {e}")
+
+    if tc:
+        item_names, item_ids = get_item_maps()
+        try: se = estimates.parse_estimate(tc.get('internal_estimate'), item_names)
+        except ValueError: se = None
+        li = se.item_records() if se else []
+        sm = se.margins if se else None
+        sd = se.days if se else 1.0
         ssk = f"est_{tc['id']}"
-        if ssk not in st.session_state: st.session_state[ssk] = li
+        session_buffers.ensure(st.session_state, tc['id'], ssk, li)
+
+        # Margins and days applied from the Target Price Solver (until the estimate is saved)
+        solved = st.session_state.get(f"est_target_{tc['id']}")
+        if solved:
+            sm, sd = estimates.parse_margins(solved['m']), solved['days']
 
         st.divider(); gs = get_settings()
         col1, col2 = st.columns([1, 3])
@@ -616,7 +1014,8 @@ with tab3:
             dys = st.number_input("⏳ Days", min_value=1, step=1, value=int(sd))
         am = gs
         if uc:
-            dp, dl, de = (int(sm['p']), int(sm['l']), int(sm['e'])) if sm else (int(gs['part_margin']), int(gs['labor_margin']), int(gs['extra_margin']))
+            dm = sm if sm else estimates.default_margins(gs)
+            dp, dl, de = int(dm.part), int(dm.labor), int(dm.extra)
             mc1, mc2, mc3 = st.columns(3)
             cp, cl, ce = mc1.slider("Part %", 0, 100, dp, key="cp"), mc2.slider("Labor %", 0, 100, dl, key="cl"), mc3.slider("Extra %", 0, 100, de, key="ce")
             am = {'part_margin': cp, 'labor_margin': cl, 'extra_margin': ce}
@@ -635,12 +1034,16 @@ with tab3:
             
         inv = inv_all_items_response
         if inv and inv.data:
-            imap = {i['item_name']: i for i in inv.data}
+            item_idx = search.item_index(inv.data)
             
             # --- FIX: Move Item Selection OUTSIDE form for dynamic updates ---
-            inam = st.selectbox("Select Item to Add", list(imap.keys()), key="est_item_selector")
+            ic1, ic2 = st.columns([1, 2])
+            item_q = ic1.text_input("🔍 Search Items", key="est_item_q", placeholder="Name, word or part of it...")
+            item_hits = item_idx.search(item_q, limit=50)
+            inam_id = ic2.selectbox("Select Item to Add", [i['id'] for i in item_hits], format_func=lambda iid: item_idx.rows[iid]['item_name'], key="est_item_selector")
             
-            selected_item_data = imap.get(inam, {})
+            selected_item_data = item_idx.rows.get(inam_id, {})
+            inam = selected_item_data.get('item_name')
             db_unit = selected_item_data.get('unit', 'pcs')
             
             # Dynamic Unit Logic
@@ -666,7 +1069,8 @@ with tab3:
                 
                 # Add Button (aligned with inputs)
                 # Using a container to push button down to align with inputs if needed, or just standard
-                if c3.form_submit_button("⬇️ Add Item"):
+                if c3.form_submit_button("⬇️ Add Item") and inam:
+                    item_idx.record_use(inam_id)
                     st.session_state[ssk].append({
                         "Item": inam, 
                         "Qty": iqty, 
@@ -675,6 +1079,24 @@ with tab3:
                     })
                     st.rerun()
 
+            # Kits add all their lines in one step (expansion cached per kit, see utils/kits.py)
+            kit_resp = get_kits()
+            kits_by_id = kits.kit_map(kit_resp.data if kit_resp else [])
+            if kits_by_id:
+                kc1, kc2, kc3 = st.columns([2, 1, 1])
+                kit_id = kc1.selectbox("Select Kit to Add", list(kits_by_id), format_func=lambda k: kits_by_id[k]['name'], key="est_kit_selector")
+                kit_mult = kc2.number_input("Kits", min_value=1.0, step=1.0, key="est_kit_mult")
+                try:
+                    kit_exp = kits.expand(kit_id, kits_by_id, item_idx.rows, get_settings())
+                    kc1.caption(f"{len(kit_exp['records'])} lines, material ₹{kit_exp['material_sell'] * kit_mult:,.0f} at default margins"
+                                + (f" ({len(kit_exp['missing'])} item(s) no longer in inventory)" if kit_exp['missing'] else ""))
+                except ValueError as e:
+                    kit_exp = None
+                    kc1.error(str(e))
+                if kc3.button("🧰 Add Kit", key="est_kit_add", disabled=not kit_exp, use_container_width=True):
+                    st.session_state[ssk].extend(kits.scaled_records(kit_exp, kit_mult))
+                    st.rerun()
+
         if st.session_state[ssk]:
             df = helpers.create_item_dataframe(st.session_state[ssk])
             df.insert(0, 'Sr No', range(1, len(df) + 1))
@@ -757,17 +1179,88 @@ with tab3:
                 for col in ['Qty', 'Base Rate', 'Total Price', "Unit Price"]:
                     df_to_save[col] = pd.to_numeric(df_to_save[col].fillna(0))
                 for col in ['Item', 'Unit']: df_to_save[col] = df_to_save[col].fillna("")
-                cit = df_to_save.to_dict(orient="records")
-                sobj = {"items": cit, "days": dys, "margins": am if uc else None}
+                sobj = estimates.serialize_estimate(estimates.Estimate.from_records(df_to_save.to_dict(orient="records"), dys, am if uc else None), item_ids)
                 try:
-                    res = supabase.table("clients").update({"internal_estimate": sobj}).eq("id", tc['id']).execute()
-                    if res and res.data: st.toast("Saved!", icon="✅")
+                    est_values = {"internal_estimate": sobj, **helpers.estimate_totals(calculated_results)}
+                    write_queue.enqueue("estimate", {"client_id": tc['id'], "values": est_values, "expected": client_version(tc), "previous": estimates.serialize_estimate(se, item_ids) if se else None,
+                                                     "username": st.session_state.username, "refresh_client": True},
+                                        entity=f"clients:{tc['id']}", label=f"{tc['name']}: estimate", user=st.session_state.username)
+                    patch_client_views(tc['id'], est_values)
+                    session_buffers.mark_clean(st.session_state, tc['id'], ssk)
+                    st.session_state.pop(f"est_target_{tc['id']}", None)
+                    st.toast("Saved!", icon="✅")
                 except Exception as e:
                     st.error(f"Database Error: {e}")
             
-            pbytes = create_pdf(tc['name'], edf.to_dict(orient="records"), dys, disp_lt, rounded_gt, advance_amount, is_final=False)
+            pbytes = helpers.create_pdf(tc['name'], edf.to_dict(orient="records"), dys, disp_lt, rounded_gt, advance_amount, is_final=False)
             sanitized_est_name = sanitize_filename(tc['name'])
             cp.download_button("📄 Download PDF", pbytes, f"Est_{sanitized_est_name}.pdf", "application/pdf", key=f"pe_{tc['id']}")
+
+            with st.expander("🧰 Save Items as Kit"):
+                kit_name = st.text_input("Kit Name", key="est_kit_name", placeholder="e.g. Home Automation - 2BHK")
+                if st.button("💾 Save Kit", key="est_kit_save") and kit_name.strip():
+                    kit_lines, kit_skipped = kits.lines_from_records(edf.to_dict(orient="records"), item_ids)
+                    try:
+                        supabase.table("kits").insert({"name": kit_name.strip(), "lines": kit_lines}).execute()
+                        get_kits.clear()
+                        st.toast(f"Kit saved with {len(kit_lines)} lines!", icon="🧰")
+                        if kit_skipped: st.warning("Not in inventory, left out of the kit: " + ", ".join(kit_skipped))
+                    except Exception as e:
+                        st.error(f"Database Error: {e}")
+
+            # Margins (and days) that land the quote on a target (see pricing.solve)
+            with st.expander("🎯 Target Price Solver"):
+                tg1, tg2, tg3 = st.columns(3)
+                tgt_on = tg1.radio("Target", ["Grand Total", "Profit"], horizontal=True, key="solver_on")
+                tgt_val = tg2.number_input("Target Amount (₹)", min_value=0.0, step=100.0, value=float(rounded_gt if tgt_on == "Grand Total" else round(total_profit)), key=f"solver_target_{tgt_on}")
+                tgt_adj = tg3.multiselect("Margins to Adjust", ["Part", "Labor", "Extra"], default=["Part", "Labor", "Extra"], key="solver_adjust")
+                tgt_days = st.slider("Labor Days to Try", 1, max(30, int(dys) * 2), (int(dys), int(dys)), key="solver_days")
+                if tgt_adj:
+                    tgt_sol = pricing.solve(pricing.material_base(estimates.Estimate.from_records(edf.to_dict(orient="records"), dys)), int(dys), helpers.normalize_margins(am, gs), gs,
+                                            tgt_val, on="total" if tgt_on == "Grand Total" else "profit", adjustable=[f"{a.lower()}_margin" for a in tgt_adj], days_range=tgt_days)
+                    for i, sol in enumerate(tgt_sol):
+                        sc1, sc2 = st.columns([4, 1])
+                        sc1.write(f"Part **{sol['part_margin']}%**, Labor **{sol['labor_margin']}%**, Extra **{sol['extra_margin']}%**, **{sol['days']}** day(s): "
+                                  f"total ₹{sol['rounded_grand_total']:,.0f}, profit ₹{sol['total_profit']:,.0f}, advance ₹{sol['advance_amount']:,.0f} ({sol['miss']:+,.0f} vs target)")
+                        if sc2.button("✅ Apply", key=f"solver_apply_{i}", use_container_width=True):
+                            st.session_state[f"est_target_{tc['id']}"] = {"m": {"p": sol['part_margin'], "l": sol['labor_margin'], "e": sol['extra_margin']}, "days": sol['days']}
+                            for k in ("cm", "cp", "cl", "ce"): st.session_state.pop(k, None)
+                            st.rerun()
+
+        # --- Revision History ---
+        with st.expander("🕘 Revision History"):
+            revs = get_estimate_revisions(tc['id'])
+            if revs is None:
+                revs = []
+                st.caption("History unavailable.")
+            if revs:
+                st.dataframe(pd.DataFrame([{"Rev": r['revision'], "Saved": (r.get('created_at') or '')[:16].replace('T', ' '), "By": r.get('created_by') or '', "Changes": r.get('summary') or ''} for r in revs]), hide_index=True, use_container_width=True)
+                rev_nums = [r['revision'] for r in revs]
+                h1, h2 = st.columns(2)
+                rev_a = h1.selectbox("Compare Revision", rev_nums, index=max(len(rev_nums) - 2, 0), key=f"rev_a_{tc['id']}")
+                rev_b = h2.selectbox("With Revision", rev_nums, index=len(rev_nums) - 1, key=f"rev_b_{tc['id']}")
+                est_a = estimates.parse_estimate(revisions.reconstruct(revs, rev_a), item_names)
+                est_b = estimates.parse_estimate(revisions.reconstruct(revs, rev_b), item_names)
+                rev_diff = revisions.diff_estimates(est_a, est_b)
+                if rev_diff: st.dataframe(pd.DataFrame(rev_diff), hide_index=True, use_container_width=True)
+                else: st.info("No differences.")
+
+                if st.button(f"↩️ Restore Revision {rev_a}", key=f"rev_restore_{tc['id']}"):
+                    sobj = estimates.serialize_estimate(est_a, item_ids)
+                    try:
+                        supabase.table("clients").update({"internal_estimate": sobj, **helpers.estimate_totals(est_a.calculate(gs))}).eq("id", tc['id']).execute()
+                        try: revisions.record_revision(supabase, tc['id'], estimates.serialize_estimate(se, item_ids) if se else None, sobj, st.session_state.username)
+                        except Exception as e: print(f"Revision not recorded: {e}")
+                        get_estimate_revisions.clear()
+                        refresh_pl_rollups(client_id=tc['id'])
+                        st.session_state.pop(ssk, None)
+                        clear_client_caches()
+                        st.toast(f"Restored revision {rev_a}!", icon="↩️")
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Database Error: {e}")
+            else:
+                st.info("No saved revisions yet.")
 # --- TAB 4: INVENTORY ---
 with tab_inv:
     st.subheader("📦 Inventory Management")
@@ -848,9 +1341,9 @@ with tab_inv:
                 hide_index=True
             )
             
-            with st.expander("🛠️ Manage Item"):
+            with st.expander("🛠️ Manage Item", expanded=(search_focus is not None and search_focus[0] == "item")):
                 item_list = {i['item_name']: i for i in inv_resp.data}
-                sel_item_name = st.selectbox("Select Item", list(item_list.keys()))
+                sel_item_name = st.selectbox("Select Item", list(item_list.keys()), key="inv_manage_sel")
                 if sel_item_name:
                     item = item_list[sel_item_name]
                     with st.form("edit_inv"):
@@ -877,6 +1370,61 @@ with tab_inv:
                         get_inventory.clear()
                         st.rerun()
 
+            # Kits: reusable item lists, possibly containing other kits (see utils/kits.py)
+            with st.expander("🧰 Manage Kits"):
+                kit_resp = get_kits()
+                if kit_resp is None:
+                    st.info("Kits table not found. Please update database schema.")
+                else:
+                    kits_by_id = kits.kit_map(kit_resp.data)
+                    items_by_id = {i['id']: i for i in inv_resp.data}
+                    kit_sel = st.selectbox("Select Kit", [None] + list(kits_by_id), format_func=lambda k: "➕ New Kit" if k is None else kits_by_id[k]['name'], key="kit_manage_sel")
+                    kit_row = kits_by_id.get(kit_sel, {})
+                    comp_ids = {i['item_name']: ("item_id", i['id']) for i in inv_resp.data}
+                    comp_ids.update({f"🧰 {k['name']}": ("kit_id", k['id']) for k in kits_by_id.values() if k['id'] != kit_sel})
+                    comp_names = {v: n for n, v in comp_ids.items()}
+                    kit_rows = [{"Component": comp_names.get(("kit_id", l['kit_id']) if l.get('kit_id') is not None else ("item_id", l.get('item_id'))), "Qty": l.get('qty'), "Unit": l.get('unit')}
+                                for l in kit_row.get('lines') or []]
+                    if kit_sel is not None:
+                        try:
+                            kx = kits.expand(kit_sel, kits_by_id, items_by_id, get_settings())
+                            st.caption(f"{len(kx['records'])} estimate lines, material cost ₹{kx['material_cost']:,.0f}, ₹{kx['material_sell']:,.0f} at default margins")
+                        except ValueError as e:
+                            st.error(str(e))
+                    kit_new_name = st.text_input("Kit Name", value=kit_row.get('name', ""), key=f"kit_name_{kit_sel}")
+                    kit_edit = st.data_editor(pd.DataFrame(kit_rows, columns=["Component", "Qty", "Unit"]), num_rows="dynamic", use_container_width=True, key=f"kit_lines_{kit_sel}",
+                                              column_config={
+                                                  "Component": st.column_config.SelectboxColumn("Item or Kit", options=list(comp_ids), width="large"),
+                                                  "Qty": st.column_config.NumberColumn("Qty", min_value=0.0, step=0.1),
+                                                  "Unit": st.column_config.SelectboxColumn("Unit", options=["pcs", "m", "ft", "cm", "in"], help="Empty uses the item's unit")
+                                              })
+                    kb1, kb2 = st.columns(2)
+                    if kb1.button("💾 Save Kit", key="kit_manage_save", type="primary") and kit_new_name.strip():
+                        new_lines = []
+                        for r in kit_edit.to_dict(orient="records"):
+                            if r.get('Component') in comp_ids and estimates.to_float(r.get('Qty')) > 0:
+                                kind, cid = comp_ids[r['Component']]
+                                new_lines.append({kind: cid, "qty": estimates.to_float(r['Qty'])} | ({"unit": r['Unit']} if kind == "item_id" and r.get('Unit') else {}))
+                        try:
+                            kits.check(kit_sel, new_lines, kits_by_id)
+                            if kit_sel is None: supabase.table("kits").insert({"name": kit_new_name.strip(), "lines": new_lines}).execute()
+                            else: supabase.table("kits").update({"name": kit_new_name.strip(), "lines": new_lines}).eq("id", kit_sel).execute()
+                            get_kits.clear()
+                            st.success("Kit saved!")
+                            st.rerun()
+                        except ValueError as e:
+                            st.error(str(e))
+                        except Exception as e:
+                            st.error(f"Database Error: {e}")
+                    if kit_sel is not None and kb2.button("🗑️ Delete Kit", key="kit_manage_del"):
+                        used_in = [k['name'] for k in kits_by_id.values() if any(l.get('kit_id') == kit_sel for l in k.get('lines') or [])]
+                        if used_in:
+                            st.error("This kit is part of: " + ", ".join(used_in))
+                        else:
+                            supabase.table("kits").delete().eq("id", kit_sel).execute()
+                            get_kits.clear()
+                            st.rerun()
+
     except Exception as e:
         st.error(f"Error loading inventory: {e}")
 
@@ -889,21 +1437,25 @@ with tab5:
         sup_data = get_suppliers().data
         if sup_data:
             total_suppliers = len(sup_data)
-            sp_res = supabase.table("supplier_purchases").select("supplier_id, cost").execute()
-            
             total_spend = 0
             top_sup_data = []
             
-            if sp_res.data:
-                sp_df = pd.DataFrame(sp_res.data)
-                sp_df['cost'] = sp_df['cost'].astype(float)
-                total_spend = sp_df['cost'].sum()
-                
-                # Top Suppliers
-                sup_map = {s['id']: s['name'] for s in sup_data}
-                sp_df['supplier_name'] = sp_df['supplier_id'].map(sup_map)
-                top_sup = sp_df.groupby('supplier_name')['cost'].sum().sort_values(ascending=False).head(5).reset_index()
+            analytics_store = analytics.get_store()
+            if analytics_store is not None and analytics_store.refresh_in_background(supabase):
+                total_spend, top_sup = analytics_store.supplier_spend(top_n=5)
                 top_sup_data = top_sup.to_dict('records')
+            else:
+                sp_rows = get_purchase_costs()
+                if sp_rows:
+                    sp_df = pd.DataFrame(sp_rows)
+                    sp_df['cost'] = sp_df['cost'].astype(float)
+                    total_spend = sp_df['cost'].sum()
+                
+                    # Top Suppliers
+                    sup_map = {s['id']: s['name'] for s in sup_data}
+                    sp_df['supplier_name'] = sp_df['supplier_id'].map(sup_map)
+                    top_sup = sp_df.groupby('supplier_name')['cost'].sum().sort_values(ascending=False).head(5).reset_index()
+                    top_sup_data = top_sup.to_dict('records')
 
             sm1, sm2 = st.columns(2)
             sm1.metric("Total Suppliers", total_suppliers)
@@ -953,6 +1505,8 @@ with tab5:
                         
                         if to_insert:
                             supabase.table("supplier_purchases").insert(to_insert).execute()
+                            refresh_pl_rollups(month=rollups.month_of(datetime.now()))
+                            get_purchase_costs.clear()
                             st.success("Orders Placed Successfully!")
                             del st.session_state['restock_queue']
                             st.rerun()
@@ -987,13 +1541,18 @@ with tab5:
             
         if sup_resp and sup_resp.data and inv_resp and inv_resp.data:
             s_map = {s['name']: s['id'] for s in sup_resp.data}
-            i_map = {i['item_name']: i for i in inv_resp.data}
+            item_idx = search.item_index(inv_resp.data)
             
             c1, c2 = st.columns(2)
             s_name = c1.selectbox("Supplier", list(s_map.keys()), key="sup_sel_rec")
-            i_name = c2.selectbox("Item", list(i_map.keys()), key="item_sel_rec")
+            rec_q = c2.text_input("🔍 Search Items", key="item_q_rec", placeholder="Name, word or part of it...")
+            rec_hits = item_idx.search(rec_q, limit=50)
+            if not rec_hits:
+                c2.caption("No matching items, showing recent items.")
+                rec_hits = item_idx.search("", limit=50)
+            i_id = c2.selectbox("Item", [i['id'] for i in rec_hits], format_func=lambda iid: item_idx.rows[iid]['item_name'], key="item_sel_rec")
             
-            current_item = i_map[i_name]
+            current_item = item_idx.rows[i_id]
             unit = current_item.get('unit', 'pcs')
             
             with st.form("rec_pur"):
@@ -1027,7 +1586,7 @@ with tab5:
                 if st.form_submit_button("✅ Record Purchase"):
                     try:
                         # Update Inventory Stock & Base Rate
-                        curr_item = i_map[i_name]
+                        curr_item = current_item
                         new_stock = float(curr_item.get('stock_quantity', 0)) + qty
                         
                         update_data = {"stock_quantity": new_stock}
@@ -1035,6 +1594,7 @@ with tab5:
                             update_data["base_rate"] = rate
                         
                         supabase.table("inventory").update(update_data).eq("id", curr_item['id']).execute()
+                        item_idx.record_use(curr_item['id'])
                         
                         # Log Purchase (Optional - if you had a purchases table)
                         # supabase.table("purchases").insert({...}).execute()
@@ -1053,7 +1613,7 @@ with tab5:
     st.markdown("### 📒 Supplier Directory")
     if sup_resp and sup_resp.data:
         for sup in sup_resp.data:
-            with st.expander(f"{sup['name']} ({sup.get('contact_person', '')})"):
+            with st.expander(f"{sup['name']} ({sup.get('contact_person', '')})", expanded=(search_focus == ("supplier", sup['id']))):
                 st.write(f"**Phone:** {sup.get('phone', 'N/A')}")
                 
                 # --- Purchase History Section ---
@@ -1172,7 +1732,7 @@ with tab8:
                     st.markdown(f"""<div style="background: rgba(30, 41, 59, 0.4); border-radius: 12px; padding: 16px; margin-bottom: 8px; border: 1px solid rgba(255, 255, 255, 0.05); display: flex; justify_content: space-between; align-items: center;"><div><h4 style="margin: 0; color: #f8fafc;">{staff['name']}</h4><p style="margin: 4px 0 0 0; color: #94a3b8; font-size: 0.9rem;">{staff['role']}</p>{assignment_html}</div><div style="text-align: right;"><span style="background: {status_color}20; color: {status_color}; padding: 4px 12px; border-radius: 999px; font-size: 0.8rem; font-weight: 600; border: 1px solid {status_color}40;">&bull; {current_status}</span></div></div>""", unsafe_allow_html=True)
                     
                     # Manage Details Section
-                    with st.expander("⚙️ View & Manage Details"):
+                    with st.expander("⚙️ View & Manage Details", expanded=(search_focus == ("staff", staff['id']))):
                         # Status Control (Moved Here)
                         st.caption("Update Status")
                         status_opts = ["Available", "Busy", "On Leave"]
@@ -1183,10 +1743,10 @@ with tab8:
                         new_stat = st.selectbox("Status", status_opts, index=s_idx, key=f"stat_{staff['id']}", label_visibility="collapsed")
                         
                         if new_stat != staff['status']:
-                            supabase.table("staff").update({"status": new_stat}).eq("id", staff['id']).execute()
+                            write_queue.enqueue("row_update", {"table": "staff", "id": staff['id'], "values": {"status": new_stat}, "expected": {"status": staff['status']}},
+                                                entity=f"staff:{staff['id']}", label=f"{staff['name']}: {new_stat}", user=st.session_state.username)
+                            patch_cached_row(get_staff, staff['id'], {"status": new_stat})
                             st.toast(f"Status updated to {new_stat}!", icon="🔄")
-                            time.sleep(0.5)
-                            get_staff.clear()
                             st.rerun()
 
                         st.divider()
@@ -1230,131 +1790,95 @@ with tab8:
 
 # --- TAB 6: P&L ---
 with tab6:
+    from utils import charts  # plotly/altair
     st.subheader("📈 Profit & Loss Analysis")
     
-    if st.button("🔄 Refresh Data"):
-        get_clients.clear()
+    # Reporting queries run on the local analytics store when it is enabled
+    analytics_store = analytics.get_store()
+    rc1, rc2 = st.columns(2)
+    if rc1.button("🔄 Refresh Data"):
+        clear_client_caches()
+        if analytics_store is not None: analytics_store.refresh_in_background(supabase, force=True)
         st.rerun()
+    if rc2.button("🧮 Rebuild Monthly Rollups", help="Recomputes the stored monthly P&L from every client in the background"):
+        jobs.submit("rebuild_rollups", user=st.session_state.username)
+        st.rerun()
+        
+    use_store = analytics_store is not None and analytics_store.refresh_in_background(supabase)
+    # Estimate costs of rows without stored totals are only computed by rollups.project_table
+    try: store_costs = use_store and analytics_store.legacy_projects() == 0
+    except Exception: store_costs = False
         
     with st.spinner("Loading Financial Data..."):
         try:
-            cl_resp = get_clients()
-            # Fetch Supplier Purchases for Global Expense Calculation (New Source)
-            sp_resp = supabase.table("supplier_purchases").select("cost, purchase_date").execute()
-            # Keep legacy purchase_log just in case, or replace? Assuming replacement as per recent feature.
-            # purchase_log_resp = supabase.table("purchase_log").select("total_cost").execute() 
             settings = get_settings()
+            # Monthly rollups (pl_monthly); computed here from every client only until the table has been built
+            pl_months = get_pl_rollups()
+            if not pl_months and store_costs:
+                pl_months = analytics_store.monthly_rollups()
+            elif not pl_months:
+                cl_resp = get_clients()
+                if cl_resp and cl_resp.data:
+                    pl_months = sorted(rollups.compute_rollups(cl_resp.data, get_purchase_costs() or [], settings).values(), key=lambda r: r['month'])
+            # Per-project table and collected total: local store, else narrow paged selects (no estimate JSON)
+            pl_rows = None if store_costs else get_project_pl()
+            total_collected = analytics_store.total_collected() if use_store else get_total_collected()
         except Exception as e:
             st.error(f"Data Fetch Error: {e}")
-            cl_resp = None
-            sp_resp = None
+            pl_months, pl_rows, total_collected = [], [], 0.0
             settings = {}
 
-    if cl_resp and cl_resp.data:
-        df = pd.DataFrame(cl_resp.data)
-        # Filter for completed projects for Project-based P&L
-        closed_df = df[df['status'].isin(["Work Done", "Closed"])]
-        
+    if store_costs or pl_rows or pl_months or total_collected:
         # --- 1. GLOBAL CASH FLOW ANALYSIS (Main Branch Logic) ---
         # This tracks actual money in vs money out, regardless of project status
         
-        # Total Revenue (Collected)
-        # In Dev branch, we use 'final_settlement_amount' as the source of truth for collection
-        # In Main branch, it was 'amount_received'
-        # We will sum 'final_settlement_amount' for ALL clients (assuming partial payments aren't tracked separately yet)
-        # For accurate cash flow, we should sum payments from ALL clients, but currently payment is only recorded on Close.
-        # So we stick to Closed clients for Revenue to be safe, or if we want "Total Collected", we sum all non-null final_settlement_amounts.
-        
-        total_collected = df['final_settlement_amount'].fillna(0).sum()
+        # Total Revenue (Collected): running totals from the payments ledger (clients.amount_paid),
+        # including advances on open projects (loaded above)
         
+        # Outstanding receivables of delivered projects, read from the per-client balances
+        try:
+            bal_resp = get_client_balances()
+            recv = payments.receivables(bal_resp.data if bal_resp and bal_resp.data else [])
+        except Exception as e:
+            print(f"Balances unavailable: {e}")
+            recv = []
+        total_outstanding = sum(r["balance"] for r in recv)
+
+        # Company totals from the monthly rollups
         # Total Quoted Value (Sum of Estimates for Closed Projects)
-        total_quoted = 0.0
-        for idx, row in closed_df.iterrows():
-            est = row.get('internal_estimate')
-            if est:
-                 try:
-                    # Recalculate grand total to be sure
-                    am_normalized = helpers.normalize_margins(est.get('margins'), settings)
-                    calc = helpers.calculate_estimate_details(est.get('items', []), est.get('days', 1.0), am_normalized, settings)
-                    total_quoted += calc["rounded_grand_total"]
-                 except: pass
+        total_quoted = sum(float(m.get('quoted') or 0.0) for m in pl_months or [])
 
         # Total Expenses (Global)
         # Material Expense from Supplier Purchases
-        sp_data = sp_resp.data if sp_resp and sp_resp.data else []
-        total_material_expense_cash = sum(float(item.get('cost', 0.0)) for item in sp_data if item.get('cost'))
+        total_material_expense_cash = sum(float(m.get('purchases') or 0.0) for m in pl_months or [])
         
         # Labor Expense (Sum of labor cost from Closed projects)
         # We assume labor is paid when project is closed/done.
-        total_labor_expense_cash = 0.0
-        daily_labor_cost = float(settings.get('daily_labor_cost', 1000.0))
-        
-        for idx, row in closed_df.iterrows():
-            est = row.get('internal_estimate')
-            if est:
-                days = float(est.get('days', 0.0))
-                total_labor_expense_cash += (days * daily_labor_cost)
+        total_labor_expense_cash = sum(float(m.get('labor_cost') or 0.0) for m in pl_months or [])
                 
         total_expenses_cash = total_material_expense_cash + total_labor_expense_cash
         
         # Actual Cash Profit
         actual_cash_profit = total_collected - total_expenses_cash
         actual_margin_pct = (actual_cash_profit / total_collected * 100) if total_collected > 0 else 0
-        
-        # Discount Loss (Quoted vs Collected)
-        discount_loss = total_quoted - total_collected
 
         # --- 2. PROJECT-BASED PROFITABILITY (Dev Branch Logic) ---
         # This analyzes profitability per project based on ESTIMATED costs vs ACTUAL revenue
         
-        pl_data = []
-        total_est_cost_project = 0.0
-        total_est_profit_project = 0.0
-        
-        for idx, row in closed_df.iterrows():
-            est = row.get('internal_estimate')
-            actual_rev = float(row.get('final_settlement_amount') or 0.0)
-            
-            # Fallback if 0
-            if actual_rev == 0 and est:
-                try:
-                    am_normalized = helpers.normalize_margins(est.get('margins'), settings)
-                    calc = helpers.calculate_estimate_details(est.get('items', []), est.get('days', 1.0), am_normalized, settings)
-                    actual_rev = calc["rounded_grand_total"]
-                except: pass
-            
-            est_cost = 0.0
-            est_profit = 0.0
-            mat_cost = 0.0
-            labor_cost = 0.0
-            
-            if est:
-                try:
-                    am_normalized = helpers.normalize_margins(est.get('margins'), settings)
-                    calc = helpers.calculate_estimate_details(est.get('items', []), est.get('days', 1.0), am_normalized, settings)
-                    
-                    items = est.get('items', [])
-                    mat_cost = sum([float(i.get('Qty',0)) * float(i.get('Base Rate',0)) for i in items])
-                    labor_cost = calc["labor_actual_cost"]
-                    
-                    est_cost = mat_cost + labor_cost
-                    est_profit = actual_rev - est_cost
-                except: pass
-            
-            total_est_cost_project += est_cost
-            total_est_profit_project += est_profit
-            
-            pl_data.append({
-                "Client": row['name'],
-                "Revenue": actual_rev,
-                "Cost": est_cost,
-                "Profit": est_profit,
-                "Material Cost": mat_cost,
-                "Labor Cost": labor_cost,
-                "created_at": row.get('created_at')
-            })
-            
-        pl_df = pd.DataFrame(pl_data)
+        if store_costs:
+            pl_df = analytics_store.client_profitability()
+        else:
+            # Stored estimate totals per closed project (recomputed only for rows saved before the total columns existed)
+            pl_df = pd.DataFrame(pl_rows or [])
+        # Actual labor from staff assignments and wages (utils/labor.py) replaces the estimate where recorded
+        try:
+            asg_resp, staff_resp = get_staff_assignments(), get_staff()
+            labor_costs = labor.compute(asg_resp.data if asg_resp else [], staff_resp.data if staff_resp else [])
+        except Exception as e:
+            print(f"Labor costing unavailable: {e}")
+            labor_costs = labor.compute([], [])
+        pl_df = labor.apply_actual(pl_df, labor_costs)
+        monthly_data = pd.DataFrame([{"Month": m['month'], "Revenue": float(m.get('revenue') or 0.0), "Profit": float(m.get('profit') or 0.0)} for m in pl_months or [] if m.get('projects')])
 
         # --- DISPLAY METRICS ---
         
@@ -1363,19 +1887,47 @@ with tab6:
         k1.metric("Total Collected", f"₹{total_collected:,.0f}", delta=f"Quoted: ₹{total_quoted:,.0f}")
         k2.metric("Total Expenses (Cash)", f"₹{total_expenses_cash:,.0f}")
         k3.metric("Net Cash Profit", f"₹{actual_cash_profit:,.0f}", delta=f"{actual_margin_pct:.1f}% Margin")
-        k4.metric("Outstanding Amount", f"₹{discount_loss:,.0f}", delta_color="inverse")
+        k4.metric("Outstanding Amount", f"₹{total_outstanding:,.0f}", delta=f"{len(recv)} clients", delta_color="off")
         
         st.divider()
         
         st.markdown("### 🏗️ Operational Metrics")
-        o1, o2, o3 = st.columns(3)
-        o1.metric("Projects Completed", len(closed_df))
+        o1, o2, o3, o4 = st.columns(4)
+        o1.metric("Projects Completed", sum(int(m.get('projects') or 0) for m in pl_months or []))
         o2.metric("Material Expenses (Log)", f"₹{total_material_expense_cash:,.0f}")
         o3.metric("Labor Expenses (Est)", f"₹{total_labor_expense_cash:,.0f}")
+        tracked = pl_df[pl_df['Labor Basis'] == labor.ACTUAL] if 'Labor Basis' in pl_df else pl_df.iloc[0:0]
+        o4.metric("Labor Expenses (Actual)", f"₹{tracked['Labor Cost'].sum() if len(tracked) else 0:,.0f}",
+                  delta=f"{len(tracked)} of {len(pl_df)} projects tracked", delta_color="off", help="Staff wages for the days they were assigned to completed projects")
+
+        st.divider()
+
+        st.markdown("### 👷 Labor Cost by Staff")
+        if len(labor_costs.by_staff):
+            st.caption("Wages for assigned days across all projects, including ones in progress. A day on several projects is split between them.")
+            st.dataframe(labor_costs.by_staff[['name', 'role', 'projects', 'days', 'cost']],
+                         column_config={"name": "Staff", "role": "Role", "projects": "Projects", "days": st.column_config.NumberColumn("Days", format="%.1f"),
+                                        "cost": st.column_config.NumberColumn("Labor Cost", format="₹%.0f")}, hide_index=True, use_container_width=True)
+        else:
+            st.info("No staff assignments recorded yet. Assign teams from the Dashboard (or backfill current teams in Settings).")
+
+        st.divider()
+
+        st.markdown("### 🧾 Receivables Ageing")
+        if recv:
+            ra1, ra2 = st.columns([1, 2])
+            with ra1:
+                ageing = payments.ageing_summary(recv)
+                st.dataframe(pd.DataFrame({"Age": list(ageing.keys()), "Outstanding": list(ageing.values())}), column_config={"Outstanding": st.column_config.NumberColumn(format="₹%.0f")}, hide_index=True, use_container_width=True)
+            with ra2:
+                st.dataframe(pd.DataFrame(recv)[['name', 'status', 'quoted', 'paid', 'balance', 'age_days']], column_config={"name": "Client", "status": "Status", "quoted": st.column_config.NumberColumn("Quoted", format="₹%.0f"), "paid": st.column_config.NumberColumn("Paid", format="₹%.0f"), "balance": st.column_config.NumberColumn("Balance", format="₹%.0f"), "age_days": "Days Since Payment"}, hide_index=True, use_container_width=True)
+        else:
+            st.success("No outstanding balances.")
 
         st.divider()
 
         # --- CHARTS ---
+        # Figures/specs are cached per data version (utils/charts.py); unchanged data reuses them
         
         # Pre-calculate values for charts to avoid scope issues
         def safe_float(val):
@@ -1391,6 +1943,8 @@ with tab6:
         val_expenses = safe_float(total_expenses_cash)
         val_mat = safe_float(total_material_expense_cash)
         val_lab = safe_float(total_labor_expense_cash)
+        pl_version = charts.data_version(pl_df)
+        monthly_version = charts.data_version(monthly_data)
         
         c_chart1, c_chart2 = st.columns(2)
         
@@ -1398,31 +1952,12 @@ with tab6:
         with c_chart1:
             st.markdown("#### Revenue vs Expenses vs Payment")
             
-            chart_data_comparison = pd.DataFrame({
-                'Category': ['Quoted Total', 'Collected', 'Total Expenses'],
-                'Amount': [val_quoted, val_collected, val_expenses]
-            })
-            
             if val_quoted == 0 and val_collected == 0 and val_expenses == 0:
                 st.warning("No financial data to display.")
             else:
                 # Plotly Bar Chart
-                fig_comp = go.Figure(data=[
-                    go.Bar(name='Quoted Total', x=['Quoted Total'], y=[val_quoted], marker_color='#3498db'),
-                    go.Bar(name='Collected', x=['Collected'], y=[val_collected], marker_color='#2ecc71'),
-                    go.Bar(name='Total Expenses', x=['Total Expenses'], y=[val_expenses], marker_color='#e74c3c')
-                ])
-                
-                fig_comp.update_layout(
-                    margin=dict(t=0, b=0, l=0, r=0),
-                    height=300,
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    showlegend=True,
-                    yaxis=dict(title="Amount (₹)"),
-                    barmode='group'
-                )
-                
+                fig_comp = charts.cached_spec("pl_comparison", charts.data_version(val_quoted, val_collected, val_expenses),
+                                              lambda: charts.comparison_figure(val_quoted, val_collected, val_expenses))
                 st.plotly_chart(fig_comp, use_container_width=True)
 
         # 2. Cost Split (Main Branch Feature)
@@ -1433,22 +1968,7 @@ with tab6:
                 st.warning("No expense data.")
             else:
                 # Plotly Donut Chart
-                fig_cost = go.Figure(data=[go.Pie(
-                    labels=['Material (Log)', 'Labor (Est)'],
-                    values=[val_mat, val_lab],
-                    hole=.4,
-                    marker_colors=['#FF9800', '#9C27B0']
-                )])
-                
-                fig_cost.update_layout(
-                    margin=dict(t=0, b=0, l=0, r=0),
-                    height=300,
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    showlegend=True,
-                    legend=dict(title="Category", orientation="v", yanchor="middle", y=0.5, xanchor="left", x=1.05)
-                )
-                
+                fig_cost = charts.cached_spec("pl_cost_split", charts.data_version(val_mat, val_lab), lambda: charts.cost_split_figure(val_mat, val_lab))
                 st.plotly_chart(fig_cost, use_container_width=True)
 
         st.divider()
@@ -1460,33 +1980,15 @@ with tab6:
         with nc1:
             st.markdown("#### Client Profitability Matrix")
             if not pl_df.empty:
-                chart_scatter = alt.Chart(pl_df).mark_circle(size=60).encode(
-                    x=alt.X('Revenue', axis=alt.Axis(title='Revenue (₹)')),
-                    y=alt.Y('Profit', axis=alt.Axis(title='Profit (₹)')),
-                    color=alt.Color('Profit', scale=alt.Scale(scheme='redyellowgreen')),
-                    tooltip=['Client', alt.Tooltip('Revenue', format='₹,.0f'), alt.Tooltip('Profit', format='₹,.0f')]
-                ).properties(height=300).interactive()
-                st.altair_chart(chart_scatter, use_container_width=True)
+                st.vega_lite_chart(charts.cached_spec("pl_scatter", pl_version, lambda: charts.profit_scatter_spec(pl_df)), use_container_width=True)
             else:
                 st.info("No data for scatter plot.")
 
         # 4. Monthly Trend Combo (Restored)
         with nc2:
-            if not pl_df.empty:
+            if not monthly_data.empty:
                 st.markdown("#### 📅 Monthly Performance (Combo)")
-                # Ensure Month is present
-                if 'Month' not in pl_df.columns:
-                     pl_df['created_at'] = pd.to_datetime(pl_df['created_at'])
-                     pl_df['Month'] = pl_df['created_at'].dt.strftime('%Y-%m')
-                
-                monthly_data = pl_df.groupby('Month')[['Revenue', 'Profit']].sum().reset_index()
-                
-                base = alt.Chart(monthly_data).encode(x='Month')
-                bar = base.mark_bar(opacity=0.7).encode(y='Revenue', color=alt.value('#2196F3'))
-                line = base.mark_line(color='#FFC107', strokeWidth=3).encode(y='Profit')
-                
-                combo = (bar + line).properties(height=300).resolve_scale(y='shared')
-                st.altair_chart(combo, use_container_width=True)
+                st.vega_lite_chart(charts.cached_spec("pl_monthly_combo", monthly_version, lambda: charts.monthly_combo_spec(monthly_data)), use_container_width=True)
             else:
                 st.info("No data for monthly trend.")
         
@@ -1495,45 +1997,19 @@ with tab6:
         # New Row for Line Charts
         nl1, nl2 = st.columns(2)
         
-        # 5. Client Profitability (Line Chart)
+        # 5. Client Profitability (Line Chart, downsampled for long histories)
         with nl1:
             st.markdown("#### Client Profitability")
             if not pl_df.empty:
-                # Sort by date to make the line chart meaningful (Profit over time/projects)
-                pl_df_sorted = pl_df.sort_values('created_at')
-                
-                chart_client_line = alt.Chart(pl_df_sorted).mark_line(point=True).encode(
-                    x=alt.X('Client', sort=None, axis=alt.Axis(labelAngle=-45)), # Preserving sorted order
-                    y=alt.Y('Profit', axis=alt.Axis(title='Profit (₹)')),
-                    tooltip=['Client', 'Revenue', 'Profit', 'created_at']
-                ).properties(height=300).interactive()
-                st.altair_chart(chart_client_line, use_container_width=True)
+                st.vega_lite_chart(charts.cached_spec("pl_client_line", pl_version, lambda: charts.client_line_spec(pl_df)), use_container_width=True)
             else:
                 st.info("No data for client profitability.")
 
         # 6. Monthly Trend (Line Chart)
         with nl2:
-            if not pl_df.empty:
+            if not monthly_data.empty:
                 st.markdown("#### 📅 Monthly Performance Trend")
-                if 'Month' not in pl_df.columns:
-                     pl_df['created_at'] = pd.to_datetime(pl_df['created_at'])
-                     pl_df['Month'] = pl_df['created_at'].dt.strftime('%Y-%m')
-                
-                monthly_data = pl_df.groupby('Month')[['Revenue', 'Profit']].sum().reset_index()
-                
-                chart_monthly_line = alt.Chart(monthly_data).mark_line(point=True).encode(
-                    x='Month',
-                    y=alt.Y('Revenue', axis=alt.Axis(title='Amount (₹)')),
-                    color=alt.value('#2196F3'),
-                    tooltip=['Month', 'Revenue']
-                ) + alt.Chart(monthly_data).mark_line(point=True, strokeDash=[5,5]).encode(
-                    x='Month',
-                    y='Profit',
-                    color=alt.value('#FFC107'),
-                    tooltip=['Month', 'Profit']
-                )
-                
-                st.altair_chart(chart_monthly_line, use_container_width=True)
+                st.vega_lite_chart(charts.cached_spec("pl_monthly_line", monthly_version, lambda: charts.monthly_line_spec(monthly_data)), use_container_width=True)
             else:
                 st.info("No data for monthly trend.")
 
@@ -1546,54 +2022,9 @@ with tab6:
         cost_eff = (total_expenses_cash / total_collected * 100) if total_collected > 0 else 0
         labor_pct = (total_labor_expense_cash / total_expenses_cash * 100) if total_expenses_cash > 0 else 0
         
-        # Radar Chart
-        categories = ['Revenue Capture', 'Profit Margin', 'Cost Efficiency', 'Labor Cost %']
-        
-        # Normalize/Scale values for the chart (0-100 scale)
-        # Cost Efficiency & Labor Cost: Lower is better, so we might want to invert them for "Health" score?
-        # Or just plot raw %? User asked for "appropriate visual representation".
-        # Standard radar charts usually have "outward is better".
-        # Let's plot raw percentages for now but maybe add a "Target" series?
-        
-        fig = go.Figure()
-
-        fig.add_trace(go.Scatterpolar(
-            r=[rev_capture, profit_margin, cost_eff, labor_pct],
-            theta=categories,
-            fill='toself',
-            name='Current Performance',
-            line_color='#2196F3'
-        ))
-        
-        # Add Target Series (Ideal values)
-        # Targets: >95, >20, <70, <30
-        # For visualization, let's just show the current polygon.
-        
-        fig.update_layout(
-            polar=dict(
-                bgcolor='#1E1E1E',
-                radialaxis=dict(
-                    visible=True,
-                    range=[0, 100],
-                    gridcolor='#444',
-                    linecolor='#444',
-                    tickfont=dict(color='#ccc')
-                ),
-                angularaxis=dict(
-                    gridcolor='#444',
-                    linecolor='#444',
-                    tickfont=dict(color='#ccc')
-                )
-            ),
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            font=dict(color='white'),
-            showlegend=True,
-            legend=dict(font=dict(color='white')),
-            height=400,
-            margin=dict(l=40, r=40, t=40, b=40)
-        )
-        
+        # Radar Chart (raw percentages; see the targets in the table below)
+        health_values = [rev_capture, profit_margin, cost_eff, labor_pct]
+        fig = charts.cached_spec("pl_health", charts.data_version(health_values), lambda: charts.health_radar_figure(health_values))
         st.plotly_chart(fig, use_container_width=True)
 
         st.divider()
@@ -1661,6 +2092,44 @@ with tab4:
     
     st.info(f"Formula Applied: (Material + Labor) + {adv_m}% Profit")
 
+    # Sweeps settings over every open estimate at once (see utils/pricing.py)
+    st.markdown("#### 🔬 What-If Simulator (Open Estimates)")
+    st.caption("Prices every open estimate under each combination of the ranges below and compares it with the current settings. Estimates with custom margins keep them.")
+    wi_cur = pricing.current_settings(sett)
+    with st.form("whatif_form"):
+        wc1, wc2, wc3 = st.columns(3)
+        wi_part = wc1.slider("Parts Margin (%)", 0, 100, (max(int(wi_cur['part_margin']) - 10, 0), min(int(wi_cur['part_margin']) + 10, 100)))
+        wi_labor = wc2.slider("Labor Margin (%)", 0, 100, (int(wi_cur['labor_margin']), int(wi_cur['labor_margin'])))
+        wi_extra = wc3.slider("Extra Margin (%)", 0, 100, (int(wi_cur['extra_margin']), int(wi_cur['extra_margin'])))
+        wc4, wc5, wc6 = st.columns(3)
+        wi_dlc = wc4.slider("Daily Labor Cost (₹)", 0, 5000, (int(wi_cur['daily_labor_cost']), int(wi_cur['daily_labor_cost'])), step=50)
+        wi_adv = wc5.slider("Advance Margin (%)", 0, 100, (int(wi_cur['advance_margin']), int(wi_cur['advance_margin'])))
+        wi_steps = wc6.number_input("Values per Range", min_value=2, max_value=21, value=5, help="Each range that is not a single value is split into this many values.")
+        if st.form_submit_button("▶️ Run Simulation"):
+            try:
+                cl_all = get_clients()
+                wi_rows = cl_all.data if cl_all and cl_all.data else []
+                wi_pipe = pricing.load_pipeline(wi_rows, estimates.parse_clients(wi_rows, get_item_maps()[0]))
+                wi_grid = pricing.grid(**{k: pricing.sweep_values(lo, hi, wi_steps) for k, (lo, hi) in
+                                          zip(pricing.SETTING_KEYS, (wi_part, wi_labor, wi_extra, wi_dlc, wi_adv))})
+                wi_out, wi_ms = pricing.sweep(wi_pipe, wi_grid, wi_cur)
+                st.session_state['whatif'] = {"result": wi_out, "ms": wi_ms, "estimates": len(wi_pipe), "custom": int(wi_pipe.has_custom.sum())}
+            except ValueError as e:
+                st.error(str(e))
+    wi = st.session_state.get('whatif')
+    if wi:
+        st.caption(f"{len(wi['result']):,} scenarios x {wi['estimates']:,} open estimates ({wi['custom']} with custom margins) in {wi['ms']:,.0f} ms")
+        wi_best = wi['result'].loc[wi['result']['profit'].idxmax()]
+        wm1, wm2, wm3 = st.columns(3)
+        wm1.metric("Best Pipeline Profit", f"₹{wi_best['profit']:,.0f}", delta=f"₹{wi_best['profit_delta']:,.0f}")
+        wm2.metric("Its Revenue", f"₹{wi_best['revenue']:,.0f}", delta=f"₹{wi_best['revenue_delta']:,.0f}")
+        wm3.metric("Its Advances", f"₹{wi_best['advance']:,.0f}", delta=f"₹{wi_best['advance_delta']:,.0f}")
+        money = lambda label: st.column_config.NumberColumn(label, format="₹%.0f")
+        st.dataframe(wi['result'].sort_values("profit", ascending=False).head(200), hide_index=True, use_container_width=True,
+                     column_config={"part_margin": "Parts %", "labor_margin": "Labor %", "extra_margin": "Extra %", "daily_labor_cost": money("Daily Labor"), "advance_margin": "Advance %",
+                                    "revenue": money("Revenue"), "revenue_delta": money("Δ Revenue"), "profit": money("Profit"), "profit_delta": money("Δ Profit"),
+                                    "advance": money("Advances"), "advance_delta": money("Δ Advances"), "profit_pct": st.column_config.NumberColumn("Profit %", format="%.1f%%")})
+
 
 
     st.divider()
@@ -1705,6 +2174,76 @@ with tab4:
     else:
         st.info("No roles found or table missing. Please update database schema.")
 
+    if is_admin():
+        st.divider()
+        st.subheader("🩺 Performance Profiling")
+        st.caption("Profiles the next reruns of your session with cProfile and tracemalloc. Profiled reruns are noticeably slower.")
+        pc1, pc2 = st.columns([1, 2])
+        n_prof = pc1.number_input("Reruns to profile", min_value=1, max_value=20, value=3, key="prof_runs")
+        if pc2.button("▶️ Start Profiling", key="prof_start"):
+            profiling.request(st.session_state, n_prof)
+            st.rerun()
+        
+        prof_sum = profiling.summary(st.session_state)
+        if profiling.is_running(st.session_state):
+            st.info(f"Profiling: {prof_sum['runs_left']} rerun(s) left. Use the app normally, then come back here.")
+        if prof_sum['skipped']:
+            st.caption(f"{prof_sum['skipped']} rerun(s) waited because another session was profiling.")
+        if profiling.has_results(st.session_state):
+            pm1, pm2, pm3 = st.columns(3)
+            pm1.metric("Profiled Reruns", prof_sum['runs'])
+            pm2.metric("Avg Rerun", f"{prof_sum['avg_wall_ms']:,.0f} ms")
+            pm3.metric("Slowest Rerun", f"{prof_sum['max_wall_ms']:,.0f} ms")
+            st.markdown("**Top 20 Functions (cumulative time)**")
+            st.dataframe(pd.DataFrame(profiling.top_functions(st.session_state, 20)), column_config={"Self (ms)": st.column_config.NumberColumn(format="%.1f"), "Cumulative (ms)": st.column_config.NumberColumn(format="%.1f")}, hide_index=True, use_container_width=True)
+            st.markdown("**Top 20 Allocation Sites (memory held at end of rerun)**")
+            st.dataframe(pd.DataFrame(profiling.top_allocations(st.session_state, 20)), column_config={"Size (KiB)": st.column_config.NumberColumn(format="%.1f")}, hide_index=True, use_container_width=True)
+            pd1, pd2, pd3 = st.columns(3)
+            stamp = datetime.now().strftime('%Y%m%d_%H%M')
+            pd1.download_button("⬇️ pstats", profiling.pstats_bytes(st.session_state), f"jugnoo_{stamp}.prof", "application/octet-stream", use_container_width=True)
+            pd2.download_button("⬇️ speedscope", profiling.speedscope_json(st.session_state), f"jugnoo_{stamp}.speedscope.json", "application/json", use_container_width=True)
+            if pd3.button("🗑️ Clear Results", use_container_width=True):
+                profiling.clear(st.session_state)
+                st.rerun()
+
+        st.markdown("**Backend Connection**")
+        conn_health = supabase.health()
+        bc1, bc2, bc3, bc4 = st.columns(4)
+        bc1.metric("Circuit", conn_health['state'].replace("_", " ").title())
+        bc2.metric("Avg Latency", f"{conn_health['latency_ms']:,.0f} ms" if conn_health['latency_ms'] is not None else "-")
+        bc3.metric("Retries", conn_health['retries'], help=f"{conn_health['requests']} requests, {conn_health['failures']} transient failures, {conn_health['rejected']} rejected while open")
+        bc4.metric("Client Rebuilds", conn_health['rebuilds'])
+        if conn_health['last_error']: st.caption(f"Last error ({datetime.fromtimestamp(conn_health['last_error_at']).strftime('%H:%M:%S')}): {conn_health['last_error']}")
+        if st.button("🩺 Ping Database", key="conn_ping"):
+            ok, ping_ms, err = supabase.ping()
+            if ok: st.success(f"Database answered in {ping_ms:,.0f} ms.")
+            else: st.error(f"Ping failed after {ping_ms:,.0f} ms: {err}")
+
+        st.markdown("**Maintenance Jobs**")
+        st.caption("Run in the background; follow them in the jobs panel at the top of the page.")
+        mj1, mj2, mj3, mj4 = st.columns(4)
+        if mj1.button("Backfill Estimate Totals", key="job_backfill", use_container_width=True):
+            jobs.submit("backfill_totals", {"only_missing": True}, user=st.session_state.username)
+            st.rerun()
+        if mj2.button("Migrate Estimates (dry run)", key="job_migrate_dry", use_container_width=True):
+            jobs.submit("migrate_estimates", {"dry_run": True}, user=st.session_state.username, title="Migrate estimates to v2 (dry run)")
+            st.rerun()
+        if mj3.button("Migrate Estimates", key="job_migrate", use_container_width=True):
+            jobs.submit("migrate_estimates", {"dry_run": False}, user=st.session_state.username)
+            st.rerun()
+        if mj4.button("Backfill Staff Assignments", key="job_assignments", use_container_width=True, help="Records the teams currently assigned to projects, for per-staff labor costing"):
+            jobs.submit("backfill_assignments", user=st.session_state.username)
+            st.rerun()
+
+        st.markdown("**Session Memory**")
+        mem = session_buffers.memory_report(st.session_state)
+        sm1, sm2, sm3, sm4 = st.columns(4)
+        sm1.metric("Session State", f"{mem['total_kib']:,.0f} KiB", help=f"{mem['keys']} keys (approximate deep size)")
+        sm2.metric("Client Buffers", mem['tracked_clients'], help=f"At most {session_buffers.MAX_CLIENTS} are kept, plus clients with unsaved edits")
+        sm3.metric("Unsaved", mem['dirty_clients'])
+        sm4.metric("Evicted", mem['evicted'])
+        st.dataframe(pd.DataFrame(mem['top']), column_config={"Size (KiB)": st.column_config.NumberColumn(format="%.1f")}, hide_index=True, use_container_width=True)
+
     st.divider()
     st.subheader("🔐 Change Password")
     with st.form("change_pwd"):
@@ -1733,3 +2272,13 @@ with tab4:
         st.session_state.logged_in = False
         cookie_manager.delete("jugnoo_user")
         st.rerun()
+
+# End of a profiled rerun (reruns that end early are closed at the start of the next one)
+profiling.finish_run(st.session_state)
+# Drop per-client buffers of clients not rendered lately, keeping unsaved edits (see utils/session_buffers.py)
+session_buffers.evict(st.session_state)
+
+stale = cache.stale_reads()
+if stale:
+    stale_min = max(r['expired_s'] for r in stale) / 60
+    stale_banner.warning(f"⚠️ The database is not responding, so some data is from the cache (up to {stale_min:,.0f} min past its refresh time). Saving may fail until it recovers.")
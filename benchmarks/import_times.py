@@ -0,0 +1,115 @@
+"""
+Startup import-time report for app.py.
+
+Lists every module app.py imports, split into the ones loaded at startup
+(module level) and the ones deferred to the sections that use them, with
+the cumulative import time of each measured in a fresh interpreter via
+`python -X importtime`. The "startup total" line imports all module-level
+dependencies together, i.e. what a new worker pays before the login page.
+
+Usage (from the repository root):
+    python benchmarks/import_times.py [--repeat 3] [--json]
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app.py")
+
+
+def _module_names(node):
+    if isinstance(node, ast.Import):
+        return [a.name for a in node.names]
+    if isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+        # `from utils import helpers` imports the submodule utils.helpers
+        if node.module == "utils":
+            return [f"utils.{a.name}" for a in node.names]
+        return [node.module]
+    return []
+
+
+def collect_imports(path=APP):
+    """
+    Returns:
+        tuple: (startup modules, deferred modules) in first-seen order.
+    """
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    startup, deferred = [], []
+    top_level = set(id(n) for n in tree.body)
+    for node in ast.walk(tree):
+        for name in _module_names(node):
+            target = startup if id(node) in top_level else deferred
+            if name not in startup and name not in target:
+                target.append(name)
+    deferred = [m for m in deferred if m not in startup]
+    return startup, deferred
+
+
+def import_time_ms(modules, repeat=3):
+    """
+    Cumulative import time of `modules` (imported together) in a fresh interpreter.
+
+    Returns:
+        float or None: Best of `repeat` runs in milliseconds, None if the import fails.
+    """
+    code = "; ".join(f"import {m}" for m in modules) or "pass"
+    best = None
+    for _ in range(repeat):
+        res = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True)
+        if res.returncode != 0:
+            return None
+        total = 0
+        for line in res.stderr.splitlines():
+            # "import time: self [us] | cumulative | imported package"; top-level entries are not indented
+            parts = line.split("|")
+            if not line.startswith("import time:") or len(parts) != 3 or parts[2].startswith("  "):
+                continue
+            try:
+                total += int(parts[1])
+            except ValueError:
+                continue
+        best = total if best is None else min(best, total)
+    return best / 1000.0
+
+
+def report(repeat=3):
+    startup, deferred = collect_imports()
+    # Interpreter startup (site, encodings, ...) shows up in every run; subtract it
+    baseline = import_time_ms([], repeat) or 0.0
+    net = lambda ms: None if ms is None else max(ms - baseline, 0.0)
+    rows = []
+    for phase, modules in (("startup", startup), ("deferred", deferred)):
+        for m in modules:
+            rows.append({"module": m, "phase": phase, "ms": net(import_time_ms([m], repeat))})
+    rows.sort(key=lambda r: (r["phase"], -(r["ms"] or 0)))
+    return {"startup_total_ms": net(import_time_ms(startup, repeat)), "baseline_ms": baseline, "modules": rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time breakdown for app.py")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    data = report(args.repeat)
+    if args.json:
+        print(json.dumps(data, indent=2))
+        return 0
+    print(f"{'module':<34} {'phase':<9} {'ms':>9}")
+    print("-" * 54)
+    for r in data["modules"]:
+        ms = f"{r['ms']:9.1f}" if r["ms"] is not None else "  missing"
+        print(f"{r['module']:<34} {r['phase']:<9} {ms}")
+    print("-" * 54)
+    total = data["startup_total_ms"]
+    print(f"{'startup total (imported together)':<44} {total:9.1f}" if total is not None else "startup total: import failed (missing dependency)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+"""
+Concurrent multi-session load test for the Streamlit app.
+
+Starts `streamlit run app.py` worker(s) on local ports against the fake
+backend (utils/fake_backend.py), then opens N sessions that speak the
+browser protocol over the websocket (BackMsg rerun requests with widget
+states, ForwardMsg deltas back). Each session logs in and replays user
+journeys in a loop until the duration ends:
+
+    dashboard  open the app, filter All, filter Active
+    estimate   pick a client in the Estimator, toggle custom margins, add an item
+    purchase   search an item in Suppliers, record a purchase
+    pnl        rerun (all tabs render), refresh the P&L data
+
+For every session count in --sessions the workers are restarted and the
+report lists completed reruns, throughput, rerun latency percentiles
+(request sent -> script finished, including st.rerun chains) and, per
+worker, CPU use (% of one core) and resident memory. AppTest cannot be
+used here: it swaps process-wide runtime state on every run, so its
+sessions cannot run concurrently.
+
+Usage (from the repository root; Linux for the CPU/memory columns):
+    python benchmarks/load_test.py [--sessions 1,2,4,8] [--duration 60] [--think 1.0] [--workers 1] [--spec clients=100] [--json]
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app.py")
+
+DEFAULT_SPEC = "clients=100,items=300,purchases=3000"
+BASE_PORT = 8650
+FINISHED_EARLY_FOR_RERUN = 2  # ForwardMsg.script_finished status followed by another run
+
+
+# --- WORKERS ---
+class Worker:
+    """One `streamlit run app.py` process with its own secrets file (never the repo's secrets.toml)."""
+
+    def __init__(self, port, spec):
+        self.port = port
+        self.spec = spec
+        self.proc = None
+        self._dir = tempfile.mkdtemp(prefix="jugnoo-load-")
+
+    def start(self, timeout=120):
+        secrets = os.path.join(self._dir, "secrets.toml")
+        with open(secrets, "w") as f:
+            f.write(f'FAKE_BACKEND = "{self.spec}"\nCACHE_URL = "memory"\nADMIN_USERS = ["admin"]\n')
+        env = dict(os.environ, JUGNOO_FAKE_BACKEND=self.spec, JUGNOO_CACHE_URL="memory")
+        env.pop("JUGNOO_ANALYTICS_DIR", None)
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", APP, "--server.headless", "true", "--server.port", str(self.port),
+             "--secrets.files", secrets, "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                with urllib.request.urlopen(f"http://localhost:{self.port}/_stcore/health", timeout=2) as r:
+                    if r.status == 200:
+                        return
+            except OSError:
+                time.sleep(0.3)
+        self.stop()
+        raise RuntimeError(f"worker on port {self.port} did not start")
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+    def usage(self):
+        """(cpu seconds, rss MiB) of the worker process from /proc, or (None, None) off Linux."""
+        try:
+            with open(f"/proc/{self.proc.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+            with open(f"/proc/{self.proc.pid}/status") as f:
+                rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:")) / 1024
+            return cpu, rss
+        except (OSError, StopIteration, IndexError, ValueError):
+            return None, None
+
+
+# --- SESSIONS ---
+class Session:
+    """One browser tab: a websocket, the widgets of the last rendered page, and the ForwardMsg cache."""
+
+    def __init__(self, url):
+        self.url = url
+        self.ws = None
+        self.tree = None
+        self._cache = {}
+
+    async def connect(self):
+        import websockets
+        self.ws = await websockets.connect(self.url, max_size=None)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def rerun(self, widget_states=()):
+        """Sends a rerun with the given WidgetState protos; returns seconds until the script finished."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        from streamlit.testing.v1.element_tree import parse_tree_from_messages
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = ""
+        msg.rerun_script.widget_states.widgets.extend(widget_states)
+        started = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        received = []
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(await self.ws.recv())
+            kind = fwd.WhichOneof("type")
+            if kind == "ref_hash":  # already sent to this session; resolve from our cache
+                cached = self._cache.get(fwd.ref_hash)
+                if cached is None:
+                    continue
+                full = ForwardMsg()
+                full.CopyFrom(cached)
+                full.metadata.CopyFrom(fwd.metadata)
+                fwd = full
+            elif fwd.hash:
+                self._cache[fwd.hash] = fwd
+            if kind == "new_session":
+                received = []
+            received.append(fwd)
+            if kind == "script_finished" and fwd.script_finished != FINISHED_EARLY_FOR_RERUN:
+                break
+        elapsed = time.perf_counter() - started
+        self.tree = parse_tree_from_messages(received)
+        return elapsed
+
+    # Widget states built the way the frontend sends them (only the changed widgets; the rest keep their values)
+    def _find(self, elements, key=None, label=None):
+        for w in elements:
+            if (key is not None and w.key == key) or (label is not None and w.label == label):
+                return w
+        raise LookupError(f"widget {key or label!r} not on the page")
+
+    def click(self, label):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        return [WidgetState(id=self._find(self.tree.button, label=label).id, trigger_value=True)]
+
+    def text(self, key=None, value="", label=None):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        return [WidgetState(id=self._find(self.tree.text_input, key, label).id, string_value=value)]
+
+    def choose(self, elements, key, index=None, option=None):
+        """Radio/selectbox state: an option label, or the option at `index`."""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        w = self._find(elements, key)
+        options = list(w.proto.options)
+        if not options:
+            return []
+        return [WidgetState(id=w.id, string_value=option if option is not None else options[index % len(options)])]
+
+    def check(self, key, value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        return [WidgetState(id=self._find(self.tree.checkbox, key).id, bool_value=value)]
+
+
+async def login(s):
+    await s.rerun()
+    await s.rerun(s.text(label="Username", value="admin") + s.text(label="Password", value="admin") + s.click("Login"))
+
+
+# journey -> list of (step name, function(session, rng) -> widget states)
+JOURNEYS = {
+    "dashboard": [
+        ("open", lambda s, rng: []),
+        ("filter all", lambda s, rng: s.choose(s.tree.radio, "dash_filter", option="All")),
+        ("filter active", lambda s, rng: s.choose(s.tree.radio, "dash_filter", option="Active")),
+    ],
+    "estimate": [
+        ("select client", lambda s, rng: s.choose(s.tree.selectbox, "est_sel", index=rng.randrange(50))),
+        ("custom margins", lambda s, rng: s.check("cm", True)),
+        ("default margins", lambda s, rng: s.check("cm", False)),
+        ("add item", lambda s, rng: s.choose(s.tree.selectbox, "est_item_selector", index=rng.randrange(50))),
+        ("add item submit", lambda s, rng: s.click("⬇️ Add Item")),
+    ],
+    "purchase": [
+        ("search item", lambda s, rng: s.text("item_q_rec", rng.choice(["led", "strip", "driver", "panel"]))),
+        ("record purchase", lambda s, rng: s.click("✅ Record Purchase")),
+    ],
+    "pnl": [
+        ("view", lambda s, rng: []),
+        ("refresh", lambda s, rng: s.click("🔄 Refresh Data")),
+    ],
+}
+
+
+async def run_session(url, deadline, think, seed, samples, errors):
+    rng = random.Random(seed)
+    s = Session(url)
+    try:
+        await s.connect()
+        await login(s)
+        while time.time() < deadline:
+            journey = rng.choice(list(JOURNEYS))
+            for step, make_states in JOURNEYS[journey]:
+                if time.time() >= deadline:
+                    break
+                try:
+                    states = make_states(s, rng)
+                except LookupError as e:
+                    errors.append(f"{journey}/{step}: {e}")
+                    states = []
+                elapsed = await s.rerun(states)
+                samples.append({"journey": journey, "step": step, "seconds": elapsed, "at": time.time()})
+                if think:
+                    await asyncio.sleep(rng.uniform(0, 2 * think))
+    except Exception as e:
+        errors.append(f"session {seed}: {type(e).__name__}: {e}")
+    finally:
+        await s.close()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+async def _run_level(workers, sessions, duration, think):
+    samples, errors, usage = [], [], {w.port: [] for w in workers}
+    start = time.time()
+    deadline = start + duration
+
+    async def sample_usage():
+        while time.time() < deadline:
+            for w in workers:
+                usage[w.port].append((time.time(), *w.usage()))
+            await asyncio.sleep(0.5)
+
+    tasks = [run_session(f"ws://localhost:{workers[i % len(workers)].port}/_stcore/stream", deadline, think, i, samples, errors)
+             for i in range(sessions)]
+    await asyncio.gather(sample_usage(), *tasks)
+    for w in workers:
+        usage[w.port].append((time.time(), *w.usage()))
+    return samples, errors, usage, time.time() - start
+
+
+def run_level(sessions, duration=60, think=1.0, n_workers=1, spec=DEFAULT_SPEC):
+    """
+    Runs `sessions` concurrent sessions spread over `n_workers` fresh workers.
+
+    Returns:
+        dict: sessions, reruns, throughput (reruns/s), p50/p90/p99/max latency (ms),
+        errors, and per-worker cpu_pct (avg % of one core) and rss_mb (peak).
+    """
+    workers = [Worker(BASE_PORT + i, spec) for i in range(n_workers)]
+    try:
+        for w in workers:
+            w.start()
+        samples, errors, usage, wall = asyncio.run(_run_level(workers, sessions, duration, think))
+    finally:
+        for w in workers:
+            w.stop()
+    lat = [x["seconds"] * 1000 for x in samples]
+    per_worker = []
+    for w in workers:
+        points = [p for p in usage[w.port] if p[1] is not None]
+        cpu_pct = (points[-1][1] - points[0][1]) / (points[-1][0] - points[0][0]) * 100 if len(points) > 1 else None
+        per_worker.append({"port": w.port, "cpu_pct": cpu_pct, "rss_mb": max((p[2] for p in points), default=None)})
+    return {
+        "sessions": sessions, "reruns": len(samples), "throughput": len(samples) / wall if wall else 0.0,
+        "p50_ms": percentile(lat, 50), "p90_ms": percentile(lat, 90), "p99_ms": percentile(lat, 99), "max_ms": max(lat, default=0.0),
+        "by_step": {f"{x['journey']}/{x['step']}": percentile([y["seconds"] * 1000 for y in samples if (y["journey"], y["step"]) == (x["journey"], x["step"])], 50)
+                    for x in samples},
+        "errors": errors, "workers": per_worker,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", default="1,2,4,8", help="comma-separated concurrent session counts (default: 1,2,4,8)")
+    parser.add_argument("--duration", type=float, default=60, help="seconds per session count (default: 60)")
+    parser.add_argument("--think", type=float, default=1.0, help="mean think time between interactions in seconds (default: 1.0)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes; sessions are spread round-robin (default: 1)")
+    parser.add_argument("--spec", default=DEFAULT_SPEC, help=f"fake dataset spec (default: {DEFAULT_SPEC})")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+    if importlib.util.find_spec("websockets") is None:
+        parser.error("the load test requires the 'websockets' package (pip install websockets)")
+
+    results = []
+    for n in [int(x) for x in args.sessions.split(",") if x.strip()]:
+        if not args.json:
+            print(f"{n} session(s) on {args.workers} worker(s) for {args.duration:.0f}s...")
+        results.append(run_level(n, args.duration, args.think, args.workers, args.spec))
+    if args.json:
+        print(json.dumps({"spec": args.spec, "workers": args.workers, "think": args.think, "results": results}, indent=2))
+        return 0
+
+    print()
+    print(f"{'sessions':>8} {'reruns':>7} {'rerun/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}  worker CPU % / RSS MiB")
+    for r in results:
+        workers = "  ".join(f"{w['cpu_pct']:.0f}% / {w['rss_mb']:.0f}" if w["cpu_pct"] is not None else "n/a" for w in r["workers"])
+        print(f"{r['sessions']:>8} {r['reruns']:>7} {r['throughput']:>8.2f} {r['p50_ms']:>8,.0f} {r['p90_ms']:>8,.0f} {r['p99_ms']:>8,.0f} {r['max_ms']:>8,.0f}  {workers}")
+    for r in results:
+        for e in sorted(set(r["errors"]))[:5]:
+            print(f"  [{r['sessions']} sessions] {e}")
+    if results:
+        print()
+        print(f"Median latency per step at {results[-1]['sessions']} session(s):")
+        for step, ms in sorted(results[-1]["by_step"].items()):
+            print(f"  {step:<28} {ms:>8,.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Parity check: vectorized pricing (utils/pricing.py) against calculate_estimate_details.
+
+Generates random estimates with round-number base rates, quantities and
+margins (the data most likely to land exactly on a ₹100 boundary) and
+compares the grand total, profit and advance of both paths, for the
+simulator's price() and for the target solver's solutions after they are
+applied. Exits 1 on any mismatch.
+
+Usage (from the repository root):
+    python benchmarks/pricing_parity.py [--estimates 2000] [--seed 1]
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import estimates, pricing  # noqa: E402
+
+RATES = [10, 20, 25, 50, 100, 125, 200, 250, 500, 1000, 12.5, 33.3]
+QTYS = [0.5, 1, 1.5, 2, 3, 5, 10, 20]
+KEYS = ("rounded_grand_total", "total_profit", "advance_amount")
+
+
+def random_estimate(rng):
+    items = [estimates.LineItem(item=f"Item {j}", qty=float(rng.choice(QTYS)), unit=rng.choice(["pcs", "m", "ft"]),
+                                base_rate=float(rng.choice(RATES))) for j in range(rng.randint(1, 15))]
+    margins = estimates.Margins(rng.randint(0, 40), rng.randint(0, 40), rng.randint(0, 40))
+    return estimates.Estimate(items=items, days=float(rng.randint(1, 12)), margins=margins)
+
+
+def mismatches(expected, got):
+    return [k for k in KEYS if abs(float(got[k]) - float(expected[k])) > 0.01]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--estimates", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    gs = {"part_margin": 20, "labor_margin": 20, "extra_margin": 10, "daily_labor_cost": 1000, "advance_margin": 20}
+    bad_price = bad_solve = 0
+    for n in range(args.estimates):
+        est = random_estimate(rng)
+        gs["daily_labor_cost"] = rng.choice([500, 800, 1000, 1250])
+        gs["advance_margin"] = rng.choice([10, 15, 20, 25])
+        m = est.margins
+        base = pricing.material_base(est)
+        got = pricing.price(base, est.days, m.part + m.labor + m.extra, gs["daily_labor_cost"], gs["advance_margin"])
+        wrong = mismatches(est.calculate(gs), got)
+        if wrong:
+            bad_price += 1
+            if bad_price <= 5: print(f"price #{n}: {wrong}")
+
+        target = est.calculate(gs)["rounded_grand_total"] * rng.uniform(0.8, 1.3)
+        for sol in pricing.solve(base, est.days, m.as_settings(), gs, target, days_range=(est.days, est.days + 2), top=2):
+            applied = estimates.Estimate(items=est.items, days=float(sol["days"]),
+                                         margins=estimates.Margins(sol["part_margin"], sol["labor_margin"], sol["extra_margin"]))
+            wrong = mismatches(applied.calculate(gs), sol)
+            if wrong:
+                bad_solve += 1
+                if bad_solve <= 5: print(f"solve #{n}: {wrong}")
+
+    print(f"{args.estimates} estimates: {bad_price} price mismatches, {bad_solve} solver mismatches")
+    return 1 if bad_price or bad_solve else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""
+Headless rerun-latency regression check for app.py.
+
+Runs the app with streamlit.testing.v1.AppTest against the in-memory fake
+backend (utils/fake_backend.py) seeded with a synthetic dataset, drives one
+interaction per section (Dashboard filter, Estimator add/edit, Inventory,
+Suppliers, Staff, P&L, Settings, global search), and records for each the
+wall time of the rerun it triggers and the number of backend queries it
+made. Exits with status 1 when an interaction exceeds its budget, raises,
+or receives a select cut at the fake backend's max-rows cap (a read that
+PostgREST would truncate and that needs paging).
+
+After each rerun the harness waits for the background work it started (the
+cache warm start and queued writes) and counts those queries with it.
+Background refreshes of expired cache entries are reported separately as
+"refresh" queries and are not budgeted: whether a TTL expires during a given
+interaction depends on how fast the machine runs the earlier ones.
+
+All sections run on every rerun (st.tabs renders every tab), so the times
+are whole-script times; compare them across commits on the same machine.
+Budgets are derived from a stored baseline (rerun_baseline.json: the median
+time and the query count of each interaction over several runs of the
+baseline spec) with one factor for time and one slack for queries. Re-record
+the baseline on the machine that runs the check:
+
+    python benchmarks/rerun_latency.py --write-baseline --runs 3
+
+Usage (from the repository root):
+    python benchmarks/rerun_latency.py [--spec clients=500] [--budget-scale 1.0] [--only dashboard,pnl] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app.py")
+sys.path.insert(0, ROOT)
+
+DEFAULT_SPEC = "clients=100,items=300,purchases=3000"
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "rerun_baseline.json")
+TIME_FACTOR = 2.0   # time budget = baseline median x TIME_FACTOR x --budget-scale
+QUERY_SLACK = 1     # query budget = baseline count + QUERY_SLACK (counts exclude TTL refreshes and are exact)
+
+
+def load_baseline(path=BASELINE_PATH):
+    """The stored baseline ({"spec", "runs", "interactions": {name: {"ms", "queries"}}}), or None."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def budgets(baseline, spec, budget_scale=1.0):
+    """interaction -> (max milliseconds, max queries); empty when the baseline was recorded for another spec."""
+    if not baseline or baseline.get("spec") != spec:
+        return {}
+    return {name: (b["ms"] * TIME_FACTOR * budget_scale, b["queries"] + QUERY_SLACK)
+            for name, b in baseline["interactions"].items()}
+
+
+def _button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+def _widget(elements, key):
+    return next(w for w in elements if w.key == key)
+
+
+def _pick_estimate_client(fake):
+    rows = [r for r in fake.tables["clients"] if r.get("status") != "Closed" and r.get("internal_estimate")]
+    return min(rows, key=lambda r: r["name"])["id"]
+
+
+# (name, section, action): the action sets widget values / clicks; the harness then times at.run()
+def scenarios(fake):
+    est_client = _pick_estimate_client(fake)
+    return [
+        ("idle rerun", "core", lambda at: None),
+        ("dashboard: filter closed", "dashboard", lambda at: _widget(at.radio, "dash_filter").set_value("Closed")),
+        ("dashboard: filter all", "dashboard", lambda at: _widget(at.radio, "dash_filter").set_value("All")),
+        ("estimator: search client", "estimator", lambda at: _widget(at.text_input, "est_client_q").set_value("a")),
+        ("estimator: select client", "estimator", lambda at: (_widget(at.text_input, "est_client_q").set_value(""),
+                                                              _widget(at.selectbox, "est_sel").set_value(est_client))),
+        ("estimator: add item", "estimator", lambda at: _button(at, "⬇️ Add Item").click()),
+        ("estimator: custom margins", "estimator", lambda at: _widget(at.checkbox, "cm").check()),
+        ("inventory: select item", "inventory", lambda at: _widget(at.selectbox, "inv_manage_sel").select_index(1)),
+        ("inventory: update item", "inventory", lambda at: _button(at, "Update Item").click()),
+        ("suppliers: search items", "suppliers", lambda at: _widget(at.text_input, "item_q_rec").set_value("led")),
+        ("suppliers: select supplier", "suppliers", lambda at: _widget(at.selectbox, "sup_sel_rec").select_index(1)),
+        ("staff: change status", "staff", lambda at: _change_staff_status(at, fake)),
+        ("pnl: refresh data", "pnl", lambda at: _button(at, "🔄 Refresh Data").click()),
+        ("settings: advance margin", "settings", lambda at: _widget(at.slider, "adv_margin_slider").set_value(25)),
+        ("settings: save", "settings", lambda at: _button(at, "💾 Save Settings").click()),
+        ("search: global query", "search", lambda at: _widget(at.text_input, "global_search_q").set_value("led")),
+    ]
+
+
+def _change_staff_status(at, fake):
+    staff = fake.tables["staff"][0]
+    new = "On Leave" if staff["status"] != "On Leave" else "Available"
+    _widget(at.selectbox, f"stat_{staff['id']}").set_value(new)
+
+
+def _new_session(spec):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP, default_timeout=600)
+    # Only these secrets are visible to the app, so it never reaches the real database
+    at.secrets["FAKE_BACKEND"] = spec
+    at.secrets["CACHE_URL"] = "memory"
+    at.secrets["ADMIN_USERS"] = ["admin"]
+    at.session_state["logged_in"] = True
+    at.session_state["username"] = "admin"
+    return at
+
+
+REFRESH_THREAD_PREFIX = "cache-refresh:"  # utils/cache.py stale-while-revalidate threads
+
+
+def _settle(timeout=120):
+    """Waits for the cache warm start and the write queue to finish the work a rerun started."""
+    from utils import write_queue
+    deadline = time.monotonic() + timeout
+    for t in threading.enumerate():
+        if t.name == "cache-warm-start":
+            t.join(max(deadline - time.monotonic(), 0))
+    if write_queue.is_configured():
+        while write_queue.pending() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        with write_queue.get_queue().flush_lock(blocking=True):
+            pass  # the flusher holds the lock until the after-write refreshes are done
+
+
+def _measure(at, fake, name):
+    fake.reset_counters()
+    started = time.perf_counter()
+    at.run()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _settle()
+    errors = [str(e.value) for e in at.exception]
+    errors += [f"{label} truncated at {fake.max_rows} rows (page it)" for label in dict.fromkeys(fake.truncated)]
+    refresh = sum(n for t, n in fake.queries_by_thread.items() if t.startswith(REFRESH_THREAD_PREFIX))
+    return {"name": name, "ms": elapsed_ms, "queries": fake.queries - refresh, "refresh_queries": refresh, "errors": errors}
+
+
+def run(spec=DEFAULT_SPEC, only=None, budget_scale=1.0, progress=print, baseline=None):
+    """
+    Returns:
+        list: One dict per interaction with name, ms, queries, errors, budget_ms, budget_queries and ok.
+    """
+    from streamlit import logger
+    from utils import fake_backend
+    logger.set_log_level("error")
+    progress(f"Seeding fake backend ({spec})...")
+    fake = fake_backend.from_spec(spec)
+    at = _new_session(spec)
+    results = [_measure(at, fake, "cold start")]
+    for name, section, action in scenarios(fake):
+        if only and section not in only:
+            continue
+        try:
+            action(at)
+        except StopIteration:
+            results.append({"name": name, "ms": 0.0, "queries": 0, "refresh_queries": 0, "errors": ["widget not found"]})
+            continue
+        results.append(_measure(at, fake, name))
+        progress(f"  {name}: {results[-1]['ms']:,.0f} ms, {results[-1]['queries']} queries")
+    limits = budgets(load_baseline() if baseline is None else baseline, spec, budget_scale)
+    for r in results:
+        budget_ms, budget_q = limits.get(r["name"], (None, None))
+        r["budget_ms"] = budget_ms
+        r["budget_queries"] = budget_q
+        r["ok"] = not r["errors"] and (budget_ms is None or (r["ms"] <= r["budget_ms"] and r["queries"] <= budget_q))
+    return results
+
+
+def write_baseline(spec, runs, path=BASELINE_PATH, progress=print):
+    """Runs the harness `runs` times (fresh processes) and stores the median times and the highest query counts."""
+    samples = {}
+    for i in range(runs):
+        progress(f"Baseline run {i + 1}/{runs}...")
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--spec", spec, "--json"],
+                             capture_output=True, text=True, cwd=ROOT).stdout
+        for r in json.loads(out)["results"]:
+            if r["errors"]:
+                raise SystemExit(f"{r['name']}: {'; '.join(r['errors'])}")
+            samples.setdefault(r["name"], []).append(r)
+    baseline = {"spec": spec, "runs": runs, "interactions": {
+        name: {"ms": round(statistics.median(r["ms"] for r in rs)), "queries": max(r["queries"] for r in rs)}
+        for name, rs in samples.items()}}
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+    return baseline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--spec", default=DEFAULT_SPEC, help=f"fake dataset spec (default: {DEFAULT_SPEC})")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="multiply the time budgets (slower machines)")
+    parser.add_argument("--only", help="comma-separated sections: core, dashboard, estimator, inventory, suppliers, staff, pnl, settings, search")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--write-baseline", action="store_true", help=f"record {os.path.basename(BASELINE_PATH)} for --spec instead of checking")
+    parser.add_argument("--runs", type=int, default=3, help="runs whose median is stored by --write-baseline")
+    args = parser.parse_args(argv)
+
+    if args.write_baseline:
+        baseline = write_baseline(args.spec, args.runs)
+        print(f"Wrote {BASELINE_PATH} ({len(baseline['interactions'])} interactions, {args.runs} runs)")
+        return 0
+
+    only = set(args.only.split(",")) if args.only else None
+    results = run(args.spec, only, args.budget_scale, progress=(lambda msg: None) if args.json else print)
+    if args.json:
+        print(json.dumps({"spec": args.spec, "results": results}, indent=2))
+    else:
+        print()
+        print(f"{'interaction':<30} {'ms':>9} {'budget':>9} {'queries':>8} {'budget':>7} {'refresh':>8}  result")
+        for r in results:
+            budget_ms = f"{r['budget_ms']:,.0f}" if r["budget_ms"] is not None else "-"
+            budget_q = r["budget_queries"] if r["budget_queries"] is not None else "-"
+            status = "ok" if r["ok"] else ("ERROR: " + "; ".join(r["errors"]) if r["errors"] else "OVER BUDGET")
+            print(f"{r['name']:<30} {r['ms']:>9,.0f} {budget_ms:>9} {r['queries']:>8} {budget_q:>7} {r['refresh_queries']:>8}  {status}")
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
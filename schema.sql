@@ -15,9 +15,65 @@ CREATE TABLE public.clients (
   next_action_date date,
   location text,
   assigned_staff jsonb DEFAULT '[]'::jsonb,
+  -- Denormalized estimate totals, written with internal_estimate (helpers.estimate_totals)
+  est_material_sell numeric,
+  est_base_cost numeric,
+  est_labor_cost numeric,
+  est_grand_total numeric,
+  est_profit numeric,
+  est_advance numeric,
+  -- Running total of the payments ledger, updated on each payment (utils/payments.py)
+  amount_paid numeric,
+  last_payment_at timestamp with time zone,
+  updated_at timestamp with time zone DEFAULT now(),
   CONSTRAINT clients_pkey PRIMARY KEY (id)
 );
 
+CREATE INDEX clients_est_grand_total_idx ON public.clients (est_grand_total DESC NULLS LAST);
+CREATE INDEX clients_est_profit_idx ON public.clients (est_profit DESC NULLS LAST);
+CREATE INDEX clients_status_created_at_idx ON public.clients (status, created_at DESC);
+CREATE INDEX clients_created_at_idx ON public.clients (created_at DESC);
+CREATE INDEX clients_updated_at_idx ON public.clients (updated_at);
+
+-- Keeps clients.updated_at current; the local analytics store syncs changed rows by it (utils/analytics.py)
+CREATE OR REPLACE FUNCTION public.set_updated_at() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  NEW.updated_at = now();
+  RETURN NEW;
+END;
+$$;
+CREATE TRIGGER clients_set_updated_at BEFORE UPDATE ON public.clients FOR EACH ROW EXECUTE FUNCTION public.set_updated_at();
+
+-- Estimate history: full snapshot on the first and every 20th revision, deltas otherwise (utils/revisions.py)
+CREATE TABLE public.estimate_revisions (
+  id bigint GENERATED ALWAYS AS IDENTITY NOT NULL,
+  client_id integer NOT NULL,
+  revision integer NOT NULL,
+  created_at timestamp with time zone DEFAULT now(),
+  created_by text,
+  snapshot jsonb,
+  delta jsonb,
+  summary text,
+  CONSTRAINT estimate_revisions_pkey PRIMARY KEY (id),
+  CONSTRAINT estimate_revisions_client_revision_key UNIQUE (client_id, revision),
+  CONSTRAINT estimate_revisions_client_id_fkey FOREIGN KEY (client_id) REFERENCES public.clients(id) ON DELETE CASCADE
+);
+
+-- Payment ledger: one row per advance / installment / settlement (utils/payments.py)
+CREATE TABLE public.payments (
+  id bigint GENERATED ALWAYS AS IDENTITY NOT NULL,
+  client_id integer NOT NULL,
+  amount numeric NOT NULL,
+  paid_on date DEFAULT CURRENT_DATE,
+  method text,
+  note text,
+  created_at timestamp with time zone DEFAULT now(),
+  created_by text,
+  CONSTRAINT payments_pkey PRIMARY KEY (id),
+  CONSTRAINT payments_client_id_fkey FOREIGN KEY (client_id) REFERENCES public.clients(id) ON DELETE CASCADE
+);
+CREATE INDEX payments_client_id_paid_on_idx ON public.payments (client_id, paid_on);
+
 CREATE TABLE public.inventory (
   id bigint GENERATED ALWAYS AS IDENTITY NOT NULL,
   item_name text NOT NULL,
@@ -28,6 +84,31 @@ CREATE TABLE public.inventory (
   CONSTRAINT inventory_pkey PRIMARY KEY (id)
 );
 
+-- Bill-of-materials kits: lines are [{"item_id", "qty", "unit"} | {"kit_id", "qty"}] (utils/kits.py)
+CREATE TABLE public.kits (
+  id bigint GENERATED ALWAYS AS IDENTITY NOT NULL,
+  name text NOT NULL,
+  lines jsonb NOT NULL DEFAULT '[]'::jsonb,
+  created_at timestamp with time zone DEFAULT now(),
+  CONSTRAINT kits_pkey PRIMARY KEY (id)
+);
+
+-- Monthly P&L rollups, refreshed per month on writes (utils/rollups.py)
+CREATE TABLE public.pl_monthly (
+  month text NOT NULL,
+  revenue numeric DEFAULT 0,
+  quoted numeric DEFAULT 0,
+  collected numeric DEFAULT 0,
+  est_cost numeric DEFAULT 0,
+  material_cost numeric DEFAULT 0,
+  labor_cost numeric DEFAULT 0,
+  profit numeric DEFAULT 0,
+  projects integer DEFAULT 0,
+  purchases numeric DEFAULT 0,
+  updated_at timestamp with time zone DEFAULT now(),
+  CONSTRAINT pl_monthly_pkey PRIMARY KEY (month)
+);
+
 CREATE TABLE public.purchase_log (
   id bigint GENERATED ALWAYS AS IDENTITY NOT NULL,
   created_at timestamp with time zone DEFAULT now(),
@@ -62,6 +143,20 @@ CREATE TABLE public.staff (
   CONSTRAINT staff_pkey PRIMARY KEY (id)
 );
 
+-- Staff assignment history with the daily wage at assignment time, for actual labor cost (utils/labor.py)
+CREATE TABLE public.staff_assignments (
+  id bigint GENERATED ALWAYS AS IDENTITY NOT NULL,
+  client_id integer NOT NULL,
+  staff_id bigint NOT NULL,
+  daily_wage numeric,
+  assigned_on date NOT NULL DEFAULT CURRENT_DATE,
+  released_on date,
+  created_at timestamp with time zone DEFAULT now(),
+  CONSTRAINT staff_assignments_pkey PRIMARY KEY (id),
+  CONSTRAINT staff_assignments_client_id_fkey FOREIGN KEY (client_id) REFERENCES public.clients(id) ON DELETE CASCADE
+);  -- no staff foreign key: the history (and its cost) outlives deleted staff
+CREATE INDEX staff_assignments_client_id_idx ON public.staff_assignments (client_id);
+
 CREATE TABLE public.staff_roles (
   role_name text NOT NULL,
   CONSTRAINT staff_roles_pkey PRIMARY KEY (role_name)
@@ -79,6 +174,7 @@ CREATE TABLE public.supplier_purchases (
   CONSTRAINT supplier_purchases_pkey PRIMARY KEY (id),
   CONSTRAINT supplier_purchases_supplier_id_fkey FOREIGN KEY (supplier_id) REFERENCES public.suppliers(id)
 );
+CREATE INDEX supplier_purchases_purchase_date_idx ON public.supplier_purchases (purchase_date);
 
 CREATE TABLE public.suppliers (
   id bigint GENERATED ALWAYS AS IDENTITY NOT NULL,
@@ -98,3 +194,30 @@ CREATE TABLE public.users (
 
 -- Default Roles
 INSERT INTO staff_roles (role_name) VALUES ('Manager'), ('Technician'), ('Helper') ON CONFLICT DO NOTHING;
+
+-- Dashboard header aggregates in one call (utils/aggregates.py has the Python equivalent)
+CREATE OR REPLACE FUNCTION public.dashboard_summary(recent_n integer DEFAULT 5, top_n integer DEFAULT 5)
+RETURNS jsonb LANGUAGE sql STABLE AS $$
+  SELECT jsonb_build_object(
+    'status_counts', COALESCE((SELECT jsonb_object_agg(COALESCE(status, ''), n) FROM (SELECT status, count(*) AS n FROM public.clients GROUP BY status) s), '{}'::jsonb),
+    'recent', COALESCE((SELECT jsonb_agg(r) FROM (SELECT id, name, status, created_at FROM public.clients ORDER BY created_at DESC NULLS LAST LIMIT recent_n) r), '[]'::jsonb),
+    'top_value', COALESCE((SELECT jsonb_agg(t) FROM (SELECT id, name, est_grand_total FROM public.clients WHERE est_grand_total IS NOT NULL ORDER BY est_grand_total DESC LIMIT top_n) t), '[]'::jsonb)
+  );
+$$;
+
+-- Ledger insert and running-total update in one transaction (utils/payments.record_payment)
+CREATE OR REPLACE FUNCTION public.record_payment(p_client_id integer, p_amount numeric, p_paid_on date DEFAULT CURRENT_DATE, p_method text DEFAULT NULL, p_note text DEFAULT NULL, p_created_by text DEFAULT NULL)
+RETURNS numeric LANGUAGE plpgsql AS $$
+DECLARE
+  new_paid numeric;
+BEGIN
+  INSERT INTO public.payments (client_id, amount, paid_on, method, note, created_by)
+  VALUES (p_client_id, p_amount, p_paid_on, p_method, p_note, p_created_by);
+  UPDATE public.clients
+     SET amount_paid = COALESCE(amount_paid, final_settlement_amount, 0) + p_amount,
+         last_payment_at = now()
+   WHERE id = p_client_id
+  RETURNING amount_paid INTO new_paid;
+  RETURN new_paid;
+END;
+$$;
@@ -0,0 +1,55 @@
+"""
+Aggregate queries that run server-side in production.
+
+Each function here mirrors a SQL function in schema.sql and is used as the
+fallback when the RPC is unavailable (and by the local fake backend), so
+both paths return the same shape.
+"""
+from utils import connection, rollups
+
+
+def summarize_clients(rows, recent_n=5, top_n=5):
+    """
+    Python equivalent of the `dashboard_summary` SQL function.
+
+    Args:
+        rows (list): `clients` rows with at least id, name, status, created_at, est_grand_total.
+        recent_n (int): Number of most recently created clients to return.
+        top_n (int): Number of clients with the highest stored estimate value to return.
+
+    Returns:
+        dict: {"status_counts": {status: count}, "recent": [...], "top_value": [...]}
+    """
+    counts = {}
+    for r in rows:
+        status = r.get('status') or ""
+        counts[status] = counts.get(status, 0) + 1
+    recent = sorted((r for r in rows if r.get('created_at')), key=lambda r: r['created_at'], reverse=True)[:recent_n]
+    valued = [r for r in rows if r.get('est_grand_total') is not None]
+    top = sorted(valued, key=lambda r: float(r['est_grand_total']), reverse=True)[:top_n]
+    return {
+        "status_counts": counts,
+        "recent": [{"id": r['id'], "name": r.get('name'), "status": r.get('status'), "created_at": r.get('created_at')} for r in recent],
+        "top_value": [{"id": r['id'], "name": r.get('name'), "est_grand_total": float(r['est_grand_total'])} for r in top],
+    }
+
+
+def dashboard_summary(supabase, recent_n=5, top_n=5):
+    """
+    Dashboard header aggregates in one round-trip.
+
+    Calls the `dashboard_summary` RPC; only if it is not deployed does it fall
+    back to a narrow, paged select (no estimate JSON) summarized locally. Other
+    errors (timeouts, permissions) are raised, so the cached summary is kept
+    instead of being replaced by a partial one.
+    """
+    try:
+        res = supabase.rpc("dashboard_summary", {"recent_n": recent_n, "top_n": top_n}).execute()
+        if res is not None and isinstance(res.data, dict):
+            return res.data
+    except Exception as e:
+        if not connection.function_missing(e):
+            raise
+        print(f"dashboard_summary SQL function not deployed, summarizing locally: {e}")
+    rows = rollups.select_all(lambda: supabase.table("clients").select("id, name, status, created_at, est_grand_total"))
+    return summarize_clients(rows, recent_n, top_n)
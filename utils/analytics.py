@@ -0,0 +1,306 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl  # one refreshing process per analytics directory
+except ImportError:  # Windows: refreshes are not coordinated across processes
+    fcntl = None
+
+# ---------------------------
+# LOCAL ANALYTICS STORE
+# ---------------------------
+# Optional columnar copy of the reporting columns of `clients`,
+# `supplier_purchases` and `suppliers`, kept as Parquet files on local disk
+# and queried with an in-memory DuckDB connection. The P&L and Suppliers
+# tabs use it (when enabled) instead of downloading whole tables into every
+# Streamlit process and aggregating them with pandas.
+#
+# Parquet files are written to a per-process temp file and replaced
+# atomically, so several workers on one host can read while one refreshes;
+# a lock file lets only one process refresh at a time (the others keep
+# serving the current files). Refreshes are incremental: purchases are
+# append-only (synced by id) and clients are synced by `updated_at`, with an
+# id-only pass to drop deleted clients. The watermark is inclusive (rows
+# sharing the last seen timestamp are fetched again and replaced by id), so
+# rows committed with the same `updated_at` after a sync are not missed.
+#
+# Enabled by the ANALYTICS_DIR secret or the JUGNOO_ANALYTICS_DIR
+# environment variable; requires the optional `duckdb` package.
+
+DEFAULT_ANALYTICS_DIR = os.path.join(".cache", "analytics")
+ANALYTICS_DIR_ENV = "JUGNOO_ANALYTICS_DIR"
+PAGE_SIZE = 1000
+
+# table -> (columns with DuckDB types, watermark column or None for a full copy, sync deletes)
+TABLES = {
+    "clients": ([("id", "BIGINT"), ("name", "VARCHAR"), ("status", "VARCHAR"), ("created_at", "VARCHAR"), ("updated_at", "VARCHAR"),
+                 ("est_grand_total", "DOUBLE"), ("est_base_cost", "DOUBLE"), ("est_labor_cost", "DOUBLE"),
+                 ("amount_paid", "DOUBLE"), ("final_settlement_amount", "DOUBLE")], "updated_at", True),
+    "supplier_purchases": ([("id", "BIGINT"), ("supplier_id", "BIGINT"), ("item_name", "VARCHAR"), ("quantity", "DOUBLE"),
+                            ("cost", "DOUBLE"), ("purchase_date", "VARCHAR")], "id", False),
+    "suppliers": ([("id", "BIGINT"), ("name", "VARCHAR")], None, False),
+}
+
+# Same revenue rule as rollups.project_pl: the amount collected, else the quoted total.
+# Costs come only from the stored total columns; rows saved before those existed
+# (has_totals false) are counted by legacy_projects() and served by rollups.project_table.
+_PROJECTS_SQL = """
+    SELECT id, name, created_at, substr(created_at, 1, 7) AS month,
+           COALESCE(amount_paid, final_settlement_amount, 0) AS collected,
+           COALESCE(est_grand_total, 0) AS quoted,
+           CASE WHEN COALESCE(amount_paid, final_settlement_amount, 0) <> 0 THEN COALESCE(amount_paid, final_settlement_amount)
+                ELSE COALESCE(est_grand_total, 0) END AS revenue,
+           COALESCE(est_base_cost, 0) AS est_cost,
+           COALESCE(est_labor_cost, 0) AS labor_cost,
+           est_grand_total IS NOT NULL AS has_totals
+    FROM clients WHERE status IN ('Work Done', 'Closed')
+"""
+
+
+class AnalyticsStore:
+    """Parquet files under `path`, one per mirrored table, plus a small sync-state file."""
+
+    def __init__(self, path=DEFAULT_ANALYTICS_DIR):
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("AnalyticsStore requires the 'duckdb' package (pip install duckdb)") from e
+        self._duckdb = duckdb
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._state_path = os.path.join(path, "sync_state.json")
+        self._refresher = None
+
+    # --- SYNC ---
+    def _file(self, table):
+        return os.path.join(self.path, f"{table}.parquet")
+
+    def _tmp(self, target):
+        return f"{target}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+
+    @contextmanager
+    def _sync_lock(self, blocking=False):
+        """Cross-process lock on `sync.lock`; yields False when another process is refreshing."""
+        if fcntl is None:
+            yield True
+            return
+        with open(os.path.join(self.path, "sync.lock"), "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                held = False
+            else:
+                held = True
+            try:
+                yield held
+            finally:
+                if held: fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load_state(self):
+        try:
+            with open(self._state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state):
+        tmp = self._tmp(self._state_path)
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self._state_path)
+
+    def _fetch(self, supabase, table, columns, watermark=None, since=None):
+        """All rows of `table` (newer than `since` on `watermark`), paged."""
+        rows, start = [], 0
+        while True:
+            q = supabase.table(table).select(", ".join(columns))
+            if watermark and since is not None:
+                q = q.gte(watermark, since)
+            res = q.order(watermark or "id").range(start, start + PAGE_SIZE - 1).execute()
+            page = res.data if res and res.data else []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            start += PAGE_SIZE
+
+    def _write(self, con, table, select_sql):
+        target = self._file(table)
+        tmp = self._tmp(target)
+        try:
+            con.execute(f"COPY ({select_sql}) TO '{tmp}' (FORMAT PARQUET)")
+            os.replace(tmp, target)
+        finally:
+            if os.path.exists(tmp): os.remove(tmp)
+
+    def _sync_table(self, supabase, table, state):
+        import pandas as pd
+        columns, watermark, sync_deletes = TABLES[table]
+        names = [c for c, _ in columns]
+        exists = os.path.exists(self._file(table))
+        since = state.get(table) if exists and watermark else None
+        rows = self._fetch(supabase, table, names, watermark, since)
+        con = self._duckdb.connect()
+        typed = ", ".join(f'TRY_CAST("{c}" AS {t}) AS "{c}"' for c, t in columns)
+        if rows:
+            delta = pd.DataFrame(rows, columns=names).astype(object).where(lambda d: d.notna(), None)
+            con.register("delta", delta)
+            if since is None:
+                self._write(con, table, f"SELECT {typed} FROM delta")
+            else:
+                self._write(con, table, f"SELECT * FROM read_parquet('{self._file(table)}') WHERE id NOT IN (SELECT TRY_CAST(id AS BIGINT) FROM delta) "
+                                        f"UNION ALL BY NAME SELECT {typed} FROM delta")
+            marks = [r[watermark] for r in rows if r.get(watermark) is not None] if watermark else []
+            if marks:
+                state[table] = max(marks)
+        elif not exists:
+            empty = pd.DataFrame({c: pd.Series(dtype=object) for c in names})
+            con.register("delta", empty)
+            self._write(con, table, f"SELECT {typed} FROM delta")
+        if sync_deletes and since is not None:
+            ids = pd.DataFrame({"id": [r["id"] for r in self._fetch(supabase, table, ["id"])]}, dtype="int64")
+            con.register("live_ids", ids)
+            stale = con.execute(f"SELECT count(*) FROM read_parquet('{self._file(table)}') WHERE id NOT IN (SELECT id FROM live_ids)").fetchone()[0]
+            if stale:
+                self._write(con, table, f"SELECT * FROM read_parquet('{self._file(table)}') WHERE id IN (SELECT id FROM live_ids)")
+        con.close()
+        return len(rows)
+
+    def refresh(self, supabase, min_interval=60, force=False):
+        """
+        Brings the local copy up to date, at most once per `min_interval` seconds.
+
+        Returns:
+            bool: True if the store can answer queries (False if the first sync failed).
+        """
+        # Without local files yet, wait for the process doing the first sync instead of failing
+        with self._lock, self._sync_lock(blocking=not self.ready()) as held:
+            if not held:  # another process is refreshing; serve the current files
+                return self.ready()
+            state = self._load_state()
+            if not force and time.time() - state.get("_synced_at", 0) < min_interval and self.ready():
+                return True
+            try:
+                for table in TABLES:
+                    self._sync_table(supabase, table, state)
+                state["_synced_at"] = time.time()
+                self._save_state(state)
+            except Exception as e:
+                print(f"Analytics refresh failed: {e}")
+            return self.ready()
+
+    def refresh_in_background(self, supabase, min_interval=60, force=False):
+        """
+        Starts refresh() in a background thread (one at a time) so script runs never wait on a sync.
+
+        Returns:
+            bool: True if the store can answer queries now (with the files of the last sync).
+        """
+        if not force and time.time() - self._load_state().get("_synced_at", 0) < min_interval and self.ready():
+            return True
+        with _store_lock:
+            if self._refresher is None or not self._refresher.is_alive():
+                self._refresher = threading.Thread(target=self.refresh, args=(supabase, min_interval, force),
+                                                   name="analytics-refresh", daemon=True)
+                self._refresher.start()
+        return self.ready()
+
+    def ready(self):
+        return all(os.path.exists(self._file(t)) for t in TABLES)
+
+    # --- QUERIES ---
+    def _query(self, sql, params=None):
+        con = self._duckdb.connect()
+        try:
+            for t in TABLES:
+                con.execute(f"CREATE VIEW {t} AS SELECT * FROM read_parquet('{self._file(t)}')")
+            return con.execute(sql, params or []).df()
+        finally:
+            con.close()
+
+    def total_collected(self):
+        """Cash collected from all clients (payments ledger running totals)."""
+        df = self._query("SELECT COALESCE(SUM(COALESCE(amount_paid, final_settlement_amount, 0)), 0) AS total FROM clients")
+        return float(df["total"].iloc[0])
+
+    def legacy_projects(self):
+        """Completed projects without stored estimate totals (their cost needs the estimate JSON)."""
+        return int(self._query(f"SELECT count(*) AS n FROM ({_PROJECTS_SQL}) p WHERE NOT has_totals")["n"].iloc[0])
+
+    def client_profitability(self):
+        """Per completed project: client_id, Client, Revenue, Cost, Profit, Material Cost, Labor Cost, created_at (oldest first)."""
+        return self._query(f"""
+            SELECT id AS client_id, name AS "Client", revenue AS "Revenue", est_cost AS "Cost",
+                   CASE WHEN has_totals THEN revenue - est_cost ELSE 0 END AS "Profit",
+                   est_cost - labor_cost AS "Material Cost", labor_cost AS "Labor Cost", created_at
+            FROM ({_PROJECTS_SQL}) p ORDER BY created_at
+        """)
+
+    def monthly_rollups(self):
+        """Rows in the `pl_monthly` layout (see utils/rollups.py), oldest month first."""
+        df = self._query(f"""
+            WITH p AS (
+                SELECT month, SUM(revenue) AS revenue, SUM(quoted) AS quoted, SUM(collected) AS collected,
+                       SUM(est_cost) AS est_cost, SUM(est_cost - labor_cost) AS material_cost, SUM(labor_cost) AS labor_cost,
+                       SUM(CASE WHEN has_totals THEN revenue - est_cost ELSE 0 END) AS profit, COUNT(*) AS projects
+                FROM ({_PROJECTS_SQL}) x WHERE month IS NOT NULL GROUP BY month
+            ), s AS (
+                SELECT substr(purchase_date, 1, 7) AS month, SUM(COALESCE(cost, 0)) AS purchases
+                FROM supplier_purchases WHERE purchase_date IS NOT NULL GROUP BY 1
+            )
+            SELECT COALESCE(p.month, s.month) AS month,
+                   COALESCE(revenue, 0) AS revenue, COALESCE(quoted, 0) AS quoted, COALESCE(collected, 0) AS collected,
+                   COALESCE(est_cost, 0) AS est_cost, COALESCE(material_cost, 0) AS material_cost, COALESCE(labor_cost, 0) AS labor_cost,
+                   COALESCE(profit, 0) AS profit, COALESCE(projects, 0) AS projects, COALESCE(purchases, 0) AS purchases
+            FROM p FULL OUTER JOIN s ON p.month = s.month ORDER BY 1
+        """)
+        return df.to_dict("records")
+
+    def supplier_spend(self, top_n=5):
+        """
+        Returns:
+            tuple: (total spend, DataFrame of the top suppliers with supplier_name and cost).
+        """
+        total = float(self._query("SELECT COALESCE(SUM(cost), 0) AS total FROM supplier_purchases")["total"].iloc[0])
+        top = self._query("""
+            SELECT s.name AS supplier_name, SUM(COALESCE(p.cost, 0)) AS cost
+            FROM supplier_purchases p JOIN suppliers s ON s.id = p.supplier_id
+            GROUP BY s.name ORDER BY cost DESC LIMIT ?
+        """, [top_n])
+        return total, top
+
+
+# --- STORE FRONT ---
+_store = None
+_configured = False
+_store_lock = threading.Lock()
+
+
+def configure(path=None):
+    """Enable the store at `path` (or JUGNOO_ANALYTICS_DIR). Leaves it disabled if unset or duckdb is missing."""
+    global _store, _configured
+    with _store_lock:
+        _configured = True
+        path = path or os.environ.get(ANALYTICS_DIR_ENV)
+        if not path:
+            _store = None
+            return None
+        try:
+            _store = AnalyticsStore(path)
+        except Exception as e:
+            print(f"Analytics store unavailable ({e}); reporting reads Supabase directly.")
+            _store = None
+    return _store
+
+
+def is_configured():
+    return _configured
+
+
+def get_store():
+    """The configured AnalyticsStore, or None when disabled."""
+    return _store
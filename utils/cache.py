@@ -0,0 +1,467 @@
+import functools
+import inspect
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+
+# ---------------------------
+# SHARED DATA CACHE
+# ---------------------------
+# Replaces the per-process st.cache_data on the data functions in app.py.
+# Entries live in a shared store (SQLite file by default, Redis optional) so
+# every Streamlit worker behind the load balancer reads the same copy and a
+# restarted worker starts warm. A small in-process layer avoids decoding the
+# same blob on every rerun; it is keyed by the entry version so a clear() in
+# one worker invalidates the others. Versions are unique across workers and
+# restarts (time_ns plus a random offset), not per-key counters, so an entry
+# written again after a clear() never reuses a version a worker still holds.
+#
+# Expired entries are kept for MAX_STALE_SECONDS (stale-while-revalidate).
+# Within `stale_ttl` after expiry the old value is returned at once and
+# refreshed in a background thread. When a refresh fails (backend down or
+# slow), the last stored value is served, and stale_reads() reports it.
+# Entries removed by clear() are never served stale, so writes stay visible.
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "jugnoo_cache.sqlite3")
+CACHE_URL_ENV = "JUGNOO_CACHE_URL"
+MAX_STALE_SECONDS = 86400
+_RAISE = object()
+
+
+class CachedResponse:
+    """Stand-in for a Supabase APIResponse rebuilt from the cache (only `.data` is used by the app)."""
+    __slots__ = ("data", "count")
+
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+# --- SERIALIZATION ---
+def _columnar(records):
+    """Return records as {'c': columns, 'v': column values} if every row has the same keys, else None."""
+    if not records or not all(isinstance(r, dict) for r in records):
+        return None
+    cols = list(records[0].keys())
+    col_set = set(cols)
+    if any(set(r.keys()) != col_set for r in records):
+        return None
+    return {"c": cols, "v": [[r[c] for r in records] for c in cols]}
+
+
+def _rows(columnar):
+    cols, values = columnar["c"], columnar["v"]
+    if not cols:
+        return []
+    return [dict(zip(cols, row)) for row in zip(*values)]
+
+
+def encode(value):
+    """
+    Serialize a data-function result into a compressed blob.
+
+    Record lists (Supabase responses, DataFrames) are stored column-wise so
+    repeated keys are written once per column instead of once per row.
+    """
+    if hasattr(value, "data") and not isinstance(value, dict):
+        records = value.data
+        col = _columnar(records) if isinstance(records, list) else None
+        payload = {"k": "response", "col": col} if col else {"k": "response", "raw": records}
+    elif type(value).__name__ == "DataFrame":
+        payload = {"k": "frame", "col": {"c": [str(c) for c in value.columns], "v": [value[c].tolist() for c in value.columns]}}
+    elif isinstance(value, list) and _columnar(value):
+        payload = {"k": "records", "col": _columnar(value)}
+    else:
+        payload = {"k": "json", "raw": value}
+    return zlib.compress(json.dumps(payload, default=str, separators=(",", ":")).encode("utf-8"))
+
+
+def decode(blob):
+    """Inverse of encode()."""
+    payload = json.loads(zlib.decompress(blob).decode("utf-8"))
+    kind = payload["k"]
+    if kind == "response":
+        return CachedResponse(_rows(payload["col"]) if payload.get("col") else payload.get("raw"))
+    if kind == "frame":
+        import pandas as pd
+        return pd.DataFrame(dict(zip(payload["col"]["c"], payload["col"]["v"])), columns=payload["col"]["c"])
+    if kind == "records":
+        return _rows(payload["col"])
+    return payload.get("raw")
+
+
+# --- BACKENDS ---
+def new_version():
+    """A version no other write of any key, in any worker, will reuse (fits a 64-bit integer)."""
+    return time.time_ns() + random.getrandbits(30)
+
+
+class MemoryBackend:
+    """Process-local store. Used when no shared store is reachable."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    def meta(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return (entry[1], entry[2]) if entry else None
+
+    def get(self, key):
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key, blob, ttl):
+        with self._lock:
+            self._counter += 1
+            self._data[key] = (blob, self._counter, time.time() + ttl)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for k in [k for k in self._data if k == prefix or k.startswith(prefix + ":")]:
+                del self._data[k]
+
+
+class SQLiteBackend:
+    """On-disk store shared by all workers on the same host (WAL mode allows concurrent readers)."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, version INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            self._local.conn = conn
+        return conn
+
+    def meta(self, key):
+        return self._conn().execute("SELECT version, expires_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+
+    def get(self, key):
+        return self._conn().execute("SELECT value, version, expires_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+
+    def set(self, key, blob, ttl):
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO cache_entries (key, value, version, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, version = excluded.version, expires_at = excluded.expires_at",
+            (key, sqlite3.Binary(blob), new_version(), time.time() + ttl),
+        )
+        conn.commit()
+
+    def delete_prefix(self, prefix):
+        conn = self._conn()
+        conn.execute("DELETE FROM cache_entries WHERE key = ? OR key LIKE ?", (prefix, prefix + ":%"))
+        conn.commit()
+
+
+class RedisBackend:
+    """Shared store for workers on different hosts. Requires the optional `redis` package."""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("RedisBackend requires the 'redis' package (pip install redis)") from e
+        self.client = redis.Redis.from_url(url)
+        self.prefix = "jugnoo:cache:"
+
+    def meta(self, key):
+        res = self.client.hmget(self.prefix + key, "version", "expires_at")
+        if res[0] is None:
+            return None
+        return int(res[0]), float(res[1])
+
+    def get(self, key):
+        res = self.client.hmget(self.prefix + key, "value", "version", "expires_at")
+        if res[0] is None:
+            return None
+        return res[0], int(res[1]), float(res[2])
+
+    def set(self, key, blob, ttl):
+        name = self.prefix + key
+        pipe = self.client.pipeline()
+        pipe.hset(name, mapping={"value": blob, "version": new_version(), "expires_at": time.time() + ttl})
+        pipe.expire(name, int(ttl) + MAX_STALE_SECONDS)
+        pipe.execute()
+
+    def delete_prefix(self, prefix):
+        keys = [self.prefix + prefix] + list(self.client.scan_iter(self.prefix + prefix + ":*"))
+        self.client.delete(*keys)
+
+
+def backend_from_url(url):
+    """
+    Build a backend from a URL.
+
+    Accepts `redis://...`, `rediss://...`, `sqlite:///path/to/file`, `memory`,
+    or a plain file path (treated as SQLite).
+    """
+    if not url:
+        return SQLiteBackend(DEFAULT_CACHE_PATH)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    if url == "memory":
+        return MemoryBackend()
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    return SQLiteBackend(url)
+
+
+# --- CACHE FRONT ---
+_backend = None
+_backend_lock = threading.Lock()
+_local = {}  # key -> (version, value): decoded copies to skip decompression on unchanged entries
+_registry = {}
+_warmed = False
+_refreshing = set()  # keys being revalidated in the background
+_refresh_lock = threading.Lock()
+_failing = {}  # key -> error of the last failed refresh
+_stale = threading.local()  # stale values served to the current script thread
+
+
+def configure(url=None):
+    """Select the shared backend. Falls back to an in-process store if the configured one cannot be opened."""
+    global _backend
+    with _backend_lock:
+        try:
+            _backend = backend_from_url(url or os.environ.get(CACHE_URL_ENV))
+        except Exception as e:
+            print(f"Shared cache unavailable ({e}); using in-process cache.")
+            _backend = MemoryBackend()
+        _local.clear()
+    return _backend
+
+
+def is_configured():
+    return _backend is not None
+
+
+def get_backend():
+    if _backend is None:
+        configure()
+    return _backend
+
+
+def _ttl_seconds(ttl):
+    if isinstance(ttl, str):
+        units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+        return float(ttl[:-1]) * units[ttl[-1]] if ttl[-1] in units else float(ttl)
+    return float(ttl)
+
+
+def _load(key, meta):
+    cached = _local.get(key)
+    if cached and cached[0] == meta[0]:
+        return True, cached[1]
+    row = get_backend().get(key)
+    if not row:
+        return False, None
+    value = decode(bytes(row[0]))
+    _local[key] = (row[1], value)
+    return True, value
+
+
+def lookup(key, allow_stale=False):
+    """
+    Return (hit, value) for a fresh entry, or (hit, value, expired_seconds)
+    with `allow_stale`, which also returns entries that have expired.
+    """
+    try:
+        meta = get_backend().meta(key)
+    except Exception:
+        meta = None
+    expired = time.time() - meta[1] if meta else 0.0
+    if not meta or (expired > 0 and not allow_stale) or expired > MAX_STALE_SECONDS:
+        return (False, None, 0.0) if allow_stale else (False, None)
+    try:
+        hit, value = _load(key, meta)
+    except Exception:
+        hit, value = False, None
+    return (hit, value, max(expired, 0.0)) if allow_stale else (hit, value)
+
+
+def _note_stale(key, expired_s, error):
+    if not hasattr(_stale, "reads"):
+        _stale.reads = {}
+    _stale.reads[key] = {"key": key, "expired_s": expired_s, "error": error}
+
+
+def reset_stale_reads():
+    """Called at the top of a rerun; stale_reads() then reports only this run's reads."""
+    _stale.reads = {}
+
+
+def stale_reads():
+    """
+    Returns:
+        list: Dicts with key, expired_s and error for the cached values this
+        thread served because the backend could not refresh them.
+    """
+    return list(getattr(_stale, "reads", {}).values())
+
+
+def store(key, value, ttl):
+    backend = get_backend()
+    try:
+        backend.set(key, encode(value), ttl)
+    except Exception as e:
+        print(f"Cache write failed for {key}: {e}")
+
+
+def invalidate(name):
+    """Drop every entry of a data function (in all workers)."""
+    try:
+        get_backend().delete_prefix(name)
+    except Exception as e:
+        print(f"Cache invalidation failed for {name}: {e}")
+    for k in [k for k in _local if k == name or k.startswith(name + ":")]:
+        _local.pop(k, None)
+    for k in [k for k in _failing if k == name or k.startswith(name + ":")]:
+        _failing.pop(k, None)
+
+
+def patch(key, fn):
+    """
+    Rewrites a stored entry with fn(value), keeping its expiry, e.g. to show
+    a queued write before it reaches the backend. Missing entries are skipped.
+    """
+    backend = get_backend()
+    try:
+        row = backend.get(key)
+        if not row:
+            return
+        value = fn(decode(bytes(row[0])))
+        if value is not None:
+            backend.set(key, encode(value), row[2] - time.time())
+    except Exception as e:
+        print(f"Cache patch failed for {key}: {e}")
+
+
+def _revalidate(key, fn, args, ttl_s):
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            value = fn(*args)
+            if value is None:
+                raise RuntimeError("no data")
+            store(key, value, ttl_s)
+            _failing.pop(key, None)
+        except Exception as e:
+            _failing[key] = f"{type(e).__name__}: {e}"
+            print(f"Cache refresh failed for {key}: {e}")
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=run, name=f"cache-refresh:{key}", daemon=True).start()
+
+
+def shared_cache(ttl=300, name=None, stale_ttl=None, default=_RAISE):
+    """
+    Decorator for data functions, used in place of @st.cache_data.
+
+    The wrapped function keeps the `.clear()` method the app already calls
+    after writes. `None` results (failed queries) are not cached.
+
+    Args:
+        ttl: Freshness in seconds (or "30s", "5m", "1h").
+        name (str): Cache key prefix (defaults to the function name).
+        stale_ttl: How long after expiry the old value is served while it is
+            refreshed in the background (defaults to `ttl`; 0 refreshes inline).
+        default: Returned when the query fails and nothing is cached. Without
+            it the error is raised.
+    """
+    ttl_s = _ttl_seconds(ttl)
+    stale_s = ttl_s if stale_ttl is None else _ttl_seconds(stale_ttl)
+
+    def decorator(fn):
+        base_key = name or fn.__name__
+
+        def key_for(args):
+            return base_key + (":" + json.dumps(args, default=str) if args else "")
+
+        @functools.wraps(fn)
+        def wrapper(*args):
+            key = key_for(args)
+            hit, value, expired_s = lookup(key, allow_stale=True)
+            if hit and expired_s <= 0:
+                return value
+            if hit and (expired_s <= stale_s or key in _failing):
+                # Serve the old value now; while refreshes keep failing it is reported as stale
+                if key in _failing:
+                    _note_stale(key, expired_s, _failing[key])
+                _revalidate(key, fn, args, ttl_s)
+                return value
+            try:
+                fresh = fn(*args)
+                error = None if fresh is not None else "no data"
+            except Exception as e:
+                fresh, error = None, f"{type(e).__name__}: {e}"
+                if not hit and default is _RAISE:
+                    raise
+            if fresh is not None:
+                store(key, fresh, ttl_s)
+                _failing.pop(key, None)
+                return fresh
+            if hit:
+                _failing[key] = error
+                _note_stale(key, expired_s, error)
+                return value
+            return None if default is _RAISE else default
+
+        wrapper.clear = lambda: invalidate(base_key)
+        wrapper.patch = lambda patch_fn, *args: patch(key_for(args), patch_fn)
+        wrapper.cache_key = base_key
+        _registry[base_key] = wrapper
+        return wrapper
+
+    return decorator
+
+
+def warm_start(background=True):
+    """
+    Fill the shared cache for all registered no-argument data functions, once per process.
+
+    Entries already in the shared store are only loaded into the in-process
+    layer, so a new worker against a warm store makes no backend queries.
+    """
+    global _warmed
+    if _warmed:
+        return
+    _warmed = True
+    funcs = [fn for fn in _registry.values() if not inspect.signature(fn).parameters]
+
+    def run():
+        for fn in funcs:
+            try:
+                fn()
+            except Exception as e:
+                print(f"Warm start failed for {fn.cache_key}: {e}")
+
+    if background:
+        threading.Thread(target=run, name="cache-warm-start", daemon=True).start()
+    else:
+        run()
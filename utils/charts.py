@@ -0,0 +1,225 @@
+"""
+Chart datasets and figure specs for the P&L tab.
+
+Each chart is built from a small aggregated dataset and cached per process
+under (chart name, data version), so reruns on unchanged data reuse the
+finished Plotly figure or Vega-Lite spec instead of rebuilding it. Long
+per-project series are downsampled before they are embedded in a spec.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import altair as alt
+import pandas as pd
+import plotly.graph_objects as go
+
+MAX_LINE_POINTS = 500
+MAX_SCATTER_POINTS = 1500
+SPEC_CACHE_SIZE = 64
+
+_specs = OrderedDict()
+_lock = threading.Lock()
+
+
+# --- VERSIONING & CACHE ---
+def data_version(*parts):
+    """
+    Short hash identifying the data behind a chart.
+
+    DataFrames are hashed by content (pandas row hashes), other values by their JSON form.
+    """
+    h = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            h.update(",".join(map(str, part.columns)).encode("utf-8"))
+            if not part.empty:
+                h.update(pd.util.hash_pandas_object(part, index=False).values.tobytes())
+        else:
+            h.update(json.dumps(part, default=str, sort_keys=True).encode("utf-8"))
+        h.update(b"|")
+    return h.hexdigest()
+
+
+def cached_spec(name, version, build):
+    """
+    Returns the figure/spec built by `build()` for (name, version), building it only once.
+
+    Args:
+        name (str): Chart identifier.
+        version (str): data_version() of the chart's inputs.
+        build (callable): Zero-argument function returning the figure or spec.
+    """
+    key = (name, version)
+    with _lock:
+        if key in _specs:
+            _specs.move_to_end(key)
+            return _specs[key]
+    spec = build()
+    with _lock:
+        _specs[key] = spec
+        while len(_specs) > SPEC_CACHE_SIZE:
+            _specs.popitem(last=False)
+    return spec
+
+
+# --- DOWNSAMPLING ---
+def lttb_indices(ys, max_points):
+    """
+    Largest-Triangle-Three-Buckets selection over an evenly spaced series.
+
+    Keeps the first and last point and, per bucket, the point forming the
+    largest triangle with its neighbours, so peaks and dips survive.
+
+    Returns:
+        list: Indices of the points to keep, ascending.
+    """
+    n = len(ys)
+    if max_points >= n or max_points < 3:
+        return list(range(n))
+    keep = [0]
+    bucket = (n - 2) / (max_points - 2)
+    a = 0
+    for i in range(max_points - 2):
+        start, end = int(i * bucket) + 1, int((i + 1) * bucket) + 1
+        nxt_start, nxt_end = end, min(int((i + 2) * bucket) + 1, n)
+        avg_x = (nxt_start + nxt_end - 1) / 2.0
+        avg_y = sum(ys[nxt_start:nxt_end]) / max(nxt_end - nxt_start, 1)
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((a - avg_x) * (ys[j] - ys[a]) - (a - j) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        keep.append(best)
+        a = best
+    keep.append(n - 1)
+    return keep
+
+
+def downsample_line(df, y, max_points=MAX_LINE_POINTS):
+    """Rows of an ordered DataFrame reduced to `max_points` with LTTB on column `y`."""
+    if len(df) <= max_points:
+        return df
+    return df.iloc[lttb_indices(df[y].astype(float).tolist(), max_points)]
+
+
+def thin_scatter(df, x, y, max_points=MAX_SCATTER_POINTS):
+    """
+    Scatter rows reduced to about `max_points`: the extremes of both axes are
+    always kept, the rest is an even stride over the remaining rows.
+    """
+    if len(df) <= max_points:
+        return df
+    k = max(max_points // 20, 1)
+    extremes = set(df[x].nlargest(k).index) | set(df[x].nsmallest(k).index) | set(df[y].nlargest(k).index) | set(df[y].nsmallest(k).index)
+    rest = df.drop(index=list(extremes))
+    step = max(-(-len(rest) // max(max_points - len(extremes), 1)), 1)
+    return pd.concat([df.loc[list(extremes)], rest.iloc[::step]]).sort_index()
+
+
+# --- FIGURES ---
+def comparison_figure(quoted, collected, expenses):
+    fig = go.Figure(data=[
+        go.Bar(name='Quoted Total', x=['Quoted Total'], y=[quoted], marker_color='#3498db'),
+        go.Bar(name='Collected', x=['Collected'], y=[collected], marker_color='#2ecc71'),
+        go.Bar(name='Total Expenses', x=['Total Expenses'], y=[expenses], marker_color='#e74c3c')
+    ])
+    fig.update_layout(
+        margin=dict(t=0, b=0, l=0, r=0),
+        height=300,
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        showlegend=True,
+        yaxis=dict(title="Amount (₹)"),
+        barmode='group'
+    )
+    return fig
+
+
+def cost_split_figure(material, labor):
+    fig = go.Figure(data=[go.Pie(
+        labels=['Material (Log)', 'Labor (Est)'],
+        values=[material, labor],
+        hole=.4,
+        marker_colors=['#FF9800', '#9C27B0']
+    )])
+    fig.update_layout(
+        margin=dict(t=0, b=0, l=0, r=0),
+        height=300,
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        showlegend=True,
+        legend=dict(title="Category", orientation="v", yanchor="middle", y=0.5, xanchor="left", x=1.05)
+    )
+    return fig
+
+
+def profit_scatter_spec(pl_df):
+    data = thin_scatter(pl_df[['Client', 'Revenue', 'Profit']], 'Revenue', 'Profit')
+    return alt.Chart(data).mark_circle(size=60).encode(
+        x=alt.X('Revenue', axis=alt.Axis(title='Revenue (₹)')),
+        y=alt.Y('Profit', axis=alt.Axis(title='Profit (₹)')),
+        color=alt.Color('Profit', scale=alt.Scale(scheme='redyellowgreen')),
+        tooltip=['Client', alt.Tooltip('Revenue', format='₹,.0f'), alt.Tooltip('Profit', format='₹,.0f')]
+    ).properties(height=300).interactive().to_dict()
+
+
+def monthly_combo_spec(monthly_data):
+    base = alt.Chart(monthly_data).encode(x='Month')
+    bar = base.mark_bar(opacity=0.7).encode(y='Revenue', color=alt.value('#2196F3'))
+    line = base.mark_line(color='#FFC107', strokeWidth=3).encode(y='Profit')
+    return (bar + line).properties(height=300).resolve_scale(y='shared').to_dict()
+
+
+def client_line_spec(pl_df):
+    # Sorted by date to make the line chart meaningful (Profit over time/projects)
+    data = pl_df[['Client', 'Revenue', 'Profit', 'created_at']].sort_values('created_at')
+    data = downsample_line(data.reset_index(drop=True), 'Profit')
+    data = data.assign(created_at=data['created_at'].astype(str))
+    return alt.Chart(data).mark_line(point=True).encode(
+        x=alt.X('Client', sort=None, axis=alt.Axis(labelAngle=-45)),  # Preserving sorted order
+        y=alt.Y('Profit', axis=alt.Axis(title='Profit (₹)')),
+        tooltip=['Client', 'Revenue', 'Profit', 'created_at']
+    ).properties(height=300).interactive().to_dict()
+
+
+def monthly_line_spec(monthly_data):
+    return (alt.Chart(monthly_data).mark_line(point=True).encode(
+        x='Month',
+        y=alt.Y('Revenue', axis=alt.Axis(title='Amount (₹)')),
+        color=alt.value('#2196F3'),
+        tooltip=['Month', 'Revenue']
+    ) + alt.Chart(monthly_data).mark_line(point=True, strokeDash=[5, 5]).encode(
+        x='Month',
+        y='Profit',
+        color=alt.value('#FFC107'),
+        tooltip=['Month', 'Profit']
+    )).to_dict()
+
+
+def health_radar_figure(values):
+    """Radar of Revenue Capture, Profit Margin, Cost Efficiency and Labor Cost % (raw percentages)."""
+    fig = go.Figure()
+    fig.add_trace(go.Scatterpolar(
+        r=values,
+        theta=['Revenue Capture', 'Profit Margin', 'Cost Efficiency', 'Labor Cost %'],
+        fill='toself',
+        name='Current Performance',
+        line_color='#2196F3'
+    ))
+    fig.update_layout(
+        polar=dict(
+            bgcolor='#1E1E1E',
+            radialaxis=dict(visible=True, range=[0, 100], gridcolor='#444', linecolor='#444', tickfont=dict(color='#ccc')),
+            angularaxis=dict(gridcolor='#444', linecolor='#444', tickfont=dict(color='#ccc'))
+        ),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='white'),
+        showlegend=True,
+        legend=dict(font=dict(color='white')),
+        height=400,
+        margin=dict(l=40, r=40, t=40, b=40)
+    )
+    return fig
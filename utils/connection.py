@@ -0,0 +1,258 @@
+import random
+import threading
+import time
+
+# ---------------------------
+# RESILIENT BACKEND CONNECTION
+# ---------------------------
+# One backend client per process, shared by every session. Requests made
+# through it (`conn.table(...)....execute()`, `conn.rpc(...).execute()`) are
+# recorded as a call chain and replayed against the current client, so a
+# request can be retried after a transient failure or after the client was
+# rebuilt.
+#
+# * Retries: transient errors (network, timeouts, 5xx/429, PostgREST
+#   connection errors) are retried up to RETRY_ATTEMPTS times with full
+#   jitter backoff. Reads, updates, upserts, deletes and read-only RPCs are
+#   retried on any transient error. Inserts and other RPCs are retried only
+#   when the request never reached the server, so they are not applied twice.
+# * Circuit breaker: after FAILURE_THRESHOLD consecutive transient failures
+#   the breaker opens. Requests then fail at once with BackendUnavailable and
+#   the client (and its connection pool) is rebuilt. After OPEN_SECONDS one
+#   probe request is let through, and it closes the breaker if it succeeds.
+#
+# Cached reads fall back to their last stored value while the backend is
+# failing (see cache.shared_cache).
+
+RETRY_ATTEMPTS = 3
+BACKOFF_BASE = 0.2
+BACKOFF_CAP = 2.0
+FAILURE_THRESHOLD = 5
+OPEN_SECONDS = 30.0
+IDEMPOTENT_VERBS = {"select", "update", "upsert", "delete"}
+READ_ONLY_RPCS = {"dashboard_summary"}
+# HTTP statuses and PostgREST codes (database unreachable / pool timeout) worth retrying
+TRANSIENT_CODES = {"408", "429", "500", "502", "503", "504", "PGRST000", "PGRST001", "PGRST002", "PGRST003"}
+NOT_SENT_CODES = {"PGRST000", "PGRST001", "PGRST003"}
+MISSING_FUNCTION_CODES = {"PGRST202", "42883", "404"}  # PostgREST: function not in the schema cache / undefined function
+UNIQUE_VIOLATION = "23505"
+
+
+class BackendUnavailable(Exception):
+    """Raised without contacting the backend while the circuit breaker is open."""
+
+
+def is_transient(exc):
+    if isinstance(exc, (ConnectionError, TimeoutError, BackendUnavailable)):
+        return True
+    try:
+        import httpx
+        if isinstance(exc, httpx.TransportError):
+            return True
+    except ImportError:
+        pass
+    return str(getattr(exc, "code", "") or "") in TRANSIENT_CODES
+
+
+def _not_sent(exc):
+    """True when the request certainly did not reach the database (safe to retry any write)."""
+    if isinstance(exc, (ConnectionRefusedError, BackendUnavailable)):
+        return True
+    try:
+        import httpx
+        if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return True
+    except ImportError:
+        pass
+    return str(getattr(exc, "code", "") or "") in NOT_SENT_CODES
+
+
+def function_missing(exc):
+    """True when PostgREST reports that an RPC's SQL function is not deployed (nothing ran)."""
+    return str(getattr(exc, "code", "") or "") in MISSING_FUNCTION_CODES
+
+
+def unique_violation(exc):
+    """True when a write was rejected by a UNIQUE constraint (nothing was written)."""
+    return str(getattr(exc, "code", "") or "") == UNIQUE_VIOLATION
+
+
+def backoff(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Full jitter: a random delay in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """closed -> open after `threshold` consecutive failures -> half_open after `open_seconds` -> closed on success."""
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, open_seconds=OPEN_SECONDS):
+        self.threshold = threshold
+        self.open_seconds = open_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.time() - self.opened_at >= self.open_seconds else "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        """Returns True when this failure opened the breaker."""
+        with self._lock:
+            self.failures += 1
+            was_closed = self.opened_at is None
+            if self._probing or self.failures >= self.threshold:
+                self.opened_at = time.time()
+                self._probing = False
+                return was_closed
+            return False
+
+
+class _Request:
+    """A recorded builder chain (`table("x").select("*").eq("id", 1)`), replayed on execute()."""
+
+    def __init__(self, conn, chain, retry_writes):
+        self._conn = conn
+        self._chain = chain
+        self._retry_writes = retry_writes
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _Request(self._conn, self._chain + [(name, None, None)], self._retry_writes)
+
+    def __call__(self, *args, **kwargs):
+        name = self._chain[-1][0]
+        return _Request(self._conn, self._chain[:-1] + [(name, args, kwargs)], self._retry_writes)
+
+    def build(self, client):
+        obj = client
+        for name, args, kwargs in self._chain:
+            obj = getattr(obj, name)
+            if args is not None:
+                obj = obj(*args, **kwargs)
+        return obj
+
+    def execute(self):
+        verb = self._chain[1][0] if len(self._chain) > 1 else None
+        idempotent = self._retry_writes or (self._chain[0][0] == "table" and verb in IDEMPOTENT_VERBS)
+        return self._conn.call(lambda client: self.build(client).execute(), idempotent)
+
+
+class Connection:
+    """
+    Wraps a backend client factory (e.g. supabase.create_client) with retries,
+    a circuit breaker and health stats. Exposes the same `table()` / `rpc()`
+    entry points as the Supabase client.
+    """
+
+    def __init__(self, factory, attempts=RETRY_ATTEMPTS, breaker=None, sleep=time.sleep):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+        self.attempts = attempts
+        self.breaker = breaker or CircuitBreaker()
+        self._sleep = sleep
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "rejected": 0, "rebuilds": 0,
+                      "last_error": None, "last_error_at": None, "last_ok_at": None, "latency_ms": None}
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self._factory()
+            return self._client
+
+    def reset(self):
+        """Drops the client; the next request builds a new one (new connection pool)."""
+        with self._lock:
+            old, self._client = self._client, None
+        if old is not None:
+            self.stats["rebuilds"] += 1
+            session = getattr(getattr(old, "postgrest", None), "session", None)
+            try:
+                if session is not None: session.close()
+            except Exception: pass
+
+    def table(self, name):
+        return _Request(self, [("table", (name,), {})], False)
+
+    def rpc(self, fn, *args, **kwargs):
+        return _Request(self, [("rpc", (fn,) + args, kwargs)], fn in READ_ONLY_RPCS)
+
+    def call(self, run, idempotent=True):
+        """Runs `run(client)` with retries and the circuit breaker."""
+        self.stats["requests"] += 1
+        for attempt in range(self.attempts):
+            if not self.breaker.allow():
+                self.stats["rejected"] += 1
+                raise BackendUnavailable(f"Backend unavailable (circuit open after: {self.stats['last_error']})")
+            started = time.perf_counter()
+            try:
+                result = run(self.client())
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.record_success()  # the backend answered; the request itself was bad
+                    raise
+                self.stats["failures"] += 1
+                self.stats["last_error"] = f"{type(e).__name__}: {e}"
+                self.stats["last_error_at"] = time.time()
+                if self.breaker.record_failure():
+                    print(f"Backend circuit opened: {self.stats['last_error']}")
+                    self.reset()
+                if attempt + 1 >= self.attempts or not (idempotent or _not_sent(e)):
+                    raise
+                self.stats["retries"] += 1
+                self._sleep(backoff(attempt))
+                continue
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            ema = self.stats["latency_ms"]
+            self.stats["latency_ms"] = elapsed_ms if ema is None else 0.8 * ema + 0.2 * elapsed_ms
+            self.stats["last_ok_at"] = time.time()
+            self.breaker.record_success()
+            return result
+
+    def ping(self):
+        """Health check: one tiny read. Returns (ok, milliseconds, error)."""
+        started = time.perf_counter()
+        try:
+            self.table("settings").select("id").limit(1).execute()
+            return True, (time.perf_counter() - started) * 1000, None
+        except Exception as e:
+            return False, (time.perf_counter() - started) * 1000, f"{type(e).__name__}: {e}"
+
+    def health(self):
+        return {"state": self.breaker.state, "consecutive_failures": self.breaker.failures, **self.stats}
+
+
+def pooled_supabase_factory(url, key, timeout=15.0, max_connections=20):
+    """
+    Factory for a Supabase client that shares one keep-alive httpx pool across
+    sessions, with bounded timeouts so a slow backend fails over to retries
+    and cached data instead of hanging the rerun.
+    """
+    def factory():
+        import httpx
+        from supabase import ClientOptions, create_client
+        http = httpx.Client(timeout=httpx.Timeout(timeout, connect=5.0),
+                            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections // 2, keepalive_expiry=30.0))
+        return create_client(url, key, options=ClientOptions(httpx_client=http, postgrest_client_timeout=timeout))
+    return factory
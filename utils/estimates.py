@@ -0,0 +1,295 @@
+"""
+Typed estimate model for `clients.internal_estimate`.
+
+Every tab parses the stored JSON through `parse_estimate` (or `parse_clients`
+for a whole fetch) and writes it back through `serialize_estimate`, so there
+is one place that knows about the stored layout, numeric coercion and the
+legacy margin formats.
+
+Stored layouts:
+    v0/v1: {"items": [{"Qty", "Item", "Unit", "Base Rate", ...}], "days", "margins"}
+    v2:    {"v": 2, "d": days, "m": [p, l, e] | null,
+            "i": [[inventory id, qty, unit, base rate, item name] | [item name, qty, unit, base rate], ...]}
+           Lines stored by id keep the item name as of the save, so they still
+           read correctly after the inventory item is deleted. Rows written
+           before that have no 5th element.
+           Large estimates store "z" (base64 zlib of the "i" list) instead of "i".
+"""
+import base64
+import json
+import math
+import zlib
+from dataclasses import dataclass, field
+
+SCHEMA_VERSION = 2
+COMPRESS_MIN_ITEMS = 40  # v2 estimates with at least this many lines are stored compressed
+DEFAULT_MARGINS = {'part_margin': 15.0, 'labor_margin': 20.0, 'extra_margin': 5.0}
+
+
+def to_float(value, default=0.0):
+    """Coerces a stored value to float, mapping None/NaN/garbage to `default`."""
+    try:
+        f = float(value)
+    except (TypeError, ValueError):
+        return default
+    return default if math.isnan(f) else f
+
+
+@dataclass(slots=True)
+class LineItem:
+    item: str
+    qty: float
+    unit: str = 'pcs'
+    base_rate: float = 0.0
+    item_id: int = None  # inventory id when the line came from a v2 row
+
+    def to_record(self):
+        """Row in the layout used by the data editors and PDF generator."""
+        return {"Qty": self.qty, "Item": self.item, "Unit": self.unit, "Base Rate": self.base_rate}
+
+
+@dataclass(slots=True)
+class Margins:
+    """Custom margins in percent. Canonical stored form is {'p', 'l', 'e'}."""
+    part: float
+    labor: float
+    extra: float
+
+    def as_settings(self):
+        """Full-key form expected by calculate_estimate_details."""
+        return {'part_margin': self.part, 'labor_margin': self.labor, 'extra_margin': self.extra}
+
+    def to_json(self):
+        return {'p': self.part, 'l': self.labor, 'e': self.extra}
+
+
+@dataclass(slots=True)
+class Estimate:
+    items: list = field(default_factory=list)
+    days: float = 1.0
+    margins: Margins = None  # None -> use global settings
+    version: int = SCHEMA_VERSION
+
+    @classmethod
+    def from_records(cls, records, days, margins=None):
+        """Builds an estimate from data-editor rows (dicts with Qty/Item/Unit/Base Rate)."""
+        return cls(items=[parse_line_item(r) for r in records if r is not None], days=to_float(days, 1.0), margins=parse_margins(margins))
+
+    def item_records(self):
+        return [i.to_record() for i in self.items]
+
+    def effective_margins(self, global_settings):
+        """Margins to price with: the custom ones, else the global defaults."""
+        if self.margins is not None:
+            return self.margins.as_settings()
+        return default_margins(global_settings).as_settings()
+
+    def calculate(self, global_settings):
+        """Runs helpers.calculate_estimate_details for this estimate."""
+        from utils import helpers
+        return helpers.calculate_estimate_details(self.item_records(), self.days, self.effective_margins(global_settings), global_settings)
+
+
+def default_margins(global_settings):
+    gs = global_settings or {}
+    return Margins(
+        part=to_float(gs.get('part_margin'), DEFAULT_MARGINS['part_margin']),
+        labor=to_float(gs.get('labor_margin'), DEFAULT_MARGINS['labor_margin']),
+        extra=to_float(gs.get('extra_margin'), DEFAULT_MARGINS['extra_margin']),
+    )
+
+
+def parse_margins(data, global_settings=None):
+    """
+    Parses stored margins in any of the formats found in existing rows.
+
+    Accepts a Margins instance, the short form {'p', 'l', 'e'}, or the full
+    form {'part_margin', 'labor_margin', 'extra_margin'}. Missing keys fall
+    back to `global_settings` (or the built-in defaults).
+
+    Returns:
+        Margins or None: None when no custom margins are stored.
+    """
+    if data is None:
+        return None
+    if isinstance(data, Margins):
+        return data
+    if not isinstance(data, dict):
+        raise ValueError(f"margins must be a dict, got {type(data).__name__}")
+    base = default_margins(global_settings)
+    if 'p' in data or 'l' in data or 'e' in data:
+        keys = ('p', 'l', 'e')
+    else:
+        keys = ('part_margin', 'labor_margin', 'extra_margin')
+    return Margins(
+        part=to_float(data.get(keys[0]), base.part),
+        labor=to_float(data.get(keys[1]), base.labor),
+        extra=to_float(data.get(keys[2]), base.extra),
+    )
+
+
+def parse_line_item(row):
+    if isinstance(row, LineItem):
+        return row
+    if not isinstance(row, dict):
+        raise ValueError(f"line item must be a dict, got {type(row).__name__}")
+    name = row.get('Item')
+    unit = row.get('Unit')
+    return LineItem(
+        item="" if name is None or (isinstance(name, float) and math.isnan(name)) else str(name),
+        qty=to_float(row.get('Qty')),
+        unit=unit if isinstance(unit, str) and unit else 'pcs',
+        base_rate=to_float(row.get('Base Rate')),
+    )
+
+
+def _compact_number(x):
+    return int(x) if float(x).is_integer() else x
+
+
+def v2_rows(data):
+    if data.get('z'):
+        try:
+            return json.loads(zlib.decompress(base64.b64decode(data['z'])).decode("utf-8"))
+        except zlib.error as e:
+            raise ValueError(f"corrupt compressed line list: {e}") from e
+    return data.get('i') or []
+
+
+def _parse_v2_item(row, item_names):
+    if not isinstance(row, list) or not row:
+        raise ValueError("v2 line item must be a non-empty list")
+    ref, qty, unit, rate, saved_name = (row + [None] * 5)[:5]
+    item_id = None
+    if isinstance(ref, str):
+        name = ref
+    else:
+        if isinstance(ref, bool) or not isinstance(ref, (int, float)) or not math.isfinite(ref) or ref != int(ref):
+            raise ValueError(f"v2 line item reference must be an item name or inventory id, got {ref!r}")
+        item_id = int(ref)
+        name = (item_names or {}).get(item_id) or saved_name or f"Deleted item #{item_id}"
+    return LineItem(item=name, qty=to_float(qty), unit=unit if isinstance(unit, str) and unit else 'pcs',
+                    base_rate=to_float(rate), item_id=item_id)
+
+
+def parse_estimate(data, item_names=None):
+    """
+    Validates and parses a stored `internal_estimate` value in any layout.
+
+    Args:
+        data: The JSON value from the database (dict or None).
+        item_names (dict): Inventory id -> item name, used to resolve v2 item references.
+
+    Returns:
+        Estimate or None: None if the client has no estimate.
+
+    Raises:
+        ValueError: If the value is not an estimate object.
+    """
+    if data is None:
+        return None
+    if isinstance(data, Estimate):
+        return data
+    if not isinstance(data, dict):
+        raise ValueError(f"internal_estimate must be an object, got {type(data).__name__}")
+    version = to_float(data.get('v'), 0)  # rows saved before versioning are v0
+    if not math.isfinite(version):
+        raise ValueError(f"internal_estimate.v must be a number, got {data.get('v')!r}")
+    version = int(version)
+    if version >= 2:
+        m = data.get('m')
+        margins = Margins(*(to_float(x) for x in m[:3])) if isinstance(m, list) and len(m) >= 3 else None
+        return Estimate(
+            items=[_parse_v2_item(r, item_names) for r in v2_rows(data)],
+            days=to_float(data.get('d'), 1.0),
+            margins=margins,
+            version=version,
+        )
+    items = data.get('items') or []
+    if not isinstance(items, list):
+        raise ValueError("internal_estimate.items must be a list")
+    return Estimate(
+        items=[parse_line_item(r) for r in items if r is not None],
+        days=to_float(data.get('days'), 1.0),
+        margins=parse_margins(data.get('margins')),
+        version=version,
+    )
+
+
+def serialize_estimate(est, item_ids=None, compress=None):
+    """
+    Inverse of parse_estimate, always writing the current (v2) layout.
+
+    Args:
+        est (Estimate): The estimate to store.
+        item_ids (dict): Inventory item name -> id. Lines whose name is found are stored by id,
+                         followed by the name as a fallback for when the item is deleted.
+        compress (bool): Store the line list zlib-compressed. Defaults to True for large estimates.
+    """
+    item_ids = item_ids or {}
+    rows = []
+    for li in est.items:
+        ref = item_ids.get(li.item, li.item_id)
+        row = [ref if ref is not None else li.item, _compact_number(li.qty), li.unit, _compact_number(li.base_rate)]
+        if ref is not None:
+            row.append(li.item)
+        rows.append(row)
+    out = {
+        "v": SCHEMA_VERSION,
+        "d": _compact_number(est.days),
+        "m": [_compact_number(est.margins.part), _compact_number(est.margins.labor), _compact_number(est.margins.extra)] if est.margins is not None else None,
+    }
+    if compress is None:
+        compress = len(rows) >= COMPRESS_MIN_ITEMS
+    if compress:
+        out["z"] = base64.b64encode(zlib.compress(json.dumps(rows, separators=(",", ":")).encode("utf-8"), 9)).decode("ascii")
+    else:
+        out["i"] = rows
+    return out
+
+
+def inventory_maps(inventory_rows):
+    """
+    Returns (names_by_id, ids_by_name) for a list of `inventory` rows.
+
+    Memoized on the row list so the maps are rebuilt only when inventory is refetched.
+    """
+    global _last_inventory
+    if _last_inventory[0] is inventory_rows:
+        return _last_inventory[1]
+    names = {r['id']: r['item_name'] for r in inventory_rows or []}
+    maps = (names, {n: i for i, n in names.items()})
+    _last_inventory = (inventory_rows, maps)
+    return maps
+
+
+_last_inventory = (None, ({}, {}))
+
+# One-entry memo so a fetch of `clients` is parsed once no matter how many tabs read it
+_last_fetch = (None, None, {})
+
+def parse_clients(rows, item_names=None):
+    """
+    Parses the estimates of a list of client rows.
+
+    Args:
+        rows (list): `clients` rows as returned by get_clients().
+        item_names (dict): Inventory id -> item name (see inventory_maps).
+
+    Returns:
+        dict: client id -> Estimate (clients without a valid estimate are omitted).
+    """
+    global _last_fetch
+    cached_rows, cached_names, parsed = _last_fetch
+    if rows is cached_rows and item_names is cached_names:
+        return parsed
+    parsed = {}
+    for row in rows or []:
+        try:
+            est = parse_estimate(row.get('internal_estimate'), item_names)
+        except ValueError:
+            est = None
+        if est is not None:
+            parsed[row.get('id')] = est
+    _last_fetch = (rows, item_names, parsed)
+    return parsed
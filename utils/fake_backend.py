@@ -0,0 +1,435 @@
+"""
+In-memory stand-in for the Supabase client, seeded with synthetic data.
+
+Implements the subset of the query builder the app uses (select / insert /
+update / upsert / delete with eq, neq, in_, gt, gte, lt, lte, order, range
+and limit) plus the `dashboard_summary` and `record_payment` RPCs, and
+counts every round-trip so benchmarks can report queries per rerun. Like
+PostgREST's max-rows setting, no response carries more than `max_rows` rows;
+selects cut by that cap are recorded in `truncated` so benchmarks can flag
+reads that need paging.
+
+Used by benchmarks/rerun_latency.py, and by the app itself when the
+FAKE_BACKEND secret or the JUGNOO_FAKE_BACKEND environment variable holds a
+dataset spec such as "clients=2000,items=500":
+
+    JUGNOO_FAKE_BACKEND="clients=500" streamlit run app.py
+"""
+import copy
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from utils import aggregates, estimates, helpers, payments
+
+FAKE_BACKEND_ENV = "JUGNOO_FAKE_BACKEND"
+DEFAULT_SPEC = {"clients": 500, "items": 300, "suppliers": 20, "purchases": 3000, "staff": 25, "months": 24, "seed": 7, "latency_ms": 0,
+                "max_rows": 1000}
+MAX_ROWS = 1000  # PostgREST's default db-max-rows (0 = no cap)
+SETTINGS = {"id": 1, "part_margin": 20, "labor_margin": 20, "extra_margin": 10, "daily_labor_cost": 1000.0, "advance_margin": 20}
+TOUCH_UPDATED_AT = {"clients"}  # tables with the set_updated_at trigger (schema.sql)
+UNIQUE_KEYS = {"estimate_revisions": ("client_id", "revision")}  # multi-column UNIQUE constraints (schema.sql)
+
+
+class FakeAPIError(Exception):
+    """Error with a PostgREST `code`, like postgrest.exceptions.APIError."""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class Response:
+    """Same attributes as a supabase APIResponse."""
+    __slots__ = ("data", "count")
+
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _matches(value, op, arg):
+    if op == "eq":
+        return value == arg
+    if op == "neq":
+        return value != arg
+    if op == "in":
+        return value in arg
+    if value is None or arg is None:
+        return False
+    if op == "gt":
+        return value > arg
+    if op == "gte":
+        return value >= arg
+    if op == "lt":
+        return value < arg
+    return value <= arg
+
+
+class FakeQuery:
+    """One chained query against a FakeClient table; runs on execute()."""
+
+    def __init__(self, client, table):
+        self._client = client
+        self._table = table
+        self._op = "select"
+        self._columns = None
+        self._payload = None
+        self._on_conflict = "id"
+        self._count = None
+        self._filters = []
+        self._order = []
+        self._range = None
+
+    # --- BUILDERS ---
+    def select(self, columns="*", count=None):
+        self._op, self._count = "select", count
+        if columns and columns.strip() != "*":
+            self._columns = [c.strip() for c in columns.split(",") if c.strip()]
+        return self
+
+    def insert(self, rows):
+        self._op, self._payload = "insert", rows
+        return self
+
+    def update(self, values):
+        self._op, self._payload = "update", values
+        return self
+
+    def upsert(self, rows, on_conflict="id"):
+        self._op, self._payload, self._on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    def _filter(self, op, column, arg):
+        self._filters.append((column, op, arg))
+        return self
+
+    def eq(self, column, value):
+        return self._filter("eq", column, value)
+
+    def neq(self, column, value):
+        return self._filter("neq", column, value)
+
+    def in_(self, column, values):
+        return self._filter("in", column, list(values))
+
+    def gt(self, column, value):
+        return self._filter("gt", column, value)
+
+    def gte(self, column, value):
+        return self._filter("gte", column, value)
+
+    def lt(self, column, value):
+        return self._filter("lt", column, value)
+
+    def lte(self, column, value):
+        return self._filter("lte", column, value)
+
+    def order(self, column, desc=False):
+        self._order.append((column, desc))
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end + 1)
+        return self
+
+    def limit(self, n):
+        start = self._range[0] if self._range else 0
+        self._range = (start, start + n)
+        return self
+
+    # --- EXECUTION ---
+    def _selected(self, rows):
+        return [r for r in rows if all(_matches(r.get(c), op, arg) for c, op, arg in self._filters)]
+
+    def _project(self, row):
+        if self._columns is None:
+            return copy.deepcopy(row)
+        return {c: copy.deepcopy(row.get(c)) for c in self._columns}
+
+    def execute(self):
+        return self._client._execute(self)
+
+
+class FakeClient:
+    """
+    Tables of dict rows behind a Supabase-like interface.
+
+    Args:
+        tables (dict): table name -> list of rows (rows are owned by the client).
+        latency_ms (float): Simulated round-trip time added to every query.
+        max_rows (int): Most rows one select returns (0 = no cap).
+    """
+
+    def __init__(self, tables=None, latency_ms=0, max_rows=MAX_ROWS):
+        self.tables = tables or {}
+        self.latency_ms = latency_ms
+        self.max_rows = max_rows
+        self.queries = 0
+        self.query_log = []
+        self.truncated = []  # selects cut at max_rows since reset_counters()
+        self.queries_by_thread = {}  # thread name -> queries, to tell script reruns from background work
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return _FakeRpc(self, name, params or {})
+
+    def reset_counters(self):
+        with self._lock:
+            self.queries = 0
+            self.query_log = []
+            self.queries_by_thread = {}
+            self.truncated = []
+
+    def _count_query(self, label):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        with self._lock:
+            self.queries += 1
+            self.query_log.append(label)
+            thread = threading.current_thread().name
+            self.queries_by_thread[thread] = self.queries_by_thread.get(thread, 0) + 1
+
+    def _next_id(self, rows):
+        return max((r.get("id") or 0 for r in rows), default=0) + 1
+
+    def _execute(self, q):
+        self._count_query(f"{q._op} {q._table}")
+        with self._lock:
+            rows = self.tables.setdefault(q._table, [])
+            now = datetime.now().isoformat()
+            if q._op == "select":
+                out = q._selected(rows)
+                for column, desc in reversed(q._order):
+                    present = [r for r in out if r.get(column) is not None]
+                    missing = [r for r in out if r.get(column) is None]
+                    present.sort(key=lambda r: r[column], reverse=desc)
+                    out = missing + present if desc else present + missing  # Postgres: NULLS FIRST on DESC
+                total = len(out)
+                if q._range:
+                    out = out[q._range[0]:q._range[1]]
+                if self.max_rows and len(out) > self.max_rows:
+                    out = out[:self.max_rows]
+                    self.truncated.append(f"select {q._table}")
+                return Response([q._project(r) for r in out], total if q._count else None)
+            if q._op == "insert":
+                new = [dict(r) for r in (q._payload if isinstance(q._payload, list) else [q._payload])]
+                unique = UNIQUE_KEYS.get(q._table)
+                if unique:
+                    taken = {tuple(r.get(c) for c in unique) for r in rows}
+                    for r in new:
+                        key = tuple(r.get(c) for c in unique)
+                        if key in taken:
+                            raise FakeAPIError(f"duplicate key value violates unique constraint on {unique}", code="23505")
+                        taken.add(key)
+                for r in new:
+                    if r.get("id") is None:
+                        r["id"] = self._next_id(rows)
+                    r.setdefault("created_at", now)
+                    if q._table in TOUCH_UPDATED_AT:
+                        r["updated_at"] = now
+                    rows.append(r)
+                return Response(copy.deepcopy(new))
+            if q._op == "update":
+                hit = q._selected(rows)
+                for r in hit:
+                    r.update(copy.deepcopy(q._payload))
+                    if q._table in TOUCH_UPDATED_AT:
+                        r["updated_at"] = now
+                return Response(copy.deepcopy(hit))
+            if q._op == "upsert":
+                keys = [k.strip() for k in q._on_conflict.split(",")]
+                out = []
+                for r in (q._payload if isinstance(q._payload, list) else [q._payload]):
+                    cur = next((x for x in rows if all(x.get(k) == r.get(k) for k in keys)), None)
+                    if cur is None:
+                        cur = dict(r)
+                        if cur.get("id") is None:
+                            cur["id"] = self._next_id(rows)
+                        rows.append(cur)
+                    else:
+                        cur.update(copy.deepcopy(r))
+                    out.append(copy.deepcopy(cur))
+                return Response(out)
+            if q._op == "delete":
+                hit = q._selected(rows)
+                gone = {id(r) for r in hit}
+                self.tables[q._table] = [r for r in rows if id(r) not in gone]
+                return Response(copy.deepcopy(hit))
+        raise ValueError(f"unsupported operation {q._op}")
+
+
+class _FakeRpc:
+    def __init__(self, client, name, params):
+        self._client, self._name, self._params = client, name, params
+
+    def execute(self):
+        c, p = self._client, self._params
+        c._count_query(f"rpc {self._name}")
+        if self._name == "dashboard_summary":
+            with c._lock:
+                rows = [dict(r) for r in c.tables.get("clients", [])]
+            return Response(aggregates.summarize_clients(rows, p.get("recent_n", 5), p.get("top_n", 5)))
+        if self._name == "record_payment":
+            with c._lock:
+                now = datetime.now().isoformat()
+                ledger = c.tables.setdefault("payments", [])
+                ledger.append({"id": c._next_id(ledger), "client_id": p["p_client_id"], "amount": float(p["p_amount"]), "paid_on": p.get("p_paid_on"),
+                               "method": p.get("p_method"), "note": p.get("p_note"), "created_by": p.get("p_created_by"), "created_at": now})
+                client = next((r for r in c.tables.get("clients", []) if r["id"] == p["p_client_id"]), None)
+                if client is None:
+                    raise ValueError(f"client {p['p_client_id']} not found")
+                client["amount_paid"] = payments.paid_amount(client) + float(p["p_amount"])
+                client["last_payment_at"] = client["updated_at"] = now
+                return Response(client["amount_paid"])
+        raise FakeAPIError(f"Could not find the function public.{self._name} in the schema cache", code="PGRST202")
+
+
+# --- SYNTHETIC DATA ---
+_WORDS = ["LED", "Panel", "Strip", "Driver", "Cable", "Switch", "Socket", "Profile", "Spot", "Track", "Downlight", "Cove",
+          "Warm", "Cool", "RGB", "Outdoor", "Pendant", "Wall", "Ceiling", "Dimmer", "Sensor", "Channel", "Clip", "Connector"]
+_FIRST = ["Aarav", "Vivaan", "Aditya", "Ishaan", "Rohan", "Kabir", "Ananya", "Diya", "Meera", "Priya", "Sara", "Kavya", "Neha", "Arjun", "Riya"]
+_LAST = ["Sharma", "Verma", "Patel", "Mehta", "Iyer", "Reddy", "Nair", "Gupta", "Singh", "Joshi", "Kapoor", "Das", "Rao", "Bose"]
+
+
+def parse_spec(spec):
+    """'clients=2000,items=500' -> full spec dict (unknown keys are rejected)."""
+    out = dict(DEFAULT_SPEC)
+    for part in (spec or "").split(","):
+        if not part.strip():
+            continue
+        key, _, value = part.partition("=")
+        key = key.strip()
+        if key not in out:
+            raise ValueError(f"unknown fake backend option '{key}' (expected one of {', '.join(out)})")
+        out[key] = float(value) if key == "latency_ms" else int(value)
+    return out
+
+
+def seed(clients=500, items=300, suppliers=20, purchases=3000, staff=25, months=24, seed=7, latency_ms=0, max_rows=MAX_ROWS):
+    """
+    Builds a FakeClient with synthetic tables of the given sizes.
+
+    Clients are spread over the last `months` months across every status,
+    most with a stored v2 estimate and estimate totals; delivered clients
+    carry payments. The `pl_monthly` rollups are built from the seeded data.
+
+    Returns:
+        FakeClient: The seeded client, with counters reset.
+    """
+    from utils import rollups
+    rng = random.Random(seed)
+    now = datetime.now()
+    start = now - timedelta(days=30 * months)
+
+    def when():
+        return start + timedelta(seconds=rng.uniform(0, (now - start).total_seconds()))
+
+    inventory = []
+    for i in range(1, items + 1):
+        unit = rng.choice(["pcs", "pcs", "m", "ft"])
+        inventory.append({"id": i, "item_name": f"{rng.choice(_WORDS)} {rng.choice(_WORDS)} {i}", "unit": unit,
+                          "base_rate": round(rng.uniform(5, 2500), 2), "stock_quantity": float(rng.randint(0, 200))})
+    item_ids = {r["item_name"]: r["id"] for r in inventory}
+
+    supplier_rows = [{"id": i, "name": f"{rng.choice(_LAST)} Traders {i}", "phone": f"98{rng.randint(10000000, 99999999)}",
+                      "contact_person": rng.choice(_FIRST)} for i in range(1, suppliers + 1)]
+    purchase_rows = []
+    for i in range(1, purchases + 1):
+        item = rng.choice(inventory)
+        purchase_rows.append({"id": i, "supplier_id": rng.randint(1, max(suppliers, 1)), "item_name": item["item_name"],
+                              "quantity": float(rng.randint(1, 100)), "cost": round(rng.uniform(200, 40000), 2),
+                              "purchase_date": when().isoformat(), "notes": ""})
+
+    roles = ["Technician", "Helper", "Electrician", "Supervisor"]
+    staff_rows = [{"id": i, "name": f"{rng.choice(_FIRST)} {rng.choice(_LAST)}", "role": rng.choice(roles), "phone": f"97{rng.randint(10000000, 99999999)}",
+                   "salary": rng.choice([600, 800, 1000, 1200]), "status": rng.choice(["Available", "Available", "Busy", "On Leave"]),
+                   "created_at": when().isoformat()} for i in range(1, staff + 1)]
+
+    statuses = helpers.ACTIVE_STATUSES + helpers.INACTIVE_STATUSES
+    client_rows, ledger = [], []
+    for i in range(1, clients + 1):
+        created = when()
+        status = rng.choice(statuses)
+        row = {"id": i, "name": f"{rng.choice(_FIRST)} {rng.choice(_LAST)} {i}", "phone": f"99{rng.randint(10000000, 99999999)}",
+               "address": f"{rng.randint(1, 400)} {rng.choice(_WORDS)} Road", "location": "", "status": status,
+               "created_at": created.isoformat(), "updated_at": created.isoformat(), "start_date": None, "assigned_staff": [],
+               "final_settlement_amount": None, "amount_paid": None, "last_payment_at": None}
+        if status != "New Lead" and rng.random() < 0.9:
+            lines = [estimates.LineItem(item=it["item_name"], qty=float(rng.randint(1, 40)), unit=it["unit"], base_rate=it["base_rate"], item_id=it["id"])
+                     for it in rng.sample(inventory, min(rng.randint(3, 30), len(inventory)))]
+            est = estimates.Estimate(items=lines, days=float(rng.randint(1, 15)),
+                                     margins=estimates.Margins(25, 20, 10) if rng.random() < 0.2 else None)
+            row["internal_estimate"] = estimates.serialize_estimate(est, item_ids)
+            row.update(helpers.estimate_totals(est.calculate(SETTINGS)))
+        if status in helpers.INACTIVE_STATUSES and row.get("est_grand_total"):
+            paid_on = created + timedelta(days=rng.randint(5, 60))
+            amount = round(row["est_grand_total"] * rng.choice([0.5, 0.8, 1.0, 1.0]), 2)
+            ledger.append({"id": len(ledger) + 1, "client_id": i, "amount": amount, "paid_on": paid_on.date().isoformat(),
+                           "method": "UPI", "note": "Seeded", "created_by": "admin", "created_at": paid_on.isoformat()})
+            row["amount_paid"], row["last_payment_at"] = amount, paid_on.isoformat()
+        client_rows.append(row)
+
+    # A small kit and a package that nests it
+    kit_items = rng.sample(inventory, min(8, len(inventory)))
+    kit_rows = [{"id": 1, "name": "Starter Kit", "lines": [{"item_id": it["id"], "qty": float(rng.randint(1, 6))} for it in kit_items[:5]]},
+                {"id": 2, "name": "Full Package", "lines": [{"kit_id": 1, "qty": 2.0}] + [{"item_id": it["id"], "qty": float(rng.randint(1, 10))} for it in kit_items[5:]]}]
+
+    # Staff assignment history for labor costing: finished projects released their team, ongoing ones keep it
+    assignment_rows = []
+    for row in client_rows:
+        if row["status"] in ("New Lead", "Estimate Given") or not staff_rows or rng.random() < 0.3:
+            continue
+        team = rng.sample(staff_rows, min(rng.randint(1, 3), len(staff_rows)))
+        if row["status"] in helpers.INACTIVE_STATUSES:
+            assigned = datetime.fromisoformat(row["created_at"]) + timedelta(days=rng.randint(3, 20))
+            released = min(assigned + timedelta(days=rng.randint(1, 15)), now)
+        else:
+            assigned, released = now - timedelta(days=rng.randint(0, 20)), None
+            row["assigned_staff"] = [s["id"] for s in team]
+        for s in team:
+            assignment_rows.append({"id": len(assignment_rows) + 1, "client_id": row["id"], "staff_id": s["id"], "daily_wage": s["salary"],
+                                    "assigned_on": assigned.date().isoformat(), "released_on": released.date().isoformat() if released else None,
+                                    "created_at": assigned.isoformat()})
+
+    fake = FakeClient({
+        "clients": client_rows, "inventory": inventory, "suppliers": supplier_rows, "supplier_purchases": purchase_rows,
+        "staff": staff_rows, "staff_roles": [{"id": i, "role_name": r} for i, r in enumerate(roles, 1)],
+        "settings": [dict(SETTINGS)], "users": [{"id": 1, "username": "admin", "password": "admin"}],
+        "payments": ledger, "estimate_revisions": [], "pl_monthly": [], "kits": kit_rows,
+        "staff_assignments": assignment_rows,
+    })
+    fake.max_rows = max_rows
+    rollups.rebuild(fake, SETTINGS)
+    fake.latency_ms = latency_ms
+    fake.reset_counters()
+    return fake
+
+
+# --- FRONT ---
+_instances = {}
+_active = None
+_instances_lock = threading.Lock()
+
+
+def from_spec(spec):
+    """The seeded FakeClient for a spec string, built once per process and spec."""
+    global _active
+    with _instances_lock:
+        if spec not in _instances:
+            _instances[spec] = seed(**parse_spec(spec))
+        _active = _instances[spec]
+        return _active
+
+
+def get_active():
+    """The FakeClient most recently returned by from_spec(), or None."""
+    return _active
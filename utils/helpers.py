@@ -1,8 +1,7 @@
 import pandas as pd
 import math
-from fpdf import FPDF
-from datetime import datetime
-from io import BytesIO
+
+from utils import estimates
 
 # ---------------------------
 # GLOBAL CONSTANTS
@@ -12,122 +11,14 @@ P_L_STATUS = ["Work Done", "Closed"]
 ACTIVE_STATUSES = ["New Lead", "Estimate Given", "Order Received", "Work In Progress"]
 INACTIVE_STATUSES = ["Work Done", "Closed"]
 
-# --- PROFESSIONAL PDF GENERATOR ---
-class PDFGenerator:
-    def __init__(self):
-        self.pdf = FPDF()
-
-    def _add_header(self, title):
-        self.pdf.add_page()
-        self.pdf.set_font("Arial", 'B', 20)
-        self.pdf.cell(0, 10, "Jugnoo", ln=True, align='L')
-        self.pdf.set_font("Arial", 'I', 10)
-        self.pdf.cell(0, 6, "Smart Automation Solutions", ln=True, align='L')
-        self.pdf.line(10, 28, 200, 28)
-        self.pdf.ln(15)
-        self.pdf.set_font("Arial", 'B', 12)
-        self.pdf.cell(0, 8, title, ln=True)
-        self.pdf.set_font("Arial", '', 10)
-        self.pdf.cell(0, 8, f"Date: {datetime.now().strftime('%d-%b-%Y')}", ln=True)
-        self.pdf.ln(5)
-
-    def generate_client_invoice(self, client_name, items, labor_days, labor_total, grand_total, advance_amount, is_final=False):
-        title = f"INVOICE For: {client_name}" if is_final else f"Estimate For: {client_name}"
-        self._add_header(title)
-        
-        self.pdf.set_fill_color(240, 240, 240)
-        self.pdf.set_font("Arial", 'B', 10)
-        self.pdf.cell(100, 10, "Description", 1, 0, 'L', 1)
-        self.pdf.cell(15, 10, "Qty", 1, 0, 'C', 1)
-        self.pdf.cell(15, 10, "Unit", 1, 0, 'C', 1)
-        self.pdf.cell(60, 10, "Amount (INR)", 1, 1, 'R', 1)
-        
-        self.pdf.set_font("Arial", '', 10)
-        for item in items:
-            self.pdf.cell(100, 8, str(item.get('Item', '')), 1)
-            self.pdf.cell(15, 8, str(item.get('Qty', 0)), 1, 0, 'C')
-            self.pdf.cell(15, 8, str(item.get('Unit', '')), 1, 0, 'C')
-            self.pdf.cell(60, 8, f"{item.get('Total Price', 0):,.2f}", 1, 1, 'R')
-            
-        self.pdf.set_font("Arial", '', 10)
-        self.pdf.cell(130, 8, f"Labor / Installation ({labor_days} Days)", 1, 0, 'R')
-        self.pdf.cell(60, 8, f"{labor_total:,.2f}", 1, 1, 'R')
-        
-        self.pdf.set_font("Arial", 'B', 12)
-        self.pdf.cell(130, 10, "Grand Total", 1, 0, 'R')
-        self.pdf.cell(60, 10, f"Rs. {grand_total:,.2f}", 1, 1, 'R')
-        
-        self.pdf.ln(10)
-        self.pdf.set_font("Arial", 'B', 10)
-        
-        if is_final:
-            self.pdf.multi_cell(0, 5, f"Total Amount: Rs. {grand_total:,.2f}")
-            self.pdf.ln(5)
-            self.pdf.set_font("Arial", 'I', 10)
-            self.pdf.multi_cell(0, 5, "Thank you for your business!")
-        else:
-            self.pdf.multi_cell(0, 5, f"Advance Payment Required: Rs. {advance_amount:,.2f}")
-            self.pdf.ln(5)
-            self.pdf.set_font("Arial", 'I', 8)
-            self.pdf.set_text_color(100, 100, 100)
-            self.pdf.multi_cell(0, 5, "NOTE: This is an estimate only. Final rates may vary based on actual site conditions and market fluctuations. Valid for 7 days.")
-        
-        pdf_output = BytesIO()
-        pdf_string = self.pdf.output(dest='S')
-        pdf_output.write(pdf_string.encode('latin-1'))
-        return pdf_output.getvalue()
-
-    def generate_internal_report(self, client_name, items, labor_days, labor_cost, labor_charged, grand_total, total_profit):
-        self._add_header(f"INTERNAL PROFIT REPORT (CONFIDENTIAL) - {client_name}")
-        
-        self.pdf.set_fill_color(220, 220, 220)
-        self.pdf.set_font("Arial", 'B', 9)
-        self.pdf.cell(70, 8, "Item Description", 1, 0, 'L', 1)
-        self.pdf.cell(15, 8, "Qty", 1, 0, 'C', 1)
-        self.pdf.cell(35, 8, "Base Rate", 1, 0, 'R', 1)
-        self.pdf.cell(35, 8, "Sold At", 1, 0, 'R', 1)
-        self.pdf.cell(35, 8, "Profit", 1, 1, 'R', 1)
-
-        self.pdf.set_font("Arial", '', 9)
-        for item in items:
-            qty = float(item.get('Qty', 0))
-            base = float(item.get('Base Rate', 0))
-            total_sell = float(item.get('Total Price', 0))
-            unit_sell = total_sell / qty if qty > 0 else 0
-            row_profit = total_sell - (base * qty)
-            
-            self.pdf.cell(70, 8, str(item.get('Item', ''))[:35], 1)
-            self.pdf.cell(15, 8, str(qty), 1, 0, 'C')
-            self.pdf.cell(35, 8, f"{base:,.2f}", 1, 0, 'R')
-            self.pdf.cell(35, 8, f"{unit_sell:,.2f}", 1, 0, 'R')
-            self.pdf.set_text_color(0, 150, 0); self.pdf.cell(35, 8, f"{row_profit:,.2f}", 1, 1, 'R'); self.pdf.set_text_color(0, 0, 0)
-
-        labor_profit = labor_charged - labor_cost
-        self.pdf.ln(5)
-        self.pdf.set_font("Arial", 'B', 10)
-        self.pdf.cell(120, 8, f"Labor ({labor_days} Days)", 1, 0, 'R')
-        self.pdf.cell(35, 8, f"Cost: {labor_cost:,.2f}", 1, 0, 'R')
-        self.pdf.cell(35, 8, f"Chrg: {labor_charged:,.2f}", 1, 1, 'R')
-
-        self.pdf.ln(10)
-        self.pdf.set_font("Arial", 'B', 12)
-        self.pdf.cell(120, 10, "TOTAL REVENUE:", 1, 0, 'R')
-        self.pdf.cell(70, 10, f"Rs. {grand_total:,.2f}", 1, 1, 'R')
-        self.pdf.cell(120, 10, "NET PROFIT:", 1, 0, 'R')
-        self.pdf.set_text_color(0, 150, 0); self.pdf.cell(70, 10, f"Rs. {total_profit:,.2f}", 1, 1, 'R')
-
-        pdf_output = BytesIO()
-        pdf_string = self.pdf.output(dest='S')
-        pdf_output.write(pdf_string.encode('latin-1'))
-        return pdf_output.getvalue()
-
+# --- PDF (utils/pdf.py; imported on first use so the calculations load without FPDF) ---
 def create_pdf(*args, **kwargs):
-    pdf_gen = PDFGenerator()
-    return pdf_gen.generate_client_invoice(*args, **kwargs)
+    from utils import pdf
+    return pdf.create_pdf(*args, **kwargs)
 
 def create_internal_pdf(*args, **kwargs):
-    pdf_gen = PDFGenerator()
-    return pdf_gen.generate_internal_report(*args, **kwargs)
+    from utils import pdf
+    return pdf.create_internal_pdf(*args, **kwargs)
 
 
 def normalize_margins(margins_data, global_settings):
@@ -136,33 +27,16 @@ def normalize_margins(margins_data, global_settings):
     Handles both {'p': val, 'l': val, 'e': val} and {'part_margin': val, ...} formats.
     
     Args:
-        margins_data: Can be None, short format {'p', 'l', 'e'}, or full format
+        margins_data: Can be None, short format {'p', 'l', 'e'}, full format, or an estimates.Margins
         global_settings: The global settings dict with defaults
         
     Returns:
         dict: Standardized margins dict with 'part_margin', 'labor_margin', 'extra_margin' keys
     """
-    if margins_data is None:
-        return {
-            'part_margin': float(global_settings.get('part_margin', 15.0)),
-            'labor_margin': float(global_settings.get('labor_margin', 20.0)),
-            'extra_margin': float(global_settings.get('extra_margin', 5.0))
-        }
-    
-    # Handle short format {'p': val, 'l': val, 'e': val}
-    if 'p' in margins_data or 'l' in margins_data or 'e' in margins_data:
-        return {
-            'part_margin': float(margins_data.get('p', global_settings.get('part_margin', 15.0))),
-            'labor_margin': float(margins_data.get('l', global_settings.get('labor_margin', 20.0))),
-            'extra_margin': float(margins_data.get('e', global_settings.get('extra_margin', 5.0)))
-        }
-    
-    # Handle full format or return as-is
-    return {
-        'part_margin': float(margins_data.get('part_margin', global_settings.get('part_margin', 15.0))),
-        'labor_margin': float(margins_data.get('labor_margin', global_settings.get('labor_margin', 20.0))),
-        'extra_margin': float(margins_data.get('extra_margin', 5.0))
-    }
+    parsed = estimates.parse_margins(margins_data, global_settings)
+    if parsed is None:
+        parsed = estimates.default_margins(global_settings)
+    return parsed.as_settings()
 
 
 def get_advance_percentage(settings):
@@ -170,6 +44,15 @@ def get_advance_percentage(settings):
     return float(settings.get('advance_percentage', 10.0))
 
 
+# Amounts are rounded up to the next ₹100. Float noise (e.g. 12000.000000000002 from
+# summing item prices in a different order) must not push an exact multiple up a
+# step, so anything within ROUNDING_EPS hundreds of it counts as the multiple.
+ROUNDING_EPS = 1e-6
+
+def round_up_100(amount):
+    """Rounds up to the next ₹100 (the grand total and advance rule); utils/pricing.py applies the same rule to arrays."""
+    return math.ceil(amount / 100 - ROUNDING_EPS) * 100
+
 def calculate_estimate_details(edf_items_list, days, margins, global_settings):
     """
     Calculates various financial details for an estimate.
@@ -222,7 +105,7 @@ def calculate_estimate_details(edf_items_list, days, margins, global_settings):
     
     # CRITICAL: Calculate grand total and round ONCE (to nearest 100)
     raw_grand_total = mat_sell + labor_actual_cost
-    rounded_grand_total = math.ceil(raw_grand_total / 100) * 100
+    rounded_grand_total = round_up_100(raw_grand_total)
     
     # CRITICAL: Profit must be calculated from ROUNDED grand total for consistency
     total_profit = rounded_grand_total - total_base_cost
@@ -230,7 +113,7 @@ def calculate_estimate_details(edf_items_list, days, margins, global_settings):
     # CRITICAL: Advance uses ROUNDED grand total and profit calculation
     # Formula: (Material + Labor) + X% Profit Margin (from settings)
     adv_margin_pct = float(global_settings.get('advance_margin', 20.0)) / 100.0
-    advance_amount = math.ceil((total_base_cost * (1 + adv_margin_pct)) / 100) * 100
+    advance_amount = round_up_100(total_base_cost * (1 + adv_margin_pct))
     
     # Labor display includes rounding difference
     disp_lt = labor_actual_cost + (rounded_grand_total - raw_grand_total)
@@ -242,18 +125,56 @@ def calculate_estimate_details(edf_items_list, days, margins, global_settings):
         "total_profit": total_profit,
         "advance_amount": advance_amount,
         "disp_lt": disp_lt,
+        "total_base_cost": total_base_cost,
         "edf_details_df": edf_details_df
     }
 
-def calculate_profit_row(row):
-    """Calculates the profit for a single row in an estimate."""
-    qty = float(row.get('Qty', 0))
-    base_rate = float(row.get('Base Rate', 0))
-    unit = row.get('Unit', 'pcs')
-    total_sell = float(row.get('Total Sell Price', 0))
-    factor = CONVERSIONS.get(unit, 1.0)
-    total_cost = base_rate * qty * factor
-    return total_sell - total_cost
+
+# Denormalized estimate totals stored on `clients` at save time (see schema.sql)
+ESTIMATE_TOTAL_COLUMNS = ["est_material_sell", "est_base_cost", "est_labor_cost", "est_grand_total", "est_profit", "est_advance"]
+
+def estimate_totals(calc_results):
+    """
+    Maps the output of calculate_estimate_details to the stored total columns.
+
+    Args:
+        calc_results (dict): The dictionary returned by calculate_estimate_details.
+
+    Returns:
+        dict: Column name -> value, ready to be merged into a `clients` update.
+    """
+    return {
+        "est_material_sell": round(float(calc_results["mat_sell"]), 2),
+        "est_base_cost": round(float(calc_results["total_base_cost"]), 2),
+        "est_labor_cost": round(float(calc_results["labor_actual_cost"]), 2),
+        "est_grand_total": float(calc_results["rounded_grand_total"]),
+        "est_profit": round(float(calc_results["total_profit"]), 2),
+        "est_advance": float(calc_results["advance_amount"])
+    }
+
+def get_estimate_totals(client_row, global_settings, est=None):
+    """
+    Returns the estimate totals for a client row.
+
+    Uses the stored columns when present and only recomputes from the
+    `internal_estimate` JSON for rows saved before the columns existed.
+
+    Args:
+        client_row (dict): A `clients` row (dict or pandas Series).
+        global_settings (dict): Global settings used when recomputing.
+        est (estimates.Estimate): Already-parsed estimate for the row, if available.
+
+    Returns:
+        dict or None: Same keys as estimate_totals(), or None if the client has no estimate.
+    """
+    stored = client_row.get('est_grand_total')
+    if stored is not None and not pd.isna(stored):
+        return {col: 0.0 if pd.isna(client_row.get(col)) else float(client_row.get(col) or 0.0) for col in ESTIMATE_TOTAL_COLUMNS}
+    if est is None:
+        est = estimates.parse_estimate(client_row.get('internal_estimate'))
+    if est is None:
+        return None
+    return estimate_totals(est.calculate(global_settings))
 
 def create_item_dataframe(items):
     """
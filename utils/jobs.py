@@ -0,0 +1,283 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ---------------------------
+# BACKGROUND JOB RUNNER
+# ---------------------------
+# Long operations (bulk PDF export, estimate backfills and migrations, P&L
+# rebuilds) run in a small in-process thread pool instead of the user's
+# script run. Jobs are recorded in a local SQLite table, so the jobs panel in
+# any session (and after a restart) shows their status, progress and results.
+#
+# A job function is registered with register(kind, fn, title) and called as
+# fn(ctx, **params). It reports progress with ctx.progress(), which also
+# raises Cancelled once the user cancels the job, and it can store a
+# downloadable file with ctx.save_result(). Threads are used rather than
+# processes because jobs mostly wait on the database and share the app's
+# connection and caches. Several worker processes can share the table: a
+# worker claims a queued job with a conditional update (only one claim can
+# succeed) and records its pid on it. On start, queued jobs are picked up and
+# running jobs whose worker process is gone are marked failed; jobs running
+# in other live workers are left alone. Failed jobs can be retried.
+
+DEFAULT_JOBS_PATH = os.path.join(".cache", "jugnoo_jobs.sqlite3")
+JOBS_PATH_ENV = "JUGNOO_JOBS_DB"
+MAX_WORKERS = 2
+KEEP_SECONDS = 7 * 86400
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+ACTIVE = (QUEUED, RUNNING)
+
+
+class Cancelled(Exception):
+    """Raised inside a job by ctx.progress() after the job was cancelled."""
+
+
+class JobStore:
+    """The job table and result files (one SQLite connection per thread)."""
+
+    def __init__(self, path=DEFAULT_JOBS_PATH):
+        self.path = path
+        self.results_dir = os.path.splitext(path)[0] + "_results"  # next to the table, one folder per table
+        os.makedirs(self.results_dir, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, title TEXT, params TEXT NOT NULL, status TEXT NOT NULL, "
+            "progress REAL, message TEXT, error TEXT, result_path TEXT, result_name TEXT, result_mime TEXT, "
+            "cancel_requested INTEGER NOT NULL DEFAULT 0, created_by TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+            "owner_pid INTEGER, owner_host TEXT)"
+        )
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+        for col, typ in (("owner_pid", "INTEGER"), ("owner_host", "TEXT")):  # tables created before workers recorded their pid
+            if col not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {col} {typ}")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql, params=()):
+        conn = self._conn()
+        cur = conn.execute(sql, params)
+        conn.commit()
+        return cur
+
+    def get(self, job_id):
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def update(self, job_id, **fields):
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        self.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+
+    def claim(self, job_id):
+        """Marks a queued job running and owned by this process; False if it is no longer queued or was cancelled."""
+        cur = self.execute("UPDATE jobs SET status = ?, started_at = ?, progress = 0.0, owner_pid = ?, owner_host = ? "
+                           "WHERE id = ? AND status = ? AND cancel_requested = 0",
+                           (RUNNING, time.time(), os.getpid(), socket.gethostname(), job_id, QUEUED))
+        return cur.rowcount == 1
+
+    def purge(self):
+        cutoff = time.time() - KEEP_SECONDS
+        for row in self._conn().execute("SELECT result_path FROM jobs WHERE finished_at < ? AND result_path IS NOT NULL", (cutoff,)).fetchall():
+            try: os.remove(row["result_path"])
+            except OSError: pass
+        self.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+
+
+class JobContext:
+    """Passed to job functions: progress reporting, cancellation and result files."""
+
+    def __init__(self, store, job_id):
+        self._store = store
+        self.job_id = job_id
+
+    def cancelled(self):
+        job = self._store.get(self.job_id)
+        return bool(job and job["cancel_requested"])
+
+    def progress(self, done=None, total=None, message=None):
+        """
+        Records progress (done/total as a fraction when total is known) and
+        raises Cancelled if the user cancelled the job.
+        """
+        fields = {}
+        if done is not None and total:
+            fields["progress"] = min(max(float(done) / total, 0.0), 1.0)
+        if message is not None:
+            fields["message"] = message
+        if fields:
+            self._store.update(self.job_id, **fields)
+        if self.cancelled():
+            raise Cancelled()
+
+    def save_result(self, data, filename, mime="application/octet-stream"):
+        """Stores the job's downloadable output (bytes or str)."""
+        path = os.path.join(self._store.results_dir, f"{self.job_id}_{os.path.basename(filename)}")
+        with open(path, "wb") as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+        self._store.update(self.job_id, result_path=path, result_name=filename, result_mime=mime)
+
+
+# --- RUNNER ---
+_store = None
+_executor = None
+_started = False
+_lock = threading.Lock()
+_kinds = {}  # kind -> (fn, title)
+_mine = set()  # ids of jobs claimed by this process (a recorded pid may be a reused one)
+
+
+def configure(path=None, max_workers=MAX_WORKERS):
+    global _store, _executor
+    with _lock:
+        _store = JobStore(path or os.environ.get(JOBS_PATH_ENV) or DEFAULT_JOBS_PATH)
+        _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+    return _store
+
+
+def is_configured():
+    return _store is not None
+
+
+def get_store():
+    if _store is None:
+        configure()
+    return _store
+
+
+def register(kind, fn, title):
+    """Registers a job function: fn(ctx, **params). `title` is shown in the jobs panel."""
+    _kinds[kind] = (fn, title)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):  # exists but owned by another user, or not checkable here
+        return True
+    return True
+
+
+def _run(job_id):
+    store = get_store()
+    job = store.get(job_id)
+    if job is None or job["status"] != QUEUED:
+        return
+    entry = _kinds.get(job["kind"])
+    if entry is None:
+        store.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = ?",
+                      (FAILED, f"Unknown job kind {job['kind']!r}", time.time(), job_id, QUEUED))
+        return
+    if not store.claim(job_id):  # taken by another worker, or cancelled before it started
+        store.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ? AND cancel_requested = 1",
+                      (CANCELLED, time.time(), job_id, QUEUED))
+        return
+    _mine.add(job_id)
+    try:
+        message = entry[0](JobContext(store, job_id), **json.loads(job["params"]))
+    except Cancelled:
+        store.update(job_id, status=CANCELLED, finished_at=time.time())
+    except Exception as e:
+        print(f"Job {job_id} ({job['kind']}) failed: {e}")
+        store.update(job_id, status=FAILED, error=f"{type(e).__name__}: {e}", finished_at=time.time())
+    else:
+        fields = {"status": DONE, "progress": 1.0, "finished_at": time.time()}
+        if message: fields["message"] = str(message)
+        store.update(job_id, **fields)
+
+
+def submit(kind, params=None, user=None, title=None):
+    """
+    Queues a job and returns its id.
+
+    Args:
+        kind (str): A registered job kind.
+        params (dict): JSON-serializable keyword arguments for the job function.
+        user (str): Username shown in the jobs panel.
+        title (str): Overrides the registered title (e.g. "Export PDFs: Closed clients").
+    """
+    if kind not in _kinds:
+        raise KeyError(f"No job registered for {kind!r}")
+    store = get_store()  # configures the pool too
+    cur = store.execute("INSERT INTO jobs (kind, title, params, status, created_by, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (kind, title or _kinds[kind][1], json.dumps(params or {}, default=str), QUEUED, user, time.time()))
+    _executor.submit(_run, cur.lastrowid)
+    return cur.lastrowid
+
+
+def cancel(job_id):
+    """Queued jobs are cancelled before they start; running jobs stop at their next progress report."""
+    store = get_store()
+    store.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN (?, ?)", (job_id, *ACTIVE))
+    store.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?", (CANCELLED, time.time(), job_id, QUEUED))
+
+
+def retry(job_id):
+    """Runs a failed or cancelled job again with the same parameters."""
+    store = get_store()
+    cur = store.execute("UPDATE jobs SET status = ?, progress = NULL, message = NULL, error = NULL, cancel_requested = 0, "
+                        "started_at = NULL, finished_at = NULL WHERE id = ? AND status IN (?, ?)", (QUEUED, job_id, FAILED, CANCELLED))
+    if cur.rowcount:
+        _executor.submit(_run, job_id)
+
+
+def start():
+    """
+    Once per process: picks up queued jobs, fails jobs whose worker process is gone and purges old ones.
+
+    Jobs running in another live process on this host are left alone. Running
+    jobs recorded without a pid (before workers recorded one) are failed.
+    """
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    store = get_store()
+    store.purge()
+    host = socket.gethostname()
+    for row in store._conn().execute("SELECT id, owner_pid, owner_host FROM jobs WHERE status = ?", (RUNNING,)).fetchall():
+        pid = row["owner_pid"]
+        if pid is not None and (row["owner_host"] != host or (row["id"] in _mine if pid == os.getpid() else _alive(pid))):
+            continue
+        store.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = ? AND owner_pid IS ?",
+                      (FAILED, "Interrupted by a restart", time.time(), row["id"], RUNNING, pid))
+    for row in store._conn().execute("SELECT id FROM jobs WHERE status = ? ORDER BY id", (QUEUED,)).fetchall():
+        _executor.submit(_run, row["id"])
+
+
+def list_jobs(user=None, limit=20):
+    """Most recent jobs first (all users when `user` is None)."""
+    sql, params = "SELECT * FROM jobs", []
+    if user is not None:
+        sql += " WHERE created_by = ?"
+        params.append(user)
+    rows = get_store()._conn().execute(sql + " ORDER BY id DESC LIMIT ?", (*params, limit)).fetchall()
+    return [dict(r) for r in rows]
+
+
+def result_bytes(job):
+    """The stored output of a finished job, or None."""
+    if not job or not job.get("result_path"):
+        return None
+    try:
+        with open(job["result_path"], "rb") as f:
+            return f.read()
+    except OSError:
+        return None
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from utils import estimates, helpers
+
+# ---------------------------
+# BILL-OF-MATERIALS KITS
+# ---------------------------
+# A kit is a named list of lines stored in the `kits` table. Each line is
+# either an inventory item or another kit, with a quantity:
+#
+#     [{"item_id": 12, "qty": 4, "unit": "m"}, {"kit_id": 3, "qty": 2}]
+#
+# The Estimator adds a whole kit as estimate lines in one step. Expanding a
+# kit flattens nested kits (multiplying quantities and merging repeated
+# item/unit pairs) and prices the result. Both steps are cached per process:
+#
+# * the flattened structure per (kit, version of all kits), and
+# * the estimate lines and material totals per (kit, structure version,
+#   members' current name/unit/base_rate, pricing settings).
+#
+# So editing any kit, or changing the base rate of an item used by a kit,
+# gives a new key and the kit is expanded again on next use.
+
+MAX_DEPTH = 8
+EXPANSION_CACHE_SIZE = 128
+
+_flat = OrderedDict()
+_priced = OrderedDict()
+_lock = threading.Lock()
+
+
+def kit_map(kit_rows):
+    """kit id -> row"""
+    return {r['id']: r for r in kit_rows or []}
+
+
+def kits_version(kits_by_id):
+    """Short hash of every kit's lines; changes whenever any kit is edited."""
+    h = hashlib.sha1()
+    for kit_id in sorted(kits_by_id):
+        h.update(json.dumps([kit_id, kits_by_id[kit_id].get('lines') or []], sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _cached(store, key, build):
+    with _lock:
+        if key in store:
+            store.move_to_end(key)
+            return store[key]
+    value = build()
+    with _lock:
+        store[key] = value
+        while len(store) > EXPANSION_CACHE_SIZE:
+            store.popitem(last=False)
+    return value
+
+
+def flatten(kit_id, kits_by_id, _path=()):
+    """
+    Expands a kit into inventory quantities, following nested kits.
+
+    Args:
+        kit_id (int): Kit to expand.
+        kits_by_id (dict): kit id -> row (see kit_map).
+
+    Returns:
+        list: (item_id, unit or None, qty) tuples in first-use order; repeated item/unit pairs are summed.
+
+    Raises:
+        ValueError: On a missing kit, a kit that contains itself, or nesting deeper than MAX_DEPTH.
+    """
+    if kit_id in _path:
+        names = [str(kits_by_id.get(k, {}).get('name', k)) for k in _path + (kit_id,)]
+        raise ValueError(f"Kit contains itself: {' > '.join(names)}")
+    if len(_path) >= MAX_DEPTH:
+        raise ValueError(f"Kits are nested more than {MAX_DEPTH} levels deep")
+    kit = kits_by_id.get(kit_id)
+    if kit is None:
+        raise ValueError(f"Kit {kit_id} does not exist")
+    totals = {}
+    for line in kit.get('lines') or []:
+        qty = estimates.to_float(line.get('qty'), 1.0)
+        if line.get('kit_id') is not None:
+            for item_id, unit, sub_qty in flatten(line['kit_id'], kits_by_id, _path + (kit_id,)):
+                totals[(item_id, unit)] = totals.get((item_id, unit), 0.0) + qty * sub_qty
+        elif line.get('item_id') is not None:
+            key = (line['item_id'], line.get('unit') or None)
+            totals[key] = totals.get(key, 0.0) + qty
+    return [(item_id, unit, qty) for (item_id, unit), qty in totals.items()]
+
+
+def check(kit_id, lines, kits_by_id):
+    """Raises ValueError if saving `lines` as kit `kit_id` (None for a new kit) would create a cycle."""
+    trial = dict(kits_by_id)
+    trial[kit_id] = {**trial.get(kit_id, {}), 'id': kit_id, 'lines': lines}
+    flatten(kit_id, trial)
+
+
+def expand(kit_id, kits_by_id, items_by_id, global_settings, version=None):
+    """
+    Estimate lines and material totals of one unit of a kit, cached.
+
+    Args:
+        kit_id (int): Kit to expand.
+        kits_by_id (dict): kit id -> row (see kit_map).
+        items_by_id (dict): inventory id -> row (needs item_name, unit, base_rate).
+        global_settings (dict): Settings used for the default part/labor/extra margins.
+        version (str): kits_version(kits_by_id), if the caller already has it.
+
+    Returns:
+        dict: {"records": [{"Item", "Qty", "Unit", "Base Rate"}, ...], "missing": item ids no longer in inventory,
+               "material_cost": float, "material_sell": float} at the default margins.
+    """
+    version = version or kits_version(kits_by_id)
+    flat = _cached(_flat, (kit_id, version), lambda: flatten(kit_id, kits_by_id))
+    members = tuple((item_id, *(str(items_by_id[item_id].get(c)) for c in ('item_name', 'unit', 'base_rate')))
+                    for item_id, _, _ in flat if item_id in items_by_id)
+    pricing = tuple(str(global_settings.get(k)) for k in ('part_margin', 'labor_margin', 'extra_margin'))
+    return _cached(_priced, (kit_id, version, members, pricing), lambda: _price(flat, items_by_id, global_settings))
+
+
+def _price(flat, items_by_id, global_settings):
+    records, missing = [], []
+    for item_id, unit, qty in flat:
+        item = items_by_id.get(item_id)
+        if item is None:
+            missing.append(item_id)
+            continue
+        records.append({"Item": item.get('item_name'), "Qty": qty, "Unit": unit or item.get('unit') or 'pcs',
+                        "Base Rate": estimates.to_float(item.get('base_rate'))})
+    calc = helpers.calculate_estimate_details(records, 0, estimates.default_margins(global_settings).as_settings(), global_settings)
+    return {"records": records, "missing": missing, "material_cost": calc["total_base_cost"], "material_sell": calc["mat_sell"]}
+
+
+def scaled_records(expansion, multiplier=1.0):
+    """Copies of a kit's estimate lines for `multiplier` units of the kit."""
+    return [{**r, "Qty": round(r["Qty"] * multiplier, 4)} for r in expansion["records"]]
+
+
+def lines_from_records(records, item_ids):
+    """
+    Kit lines for estimate rows (e.g. "save these items as a kit").
+
+    Args:
+        records (list): Estimate rows (Item/Qty/Unit).
+        item_ids (dict): inventory item name -> id (see estimates.inventory_maps).
+
+    Returns:
+        tuple: (lines, names of rows skipped because they are not inventory items)
+    """
+    lines, skipped = [], []
+    for r in records:
+        item_id = item_ids.get(r.get('Item'))
+        qty = estimates.to_float(r.get('Qty'))
+        if item_id is None:
+            if r.get('Item'): skipped.append(r['Item'])
+            continue
+        if qty > 0:
+            lines.append({"item_id": item_id, "qty": qty, "unit": r.get('Unit') or None})
+    return lines, skipped
@@ -0,0 +1,208 @@
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from utils import estimates
+
+# ---------------------------
+# PER-STAFF LABOR COSTING
+# ---------------------------
+# Estimates price labor as days x settings.daily_labor_cost. The actual cost
+# of a project is the wages of the staff who worked on it. Every change to
+# clients.assigned_staff is recorded in the `staff_assignments` table (one
+# row per staff member and project, with the daily wage at the time and
+# assigned_on / released_on dates), so the cost of a project survives the
+# team being released on "Work Done" or moved to another project.
+#
+# compute() costs all assignments in one vectorized pass (pandas/numpy):
+# each assignment becomes one row per calendar day, a staff member's wage for
+# a day is split evenly over the projects they were assigned to that day,
+# and the staff-days are summed per project, per staff member and per pair.
+# Projects without any recorded assignment keep the estimated labor cost.
+
+MAX_SPAN_DAYS = 365  # an assignment left open longer than this is costed for its first year only
+ACTUAL, ESTIMATED = "Actual", "Estimated"
+
+
+def _day(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+# --- RECORDING ---
+def record_assignment_changes(supabase, client_id, assigned, released, on_date, wages, release_all=False):
+    """
+    Opens assignments for `assigned` staff and closes them for `released` staff.
+
+    Safe to run again (the write queue retries it): staff who already have an
+    open assignment on the project are not assigned twice, and only open
+    assignments are released.
+
+    Args:
+        supabase: Supabase client.
+        client_id (int): Project.
+        assigned (list): Staff ids now on the project.
+        released (list): Staff ids taken off the project.
+        on_date (str|date): Date of the change (ISO string or date).
+        wages (dict): staff id -> daily wage to record with new assignments.
+        release_all (bool): Close every open assignment of the project (it is finished).
+    """
+    if not assigned and not released and not release_all:
+        return
+    on_date = _day(on_date).isoformat()
+    resp = supabase.table("staff_assignments").select("id, staff_id, released_on").eq("client_id", client_id).execute()
+    open_rows = {r['staff_id']: r['id'] for r in (resp.data or []) if not r.get('released_on')}
+    new_rows = [{"client_id": client_id, "staff_id": sid, "daily_wage": estimates.to_float(wages.get(sid, wages.get(str(sid)))), "assigned_on": on_date}
+                for sid in dict.fromkeys(assigned or []) if sid not in open_rows]
+    if new_rows:
+        supabase.table("staff_assignments").insert(new_rows).execute()
+    closing = list(open_rows.values()) if release_all else [open_rows[sid] for sid in released or [] if sid in open_rows]
+    if closing:
+        supabase.table("staff_assignments").update({"released_on": on_date}).in_("id", closing).execute()
+
+
+def backfill_rows(client_rows, staff_rows, existing, today=None):
+    """
+    Assignment rows for staff currently in clients.assigned_staff without an open assignment.
+
+    They start on the client's start_date (today when it has none) at the staff member's current wage.
+
+    Args:
+        client_rows (list): `clients` rows with id, assigned_staff and start_date.
+        staff_rows (list): `staff` rows with id and salary.
+        existing (list): Current `staff_assignments` rows.
+        today (date): Defaults to today.
+    """
+    today = today or date.today()
+    wages = {s['id']: estimates.to_float(s.get('salary')) for s in staff_rows or []}
+    open_pairs = {(r['client_id'], r['staff_id']) for r in existing or [] if not r.get('released_on')}
+    rows = []
+    for c in client_rows or []:
+        start = _day(c['start_date']) if c.get('start_date') else today
+        for sid in c.get('assigned_staff') or []:
+            if (c['id'], sid) not in open_pairs and sid in wages:
+                rows.append({"client_id": c['id'], "staff_id": sid, "daily_wage": wages[sid], "assigned_on": min(start, today).isoformat()})
+                open_pairs.add((c['id'], sid))
+    return rows
+
+
+# --- COSTING ---
+class LaborCosts:
+    """Result of compute(): DataFrames of actual labor days and cost."""
+
+    def __init__(self, detail, by_project, by_staff):
+        self.detail = detail          # client_id, staff_id, name, days, cost
+        self.by_project = by_project  # index client_id: days, cost, staff
+        self.by_staff = by_staff      # staff_id, name, role, days, cost, projects
+
+    def project_cost(self, client_id):
+        """Actual labor cost of a project, or None when it has no recorded assignments."""
+        return float(self.by_project.at[client_id, 'cost']) if client_id in self.by_project.index else None
+
+    def project_breakdown(self, client_id):
+        """Rows of (name, days, cost) for one project, highest cost first."""
+        d = self.detail[self.detail['client_id'] == client_id].sort_values('cost', ascending=False)
+        return list(zip(d['name'], d['days'].round(2), d['cost'].round(2)))
+
+
+_DETAIL_COLS = ['client_id', 'staff_id', 'name', 'days', 'cost']
+_STAFF_COLS = ['staff_id', 'name', 'role', 'days', 'cost', 'projects']
+_last = (None, None, None, None)
+
+
+def _empty():
+    return LaborCosts(pd.DataFrame(columns=_DETAIL_COLS), pd.DataFrame(columns=['days', 'cost', 'staff']).rename_axis('client_id'),
+                      pd.DataFrame(columns=_STAFF_COLS))
+
+
+def compute(assignment_rows, staff_rows, today=None):
+    """
+    Actual labor days and cost per project and per staff member.
+
+    Open assignments are costed up to `today`. The result is kept for the last
+    (assignments, staff, today) arguments, so reruns on the same cached fetch reuse it.
+
+    Args:
+        assignment_rows (list): `staff_assignments` rows.
+        staff_rows (list): `staff` rows; their salary is used where an assignment has no recorded wage.
+        today (date): Defaults to today.
+
+    Returns:
+        LaborCosts
+    """
+    global _last
+    today = today or date.today()
+    rows0, staff0, today0, cached = _last
+    if rows0 is assignment_rows and staff0 is staff_rows and today0 == today:
+        return cached
+    result = _compute(assignment_rows, staff_rows, today)
+    _last = (assignment_rows, staff_rows, today, result)
+    return result
+
+
+def _compute(assignment_rows, staff_rows, today):
+    if not assignment_rows:
+        return _empty()
+    a = pd.DataFrame(assignment_rows)
+    staff = pd.DataFrame(staff_rows or [], columns=['id', 'name', 'role', 'salary']).drop_duplicates('id').set_index('id')
+
+    start = pd.to_datetime(a['assigned_on'].astype(str).str[:10], errors='coerce')
+    end = pd.to_datetime(a.get('released_on', pd.Series(index=a.index, dtype=object)).astype(str).str[:10], errors='coerce')
+    end = end.fillna(pd.Timestamp(today))
+    ok = start.notna()
+    start_d = start[ok].to_numpy(dtype='datetime64[D]')
+    n = np.clip((end[ok].to_numpy(dtype='datetime64[D]') - start_d).astype(int) + 1, 0, MAX_SPAN_DAYS)
+    a = a[ok]
+
+    wage = pd.to_numeric(a.get('daily_wage', pd.Series(np.nan, index=a.index)), errors='coerce').to_numpy(dtype=float)
+    current = pd.to_numeric(staff['salary'].reindex(a['staff_id']), errors='coerce').to_numpy(dtype=float)
+    wage = np.where(np.isnan(wage) | (wage <= 0), current, wage)
+    wage = np.nan_to_num(wage)
+
+    # One row per assignment-day: repeat each assignment n times, offset by 0..n-1 days
+    idx = np.repeat(np.arange(len(a)), n)
+    offset = np.arange(len(idx)) - np.repeat(np.cumsum(n) - n, n)
+    days = pd.DataFrame({"client_id": a['client_id'].to_numpy()[idx], "staff_id": a['staff_id'].to_numpy()[idx],
+                         "day": start_d[idx] + offset.astype('timedelta64[D]'), "wage": wage[idx]})
+    days = days.drop_duplicates(['client_id', 'staff_id', 'day'])  # overlapping rows for the same pair count once
+    share = 1.0 / days.groupby(['staff_id', 'day'])['client_id'].transform('size').to_numpy()
+    days['days'] = share
+    days['cost'] = share * days['wage'].to_numpy()
+
+    detail = days.groupby(['client_id', 'staff_id'], as_index=False)[['days', 'cost']].sum()
+    detail.insert(2, 'name', staff['name'].reindex(detail['staff_id']).fillna('(removed)').to_numpy())
+    by_project = detail.groupby('client_id').agg(days=('days', 'sum'), cost=('cost', 'sum'), staff=('staff_id', 'nunique'))
+    by_staff = detail.groupby('staff_id', as_index=False).agg(days=('days', 'sum'), cost=('cost', 'sum'), projects=('client_id', 'nunique'))
+    by_staff.insert(1, 'name', staff['name'].reindex(by_staff['staff_id']).fillna('(removed)').to_numpy())
+    by_staff.insert(2, 'role', staff['role'].reindex(by_staff['staff_id']).fillna('').to_numpy())
+    return LaborCosts(detail, by_project, by_staff.sort_values('cost', ascending=False, ignore_index=True))
+
+
+def apply_actual(pl_df, costs):
+    """
+    Replaces estimated labor with actual labor in a P&L project table.
+
+    Args:
+        pl_df (pd.DataFrame): One row per project with client_id, Revenue, Cost, Profit, Material Cost, Labor Cost.
+        costs (LaborCosts): From compute().
+
+    Returns:
+        pd.DataFrame: A copy with Labor Cost, Cost and Profit updated where the project has
+                      recorded assignments and estimate totals, and a "Labor Basis" column
+                      (Actual / Estimated).
+    """
+    df = pl_df.copy()
+    if df.empty or 'client_id' not in df:
+        return df
+    actual = df['client_id'].map(costs.by_project['cost']) if len(costs.by_project) else pd.Series(np.nan, index=df.index)
+    # Rows without estimate totals (Cost 0) have no material cost or profit to correct, so they stay estimated
+    has = actual.notna() & (df['Cost'] > 0)
+    df.loc[has, 'Profit'] = df.loc[has, 'Profit'] + df.loc[has, 'Labor Cost'] - actual[has]
+    df.loc[has, 'Labor Cost'] = actual[has]
+    df.loc[has, 'Cost'] = df.loc[has, 'Material Cost'] + actual[has]
+    df['Labor Basis'] = np.where(has, ACTUAL, ESTIMATED)
+    return df
@@ -0,0 +1,223 @@
+"""
+Maintenance jobs run outside the Streamlit app.
+
+Usage:
+    python -m utils.maintenance backfill-totals [--all] [--batch-size 200]
+    python -m utils.maintenance migrate-estimates [--dry-run] [--batch-size 200]
+    python -m utils.maintenance rebuild-rollups [--batch-size 200]
+    python -m utils.maintenance backfill-payments [--batch-size 200]
+    python -m utils.maintenance backfill-assignments [--batch-size 200]
+"""
+import argparse
+import json
+import os
+import sys
+
+from utils import estimates, helpers, labor, rollups
+
+
+def get_client():
+    """Creates a Supabase client from the environment or .streamlit/secrets.toml."""
+    from supabase import create_client
+    url, key = os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY")
+    if not (url and key):
+        import tomllib
+        with open(os.path.join(".streamlit", "secrets.toml"), "rb") as f:
+            secrets = tomllib.load(f)
+        url, key = secrets["SUPABASE_URL"], secrets["SUPABASE_KEY"]
+    return create_client(url, key)
+
+
+def get_settings(supabase):
+    res = supabase.table("settings").select("*").eq("id", 1).execute()
+    return res.data[0] if res and res.data else {}
+
+
+def iter_client_batches(supabase, columns, batch_size=200):
+    """Yields pages of `clients` rows ordered by id."""
+    start = 0
+    while True:
+        res = supabase.table("clients").select(columns).order("id").range(start, start + batch_size - 1).execute()
+        rows = res.data if res and res.data else []
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        start += batch_size
+
+
+def backfill_estimate_totals(supabase, settings=None, only_missing=True, batch_size=200, progress=None):
+    """
+    Writes the denormalized estimate total columns for existing clients.
+
+    Args:
+        supabase: Supabase client (or any object with the same query interface).
+        settings (dict): Global settings used for rows without stored totals. Fetched if None.
+        only_missing (bool): Skip rows that already have `est_grand_total`.
+        batch_size (int): Rows fetched per page.
+        progress (callable): Optional callback(done_count) after each page.
+
+    Returns:
+        int: Number of rows updated.
+    """
+    settings = settings if settings is not None else get_settings(supabase)
+    updated = 0
+    for rows in iter_client_batches(supabase, "id, internal_estimate, est_grand_total", batch_size):
+        for row in rows:
+            if only_missing and row.get('est_grand_total') is not None:
+                continue
+            try:
+                est = estimates.parse_estimate(row.get('internal_estimate'))
+            except ValueError as e:
+                print(f"  skipping client {row['id']}: {e}")
+                continue
+            if est is None:
+                continue
+            supabase.table("clients").update(helpers.estimate_totals(est.calculate(settings))).eq("id", row['id']).execute()
+            updated += 1
+        if progress:
+            progress(updated)
+    return updated
+
+
+def get_inventory_rows(supabase):
+    res = supabase.table("inventory").select("id, item_name").execute()
+    return res.data if res and res.data else []
+
+
+def migrate_estimates(supabase, dry_run=False, batch_size=200, progress=None):
+    """
+    Rewrites `internal_estimate` values stored in an older layout as v2.
+
+    Args:
+        supabase: Supabase client.
+        dry_run (bool): Only count rows and bytes, do not write.
+        batch_size (int): Rows fetched per page.
+        progress (callable): Optional callback(migrated_count) after each page.
+
+    Returns:
+        tuple: (rows migrated, JSON bytes before, JSON bytes after).
+    """
+    item_names, item_ids = estimates.inventory_maps(get_inventory_rows(supabase))
+    migrated = bytes_before = bytes_after = 0
+    for rows in iter_client_batches(supabase, "id, internal_estimate", batch_size):
+        for row in rows:
+            raw = row.get('internal_estimate')
+            try:
+                est = estimates.parse_estimate(raw, item_names)
+            except ValueError as e:
+                print(f"  skipping client {row['id']}: {e}")
+                continue
+            if est is None or est.version >= estimates.SCHEMA_VERSION:
+                continue
+            new = estimates.serialize_estimate(est, item_ids)
+            bytes_before += len(json.dumps(raw))
+            bytes_after += len(json.dumps(new))
+            if not dry_run:
+                supabase.table("clients").update({"internal_estimate": new}).eq("id", row['id']).execute()
+            migrated += 1
+        if progress:
+            progress(migrated)
+    return migrated, bytes_before, bytes_after
+
+
+def backfill_payments(supabase, batch_size=200, progress=None):
+    """
+    Moves `final_settlement_amount` values into the payments ledger.
+
+    Each client with a settlement and no running total gets one ledger row
+    for that amount (dated at its start date, else its creation date) and
+    its `amount_paid` set.
+
+    Returns:
+        int: Number of clients migrated.
+    """
+    migrated = 0
+    for rows in iter_client_batches(supabase, "id, created_at, start_date, final_settlement_amount, amount_paid", batch_size):
+        for row in rows:
+            amount = estimates.to_float(row.get('final_settlement_amount'))
+            if row.get('amount_paid') is not None or amount <= 0:
+                continue
+            paid_on = str(row.get('start_date') or row.get('created_at') or "")[:10] or None
+            supabase.table("payments").insert({"client_id": row['id'], "amount": amount, "paid_on": paid_on, "note": "Final settlement (migrated)"}).execute()
+            supabase.table("clients").update({"amount_paid": amount, "last_payment_at": paid_on}).eq("id", row['id']).execute()
+            migrated += 1
+        if progress:
+            progress(migrated)
+    return migrated
+
+
+def backfill_assignments(supabase, batch_size=200, progress=None):
+    """
+    Opens `staff_assignments` rows for staff currently in clients.assigned_staff.
+
+    Each assignment starts on the client's start date (today if it has none)
+    at the staff member's current wage (see labor.backfill_rows). Pairs that
+    already have an open assignment are skipped.
+
+    Returns:
+        int: Number of assignments written.
+    """
+    staff = supabase.table("staff").select("id, salary").execute().data or []
+    existing = supabase.table("staff_assignments").select("client_id, staff_id, released_on").execute().data or []
+    written = 0
+    for rows in iter_client_batches(supabase, "id, start_date, assigned_staff", batch_size):
+        new_rows = labor.backfill_rows(rows, staff, existing)
+        if new_rows:
+            supabase.table("staff_assignments").insert(new_rows).execute()
+            existing = existing + new_rows
+            written += len(new_rows)
+        if progress:
+            progress(written)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.maintenance", description="JugnooCRM maintenance jobs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_totals = sub.add_parser("backfill-totals", help="Write stored estimate totals for existing clients")
+    p_totals.add_argument("--all", action="store_true", help="Recompute rows that already have totals")
+    p_totals.add_argument("--batch-size", type=int, default=200)
+
+    p_migrate = sub.add_parser("migrate-estimates", help="Rewrite estimates in the compact v2 format")
+    p_migrate.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    p_migrate.add_argument("--batch-size", type=int, default=200)
+
+    p_rollups = sub.add_parser("rebuild-rollups", help="Recompute the monthly P&L rollups from scratch")
+    p_rollups.add_argument("--batch-size", type=int, default=200)
+
+    p_payments = sub.add_parser("backfill-payments", help="Move final settlement amounts into the payments ledger")
+    p_payments.add_argument("--batch-size", type=int, default=200)
+
+    p_assign = sub.add_parser("backfill-assignments", help="Record current staff assignments for labor costing")
+    p_assign.add_argument("--batch-size", type=int, default=200)
+
+    args = parser.parse_args(argv)
+    supabase = get_client()
+
+    if args.command == "backfill-totals":
+        n = backfill_estimate_totals(supabase, only_missing=not args.all, batch_size=args.batch_size,
+                                     progress=lambda done: print(f"  updated {done} rows"))
+        print(f"Backfill complete: {n} clients updated.")
+    elif args.command == "migrate-estimates":
+        n, before, after = migrate_estimates(supabase, dry_run=args.dry_run, batch_size=args.batch_size,
+                                             progress=lambda done: print(f"  migrated {done} rows"))
+        verb = "Would migrate" if args.dry_run else "Migrated"
+        print(f"{verb} {n} estimates: {before:,} -> {after:,} bytes of JSON.")
+    elif args.command == "rebuild-rollups":
+        n = rollups.rebuild(supabase, get_settings(supabase), batch_size=args.batch_size,
+                            progress=lambda months: print(f"  {months} months so far"))
+        print(f"Rebuild complete: {n} months written.")
+    elif args.command == "backfill-payments":
+        n = backfill_payments(supabase, batch_size=args.batch_size, progress=lambda done: print(f"  migrated {done} clients"))
+        print(f"Backfill complete: {n} settlements moved to the payments ledger.")
+    elif args.command == "backfill-assignments":
+        n = backfill_assignments(supabase, batch_size=args.batch_size, progress=lambda done: print(f"  {done} assignments so far"))
+        print(f"Backfill complete: {n} staff assignments recorded.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
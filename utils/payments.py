@@ -0,0 +1,148 @@
+"""
+Payment ledger (`payments` table) and per-client balances.
+
+Every payment (advance, installment, final settlement) is one ledger row.
+The running total is kept on the client row (`clients.amount_paid`,
+`clients.last_payment_at`) and updated on each insert, so outstanding
+balances and receivables ageing are read from the clients table without
+summing the ledger.
+"""
+from datetime import date, datetime
+
+from utils import connection, estimates
+
+AGEING_BUCKETS = [(30, "0-30 days"), (60, "31-60 days"), (90, "61-90 days"), (None, "90+ days")]
+BALANCE_COLUMNS = "id, name, status, created_at, est_grand_total, amount_paid, final_settlement_amount, last_payment_at"
+
+
+def paid_amount(client_row):
+    """
+    Total collected from a client.
+
+    Rows saved before the ledger existed only have `final_settlement_amount`.
+    """
+    paid = client_row.get('amount_paid')
+    if paid is None or estimates.to_float(paid, None) is None:
+        paid = client_row.get('final_settlement_amount')
+    return estimates.to_float(paid)
+
+
+def balance(client_row):
+    """Quoted grand total minus collected (negative when overpaid)."""
+    return estimates.to_float(client_row.get('est_grand_total')) - paid_amount(client_row)
+
+
+def ageing_bucket(age_days):
+    for limit, label in AGEING_BUCKETS:
+        if limit is None or age_days <= limit:
+            return label
+    return AGEING_BUCKETS[-1][1]
+
+
+def _as_date(value):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.fromisoformat(str(value)[:10]).date()
+    except ValueError:
+        return None
+
+
+def total_collected(supabase, page_size=1000):
+    """Cash collected from all clients, open projects included (reads only the paid columns, paged)."""
+    total, start = 0.0, 0
+    while True:
+        res = (supabase.table("clients").select("id, amount_paid, final_settlement_amount")
+               .order("id").range(start, start + page_size - 1).execute())
+        page = res.data if res and res.data else []
+        total += sum(paid_amount(r) for r in page)
+        if len(page) < page_size:
+            return total
+        start += page_size
+
+
+def receivables(client_rows, today=None):
+    """
+    Clients with money still owed, oldest first.
+
+    Age is counted from the last payment, or from the client's creation
+    date when nothing has been paid yet.
+
+    Args:
+        client_rows (list): `clients` rows with the BALANCE_COLUMNS fields.
+        today (date): Reference date for ageing. Defaults to today.
+
+    Returns:
+        list: Dicts with id, name, status, quoted, paid, balance, age_days and bucket.
+    """
+    today = today or date.today()
+    out = []
+    for row in client_rows or []:
+        bal = balance(row)
+        if bal <= 0:
+            continue
+        since = _as_date(row.get('last_payment_at')) or _as_date(row.get('created_at')) or today
+        age = max((today - since).days, 0)
+        out.append({
+            "id": row.get('id'), "name": row.get('name'), "status": row.get('status'),
+            "quoted": estimates.to_float(row.get('est_grand_total')), "paid": paid_amount(row),
+            "balance": bal, "age_days": age, "bucket": ageing_bucket(age),
+        })
+    out.sort(key=lambda r: r["age_days"], reverse=True)
+    return out
+
+
+def ageing_summary(receivable_rows):
+    """Outstanding amount per ageing bucket, in bucket order."""
+    totals = {label: 0.0 for _, label in AGEING_BUCKETS}
+    for r in receivable_rows:
+        totals[r["bucket"]] += r["balance"]
+    return totals
+
+
+# --- PERSISTENCE ---
+def get_payments(supabase, client_id):
+    res = supabase.table("payments").select("*").eq("client_id", client_id).order("paid_on").order("id").execute()
+    return res.data if res and res.data else []
+
+
+def record_payment(supabase, client_id, amount, paid_on=None, method=None, note=None, username=None):
+    """
+    Appends a payment to the ledger and adds it to the client's running total.
+
+    Uses the `record_payment` SQL function (insert and balance update in one
+    transaction). Only when that function is not deployed are the two writes
+    performed directly; any other error (including a timeout, after which the
+    function may have committed) is raised, so the payment is never recorded twice.
+
+    The direct path reads `amount_paid`, adds the amount and writes it back, so
+    two payments for the same client recorded at the same moment from different
+    hosts can lose one from the running total (the ledger keeps both). Deploy
+    the function to avoid this; the write queue already applies one write at a time per host.
+
+    Returns:
+        float: The client's new `amount_paid`.
+    """
+    paid_on = (paid_on or date.today()).isoformat()
+    try:
+        res = supabase.rpc("record_payment", {
+            "p_client_id": client_id, "p_amount": amount, "p_paid_on": paid_on,
+            "p_method": method, "p_note": note, "p_created_by": username,
+        }).execute()
+        return estimates.to_float(res.data if res is not None else None)
+    except Exception as e:
+        if not connection.function_missing(e):
+            raise
+        print(f"record_payment SQL function not deployed, writing directly: {e}")
+    supabase.table("payments").insert({
+        "client_id": client_id, "amount": amount, "paid_on": paid_on,
+        "method": method, "note": note, "created_by": username,
+    }).execute()
+    cur = supabase.table("clients").select("amount_paid, final_settlement_amount").eq("id", client_id).execute()
+    new_paid = (paid_amount(cur.data[0]) if cur and cur.data else 0.0) + float(amount)
+    supabase.table("clients").update({"amount_paid": new_paid, "last_payment_at": datetime.now().isoformat()}).eq("id", client_id).execute()
+    return new_paid
@@ -0,0 +1,253 @@
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils import estimates, helpers
+
+# ---------------------------
+# VECTORIZED ESTIMATE PRICING
+# ---------------------------
+# calculate_estimate_details prices one estimate from its item rows. Its
+# result depends on the items only through the material base cost
+# (sum of base_rate * qty * unit factor), so an estimate reduces to
+# (material base, days, margins). price() applies the same formulas and
+# rounding rules (helpers.round_up_100) to whole arrays of estimates and
+# settings at once (numpy broadcasting). Summing item prices in another order
+# changes totals only by float noise, which the shared rounding ignores, so
+# the results equal calculate_estimate_details'; benchmarks/pricing_parity.py
+# checks this. The what-if simulator sweeps settings over every open
+# estimate with it.
+
+SETTING_KEYS = ("part_margin", "labor_margin", "extra_margin", "daily_labor_cost", "advance_margin")
+SETTING_DEFAULTS = {"part_margin": 20.0, "labor_margin": 20.0, "extra_margin": 10.0, "daily_labor_cost": 1000.0, "advance_margin": 20.0}
+MAX_CELLS = 2_000_000  # scenarios x estimates evaluated per chunk
+MAX_SCENARIOS = 20_000
+
+
+def material_base(est):
+    """Material cost before margins (the `total_material_base_cost` of calculate_estimate_details)."""
+    total = 0.0
+    for item in est.items:
+        try: total += float(item.base_rate) * float(item.qty) * helpers.CONVERSIONS.get(item.unit, 1.0)
+        except (TypeError, ValueError): pass
+    return total
+
+
+def _round_up_100(amount):
+    """helpers.round_up_100 on arrays."""
+    return np.ceil(amount / 100 - helpers.ROUNDING_EPS) * 100
+
+
+def price(material_base, days, markup_pct, daily_labor_cost, advance_margin):
+    """
+    calculate_estimate_details on arrays; arguments broadcast against each other.
+
+    Args:
+        material_base: Material cost before margins.
+        days: Labor days.
+        markup_pct: Part + labor + extra margin, in percent.
+        daily_labor_cost: Cost of one labor day.
+        advance_margin: Advance profit margin, in percent.
+
+    Returns:
+        dict: Arrays under the keys calculate_estimate_details uses (mat_sell, labor_actual_cost,
+              rounded_grand_total, total_profit, advance_amount, total_base_cost).
+    """
+    mat_sell = material_base * (1 + np.asarray(markup_pct, dtype=float) / 100)
+    labor = np.asarray(days, dtype=float) * daily_labor_cost
+    base = material_base + labor
+    rounded = _round_up_100(mat_sell + labor)
+    advance = _round_up_100(base * (1 + np.asarray(advance_margin, dtype=float) / 100))
+    return {"mat_sell": mat_sell, "labor_actual_cost": labor, "rounded_grand_total": rounded,
+            "total_profit": rounded - base, "advance_amount": advance, "total_base_cost": base}
+
+
+def current_settings(global_settings):
+    gs = global_settings or {}
+    return {k: estimates.to_float(gs.get(k), SETTING_DEFAULTS[k]) for k in SETTING_KEYS}
+
+
+# --- PIPELINE ---
+class Pipeline:
+    """Open estimates as arrays: one entry per client with a parsed estimate."""
+
+    def __init__(self, ids, names, material, days, custom_markup):
+        self.ids = np.asarray(ids)
+        self.names = list(names)
+        self.material = np.asarray(material, dtype=float)
+        self.days = np.asarray(days, dtype=float)
+        self.custom_markup = np.asarray(custom_markup, dtype=float)  # NaN -> global margins
+        self.has_custom = ~np.isnan(self.custom_markup)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def markup(self, global_markup):
+        """(scenarios, estimates) markup: the estimate's own margins, else the scenario's global ones."""
+        return np.where(self.has_custom, self.custom_markup, np.asarray(global_markup, dtype=float)[:, None])
+
+
+_last_pipeline = (None, None, None, None)
+
+
+def load_pipeline(client_rows, parsed_estimates, statuses=None):
+    """
+    Builds the Pipeline of clients in `statuses` (default: helpers.ACTIVE_STATUSES).
+
+    The result is kept for the last (rows, parsed) pair, so reruns on the same cached fetch reuse it.
+
+    Args:
+        client_rows (list): `clients` rows (get_clients().data).
+        parsed_estimates (dict): client id -> Estimate (estimates.parse_clients).
+        statuses (list): Client statuses to include.
+    """
+    global _last_pipeline
+    statuses = tuple(statuses or helpers.ACTIVE_STATUSES)
+    rows0, parsed0, statuses0, cached = _last_pipeline
+    if rows0 is client_rows and parsed0 is parsed_estimates and statuses0 == statuses:
+        return cached
+    ids, names, material, days, custom = [], [], [], [], []
+    for row in client_rows or []:
+        est = parsed_estimates.get(row.get('id'))
+        if est is None or row.get('status') not in statuses:
+            continue
+        ids.append(row['id'])
+        names.append(row.get('name'))
+        material.append(material_base(est))
+        days.append(est.days)
+        custom.append(np.nan if est.margins is None else sum(est.margins.as_settings().values()))
+    pipe = Pipeline(ids, names, material, days, custom)
+    _last_pipeline = (client_rows, parsed_estimates, statuses, pipe)
+    return pipe
+
+
+# --- WHAT-IF SWEEPS ---
+def grid(**values):
+    """
+    Cartesian product of setting values as a DataFrame (one row per scenario).
+
+    Args:
+        **values: setting name (see SETTING_KEYS) -> list of values.
+    """
+    keys = list(values)
+    rows = list(itertools.product(*(values[k] for k in keys)))
+    if len(rows) > MAX_SCENARIOS:
+        raise ValueError(f"{len(rows):,} scenarios; narrow the ranges to at most {MAX_SCENARIOS:,}")
+    return pd.DataFrame(rows, columns=keys)
+
+
+def sweep(pipeline, scenarios, baseline):
+    """
+    Pipeline totals for every scenario, and their change against `baseline`.
+
+    Args:
+        pipeline (Pipeline): Estimates to price.
+        scenarios (pd.DataFrame): One row per scenario; missing setting columns take the baseline value.
+        baseline (dict): Current settings (see current_settings).
+
+    Returns:
+        tuple: (DataFrame with the settings, revenue, profit, advance and their deltas per scenario,
+                elapsed milliseconds)
+    """
+    started = time.perf_counter()
+    sc = scenarios.copy()
+    for k in SETTING_KEYS:
+        if k not in sc:
+            sc[k] = baseline[k]
+    base_row = pd.DataFrame([baseline])[list(SETTING_KEYS)]
+    settings = pd.concat([base_row, sc[list(SETTING_KEYS)]], ignore_index=True)
+    totals = np.zeros((len(settings), 3))
+    chunk = max(1, MAX_CELLS // max(len(pipeline), 1))
+    for start in range(0, len(settings), chunk):
+        part = settings.iloc[start:start + chunk]
+        markup = pipeline.markup(part['part_margin'].to_numpy() + part['labor_margin'].to_numpy() + part['extra_margin'].to_numpy())
+        res = price(pipeline.material, pipeline.days, markup,
+                    part['daily_labor_cost'].to_numpy()[:, None], part['advance_margin'].to_numpy()[:, None])
+        totals[start:start + len(part)] = np.stack([res["rounded_grand_total"].sum(axis=1), res["total_profit"].sum(axis=1),
+                                                    res["advance_amount"].sum(axis=1)], axis=1)
+    out = sc.reset_index(drop=True)
+    for i, col in enumerate(("revenue", "profit", "advance")):
+        out[col] = totals[1:, i]
+        out[f"{col}_delta"] = totals[1:, i] - totals[0, i]
+    out["profit_pct"] = np.where(out["revenue"] > 0, out["profit"] / out["revenue"].where(out["revenue"] > 0, 1) * 100, 0.0)
+    return out, (time.perf_counter() - started) * 1000
+
+
+def sweep_values(low, high, steps):
+    """`steps` evenly spaced values from low to high (one value when they are equal)."""
+    if steps <= 1 or high <= low:
+        return [float(low)]
+    return [round(float(v), 2) for v in np.linspace(low, high, int(steps))]
+
+
+# --- TARGET-PRICE SOLVER ---
+MARGIN_KEYS = ("part_margin", "labor_margin", "extra_margin")
+
+
+def _split(current, markup, adjustable):
+    """Integer margins summing to `markup`, changing only the `adjustable` ones (Parts first)."""
+    out = dict(current)
+    delta = int(markup) - sum(out.values())
+    for k in adjustable:
+        step = max(min(delta, 100 - out[k]), -out[k])
+        out[k] += step
+        delta -= step
+    return out
+
+
+def solve(material, days, margins, global_settings, target, on="total", adjustable=MARGIN_KEYS, days_range=None, tolerance=100.0, top=5):
+    """
+    Margins (and optionally labor days) that bring one estimate closest to a target.
+
+    The totals depend on the margins only through their sum, so every integer
+    margin sum the adjustable sliders can reach is priced at once for every
+    allowed day count (numpy), with calculate_estimate_details' rounding.
+    Candidates are ranked by distance to the target (in steps of `tolerance`),
+    then by how little the margins change, then by how little the days change.
+
+    Args:
+        material (float): Material base cost (see material_base).
+        days (int): Current labor days.
+        margins (dict): Current part/labor/extra margins in percent.
+        global_settings (dict): For the daily labor cost and advance margin.
+        target (float): Wanted grand total (on="total") or profit (on="profit").
+        adjustable (iterable): Margin keys the solver may change.
+        days_range (tuple): (min, max) labor days to try; None keeps `days`.
+        tolerance (float): Misses within the same multiple of this count as equally close
+            (grand totals move in steps of 100).
+        top (int): Number of distinct solutions to return.
+
+    Returns:
+        list: Dicts with the margins, days, rounded_grand_total, total_profit, advance_amount
+              and miss (result minus target), best first.
+    """
+    cur = {k: int(round(estimates.to_float(margins.get(k)))) for k in MARGIN_KEYS}
+    adjustable = [k for k in MARGIN_KEYS if k in adjustable]
+    fixed = sum(cur[k] for k in MARGIN_KEYS if k not in adjustable)
+    markups = np.arange(fixed, fixed + 100 * len(adjustable) + 1, dtype=float)
+    lo, hi = days_range or (days, days)
+    day_opts = np.arange(max(int(lo), 1), max(int(hi), int(lo), 1) + 1, dtype=float)
+    s = current_settings(global_settings)
+    res = price(float(material), day_opts[None, :], markups[:, None], s['daily_labor_cost'], s['advance_margin'])
+    res = {k: np.broadcast_to(v, (len(markups), len(day_opts))) for k, v in res.items()}
+    value = res["rounded_grand_total"] if on == "total" else res["total_profit"]
+    miss = value - float(target)
+    cur_markup = sum(cur.values())
+    d_markup = np.broadcast_to(np.abs(markups - cur_markup)[:, None], miss.shape)
+    d_days = np.broadcast_to(np.abs(day_opts - days)[None, :], miss.shape)
+    order = np.lexsort((np.abs(miss).ravel(), d_days.ravel(), d_markup.ravel(), np.floor(np.abs(miss) / max(tolerance, 1e-9)).ravel()))
+    solutions, seen = [], set()
+    for flat in order:
+        i, j = divmod(int(flat), len(day_opts))
+        key = (res["rounded_grand_total"][i, j], res["total_profit"][i, j])
+        if key in seen:
+            continue
+        seen.add(key)
+        solutions.append({**_split(cur, markups[i], adjustable), "days": int(day_opts[j]),
+                          **{k: float(res[k][i, j]) for k in ("rounded_grand_total", "total_profit", "advance_amount")},
+                          "miss": float(miss[i, j])})
+        if len(solutions) >= top:
+            break
+    return solutions
@@ -0,0 +1,208 @@
+import cProfile
+import json
+import marshal
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+# ---------------------------
+# PER-RERUN PROFILER
+# ---------------------------
+# Admins can profile the next N reruns of their session (Settings tab or
+# ?profile=N). Each profiled rerun runs under cProfile and tracemalloc; the
+# results are merged across runs and kept in the session until cleared.
+#
+# cProfile and tracemalloc are process-wide, so only one session profiles at
+# a time; runs that start while another session is profiling are skipped and
+# retried on the next rerun. Samples may include work done by other sessions'
+# threads in the same window.
+
+STATE_KEY = "_profiler"
+TRACE_FRAMES = 1
+_busy = threading.Lock()
+
+
+def _state(session_state):
+    return session_state.get(STATE_KEY)
+
+
+def request(session_state, runs):
+    """Profile the next `runs` reruns of this session (discards earlier results)."""
+    session_state[STATE_KEY] = {"runs_left": int(runs), "runs_done": 0, "skipped": 0, "wall": [],
+                                "stats": None, "allocs": {}, "active": None}
+
+
+def clear(session_state):
+    pending = _state(session_state)
+    if pending and pending.get("active"):
+        finish_run(session_state)
+    session_state.pop(STATE_KEY, None)
+
+
+def is_running(session_state):
+    s = _state(session_state)
+    return bool(s and (s["runs_left"] > 0 or s["active"]))
+
+
+def has_results(session_state):
+    s = _state(session_state)
+    return bool(s and s["runs_done"])
+
+
+def start_run(session_state):
+    """
+    Called at the top of every rerun. Closes a profile left open by a rerun
+    that ended early (st.rerun/st.stop) and starts a new one if runs remain.
+    """
+    s = _state(session_state)
+    if not s:
+        return
+    if s["active"]:
+        finish_run(session_state)
+    if s["runs_left"] <= 0:
+        return
+    if not _busy.acquire(blocking=False):
+        s["skipped"] += 1
+        return
+    prof = cProfile.Profile()
+    tracemalloc.start(TRACE_FRAMES)
+    s["active"] = (prof, time.perf_counter())
+    prof.enable()
+
+
+def finish_run(session_state):
+    """Called at the end of a rerun; merges this run's timings and allocations."""
+    s = _state(session_state)
+    if not s or not s["active"]:
+        return
+    prof, started = s["active"]
+    s["active"] = None
+    try:
+        prof.disable()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ])
+        tracemalloc.stop()
+    finally:
+        _busy.release()
+    s["wall"].append(time.perf_counter() - started)
+    if s["stats"] is None:
+        s["stats"] = pstats.Stats(prof)
+    else:
+        s["stats"].add(prof)
+    for stat in snapshot.statistics("lineno"):
+        frame = stat.traceback[0]
+        key = f"{frame.filename}:{frame.lineno}"
+        size, count = s["allocs"].get(key, (0, 0))
+        s["allocs"][key] = (size + stat.size, count + stat.count)
+    s["runs_left"] -= 1
+    s["runs_done"] += 1
+
+
+# --- REPORTS ---
+def _short_path(path):
+    cwd = os.getcwd()
+    if path.startswith(cwd):
+        return os.path.relpath(path, cwd)
+    marker = "site-packages" + os.sep
+    return path.split(marker, 1)[1] if marker in path else path
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == "~":
+        return name  # built-in
+    return f"{name} ({_short_path(filename)}:{line})"
+
+
+def summary(session_state):
+    s = _state(session_state) or {}
+    wall = s.get("wall") or []
+    return {"runs": s.get("runs_done", 0), "runs_left": s.get("runs_left", 0), "skipped": s.get("skipped", 0),
+            "avg_wall_ms": sum(wall) / len(wall) * 1000 if wall else 0.0, "max_wall_ms": max(wall) * 1000 if wall else 0.0}
+
+
+def top_functions(session_state, n=20, sort="cumulative"):
+    """
+    Returns:
+        list: Dicts with Function, Calls, Self (ms) and Cumulative (ms), summed over the profiled runs.
+    """
+    s = _state(session_state)
+    if not s or s["stats"] is None:
+        return []
+    key = 3 if sort == "cumulative" else 2
+    rows = sorted(s["stats"].stats.items(), key=lambda kv: kv[1][key], reverse=True)[:n]
+    return [{"Function": _label(func), "Calls": nc, "Self (ms)": tt * 1000, "Cumulative (ms)": ct * 1000}
+            for func, (cc, nc, tt, ct, callers) in rows]
+
+
+def top_allocations(session_state, n=20):
+    """
+    Returns:
+        list: Dicts with Line, Size (KiB) and Blocks: memory still allocated at the end of each run, summed.
+    """
+    s = _state(session_state)
+    if not s:
+        return []
+    rows = sorted(s["allocs"].items(), key=lambda kv: kv[1][0], reverse=True)[:n]
+    return [{"Line": _short_path(k), "Size (KiB)": size / 1024, "Blocks": count} for k, (size, count) in rows]
+
+
+def pstats_bytes(session_state):
+    """The merged profile in the marshal format read by pstats.Stats(path) and snakeviz."""
+    s = _state(session_state)
+    if not s or s["stats"] is None:
+        return b""
+    return marshal.dumps(s["stats"].stats)
+
+
+def speedscope_json(session_state, name="Jugnoo rerun profile"):
+    """
+    The merged profile as a speedscope "sampled" file.
+
+    cProfile keeps caller edges, not full stacks, so each function's self time
+    is attributed to the stack formed by following its heaviest caller.
+    """
+    s = _state(session_state)
+    if not s or s["stats"] is None:
+        return "{}"
+    stats = s["stats"].stats
+    frames, index = [], {}
+
+    def frame_id(func):
+        if func not in index:
+            filename, line, fname = func
+            index[func] = len(frames)
+            frames.append({"name": fname, "file": _short_path(filename), "line": line})
+        return index[func]
+
+    def stack_for(func):
+        chain, seen = [func], {func}
+        while True:
+            callers = stats.get(chain[-1], (0, 0, 0, 0, {}))[4]
+            parent = max(callers, key=lambda c: callers[c][3], default=None) if callers else None
+            if parent is None or parent in seen:
+                break
+            chain.append(parent)
+            seen.add(parent)
+        return [frame_id(f) for f in reversed(chain)]
+
+    samples, weights = [], []
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        if tt <= 0:
+            continue
+        samples.append(stack_for(func))
+        weights.append(tt)
+    total = sum(weights)
+    return json.dumps({
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{"type": "sampled", "name": name, "unit": "seconds", "startValue": 0, "endValue": total,
+                      "samples": samples, "weights": weights}],
+        "name": name,
+        "exporter": "jugnoo-profiling",
+    })
@@ -0,0 +1,235 @@
+"""
+Estimate revision history stored as deltas (`estimate_revisions` table).
+
+Each save stores only what changed against the previous revision: an edit
+script over the v2 line rows plus the new days/margins when they changed.
+Every SNAPSHOT_EVERY revisions (and the first one) is stored in full so any
+revision is rebuilt from the nearest snapshot with a bounded number of deltas.
+Deltas are taken against the stored chain (the rebuilt latest revision), not
+against what the saving user last loaded, so stale views, lost inserts and
+estimate migrations never corrupt later revisions.
+
+Revisions are never rewritten once stored, so rebuilt revisions are cached
+per process by (client, revision).
+"""
+import difflib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from utils import connection, estimates
+
+SNAPSHOT_EVERY = 20
+RECONSTRUCT_CACHE_SIZE = 256
+RECORD_ATTEMPTS = 5  # concurrent saves of one client race for the next revision number
+
+_rebuilt = OrderedDict()  # (client_id, revision) -> uncompressed v2
+_lock = threading.Lock()
+
+
+def _rows(v2):
+    return [list(r) for r in estimates.v2_rows(v2)]
+
+
+def _plain(v2):
+    """Uncompressed copy of a v2 estimate (deltas are computed on the line list)."""
+    return {"v": v2.get("v", estimates.SCHEMA_VERSION), "d": v2.get("d"), "m": v2.get("m"), "i": _rows(v2)}
+
+
+def make_delta(prev_v2, new_v2):
+    """
+    Computes the delta that turns `prev_v2` into `new_v2`.
+
+    Returns:
+        dict: {"i": [[start, end, [rows]], ...]} replacing prev rows[start:end],
+        plus "d" / "m" when days or margins changed. Empty dict if nothing changed.
+    """
+    old_rows, new_rows = _rows(prev_v2), _rows(new_v2)
+    ops = []
+    matcher = difflib.SequenceMatcher(a=[repr(r) for r in old_rows], b=[repr(r) for r in new_rows], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            ops.append([i1, i2, new_rows[j1:j2]])
+    delta = {}
+    if ops:
+        delta["i"] = ops
+    if prev_v2.get("d") != new_v2.get("d"):
+        delta["d"] = new_v2.get("d")
+    if prev_v2.get("m") != new_v2.get("m"):
+        delta["m"] = new_v2.get("m")
+    return delta
+
+
+def apply_delta(base_v2, delta):
+    """Inverse of make_delta: returns the uncompressed v2 estimate after applying `delta`."""
+    out = _plain(base_v2)
+    rows = out["i"]
+    # Ops are in ascending order of the original rows; apply from the end so earlier offsets stay valid
+    for i1, i2, new_rows in reversed(delta.get("i", [])):
+        rows[i1:i2] = new_rows
+    if "d" in delta:
+        out["d"] = delta["d"]
+    if "m" in delta:
+        out["m"] = delta["m"]
+    return out
+
+
+def reconstruct(revisions, revision):
+    """
+    Rebuilds a revision from a list of revision rows.
+
+    Args:
+        revisions (list): `estimate_revisions` rows for one client (any order).
+        revision (int): Revision number to rebuild.
+
+    Returns:
+        dict: The v2 estimate at that revision.
+    """
+    by_num = {r['revision']: r for r in revisions}
+    if revision not in by_num:
+        raise KeyError(f"revision {revision} not found")
+    client_id = by_num[revision].get('client_id')
+    with _lock:
+        if (client_id, revision) in _rebuilt:
+            _rebuilt.move_to_end((client_id, revision))
+            return _rebuilt[(client_id, revision)]
+    start = revision
+    while by_num[start].get('snapshot') is None:
+        start -= 1
+        if start not in by_num:
+            raise ValueError(f"no snapshot found before revision {revision}")
+    state = _plain(by_num[start]['snapshot'])
+    for n in range(start + 1, revision + 1):
+        state = apply_delta(state, by_num[n].get('delta') or {})
+    if client_id is not None:
+        with _lock:
+            _rebuilt[(client_id, revision)] = state
+            while len(_rebuilt) > RECONSTRUCT_CACHE_SIZE:
+                _rebuilt.popitem(last=False)
+    return state
+
+
+def summarize_delta(delta):
+    """Short human-readable description of a delta."""
+    parts = []
+    added = removed = changed = 0
+    for i1, i2, new_rows in delta.get("i", []):
+        common = min(i2 - i1, len(new_rows))
+        changed += common
+        removed += (i2 - i1) - common
+        added += len(new_rows) - common
+    if added: parts.append(f"+{added} items")
+    if removed: parts.append(f"-{removed} items")
+    if changed: parts.append(f"{changed} changed")
+    if "d" in delta: parts.append(f"days → {delta['d']}")
+    if "m" in delta: parts.append("margins" if delta["m"] else "default margins")
+    return ", ".join(parts) or "no changes"
+
+
+def diff_estimates(old_est, new_est):
+    """
+    Line-level comparison of two parsed estimates for the diff view.
+
+    Returns:
+        list: Dicts with Change, Item, Qty, Unit and Base Rate ("old → new" for changed values).
+    """
+    def key(li):
+        return (li.item_id if li.item_id is not None else li.item, li.qty, li.unit, li.base_rate)
+
+    def fmt(a, b):
+        return f"{a} → {b}" if a != b else a
+
+    out = []
+    matcher = difflib.SequenceMatcher(a=[key(li) for li in old_est.items], b=[key(li) for li in new_est.items], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        old_part, new_part = old_est.items[i1:i2], new_est.items[j1:j2]
+        common = min(len(old_part), len(new_part)) if tag == 'replace' else 0
+        for o, n in zip(old_part[:common], new_part[:common]):
+            out.append({"Change": "Changed", "Item": fmt(o.item, n.item), "Qty": fmt(o.qty, n.qty), "Unit": fmt(o.unit, n.unit), "Base Rate": fmt(o.base_rate, n.base_rate)})
+        for o in old_part[common:]:
+            out.append({"Change": "Removed", "Item": o.item, "Qty": o.qty, "Unit": o.unit, "Base Rate": o.base_rate})
+        for n in new_part[common:]:
+            out.append({"Change": "Added", "Item": n.item, "Qty": n.qty, "Unit": n.unit, "Base Rate": n.base_rate})
+    if old_est.days != new_est.days:
+        out.append({"Change": "Days", "Item": "", "Qty": fmt(old_est.days, new_est.days), "Unit": "", "Base Rate": ""})
+    if old_est.margins != new_est.margins:
+        describe = lambda m: f"{m.part:g}/{m.labor:g}/{m.extra:g}%" if m else "default"
+        out.append({"Change": "Margins", "Item": fmt(describe(old_est.margins), describe(new_est.margins)), "Qty": "", "Unit": "", "Base Rate": ""})
+    return out
+
+
+# --- PERSISTENCE ---
+def get_revisions(supabase, client_id):
+    res = supabase.table("estimate_revisions").select("*").eq("client_id", client_id).order("revision").execute()
+    return res.data if res and res.data else []
+
+
+def latest_revision(supabase, client_id):
+    """
+    (number, v2 estimate) of a client's latest stored revision; (0, None) without history.
+
+    Reads only the rows back to the nearest snapshot (at most SNAPSHOT_EVERY). The
+    estimate is None when the chain cannot be rebuilt from them.
+    """
+    res = supabase.table("estimate_revisions").select("*").eq("client_id", client_id).order("revision", desc=True).limit(SNAPSHOT_EVERY).execute()
+    rows = res.data if res and res.data else []
+    if not rows:
+        return 0, None
+    last = rows[0]['revision']
+    try:
+        return last, reconstruct(rows, last)
+    except (KeyError, ValueError):
+        return last, None
+
+
+def record_revision(supabase, client_id, prev_v2, new_v2, username=None):
+    """
+    Appends a revision for a saved estimate.
+
+    Only the delta against the latest stored revision is written, except for
+    snapshot revisions. The first save of a client with an existing estimate
+    also stores `prev_v2` (the estimate being overwritten) as revision 1; after
+    that `prev_v2` is not used. If the stored chain cannot be rebuilt, the new
+    estimate is stored as a snapshot. When a concurrent save takes the same
+    revision number (UNIQUE(client_id, revision)), the latest revision is read
+    again and the delta recomputed against it.
+
+    Returns:
+        int or None: The new revision number, or None if nothing changed.
+    """
+    for attempt in range(RECORD_ATTEMPTS):
+        rows = _revision_rows(supabase, client_id, prev_v2, new_v2, username)
+        if not rows:
+            return None
+        try:
+            supabase.table("estimate_revisions").insert(rows).execute()
+        except Exception as e:
+            if not connection.unique_violation(e) or attempt == RECORD_ATTEMPTS - 1:
+                raise
+            continue
+        return rows[-1]["revision"]
+
+
+def _revision_rows(supabase, client_id, prev_v2, new_v2, username):
+    """Rows to insert for record_revision (empty when nothing changed)."""
+    last, latest = latest_revision(supabase, client_id)
+    rows = []
+    if last == 0 and prev_v2:
+        last, latest = 1, prev_v2
+        rows.append({"client_id": client_id, "revision": 1, "snapshot": prev_v2, "delta": None, "summary": "initial"})
+    if last == 0:
+        rows.append({"client_id": client_id, "revision": 1, "snapshot": new_v2, "delta": None, "summary": "initial"})
+    else:
+        delta = make_delta(latest, new_v2) if latest is not None else None
+        if delta != {}:
+            n = last + 1
+            snapshot = new_v2 if delta is None or n % SNAPSHOT_EVERY == 0 else None
+            rows.append({"client_id": client_id, "revision": n, "snapshot": snapshot, "delta": None if snapshot else delta,
+                         "summary": summarize_delta(delta) if delta is not None else "full snapshot"})
+    now = datetime.now().isoformat()
+    for r in rows:
+        r["created_at"] = now
+        r["created_by"] = username
+    return rows
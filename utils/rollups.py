@@ -0,0 +1,232 @@
+"""
+Monthly P&L rollups (`pl_monthly` table).
+
+One row per month ('YYYY-MM') with the project-based P&L of the Work Done /
+Closed clients created that month and the supplier purchases made that month.
+The P&L tab reads these rows instead of recomputing the whole history.
+
+Rows are kept current by refreshing only the month touched by a write
+(client status change, payment, estimate save, purchase). A full rebuild is
+available for backfills and repairs:
+
+    python -m utils.maintenance rebuild-rollups
+"""
+from datetime import datetime
+
+from utils import estimates, helpers, payments
+
+ROLLUP_COLUMNS = ["revenue", "quoted", "collected", "est_cost", "material_cost", "labor_cost", "profit", "projects", "purchases"]
+CLIENT_COLUMNS = "id, created_at, status, final_settlement_amount, amount_paid, internal_estimate, est_grand_total, est_base_cost, est_labor_cost"
+PROJECT_COLUMNS = "id, name, created_at, status, final_settlement_amount, amount_paid, est_grand_total, est_base_cost, est_labor_cost"
+PAGE_SIZE = 1000
+
+
+def month_of(value):
+    """'YYYY-MM' for an ISO date/timestamp string (or datetime), None if missing."""
+    if value is None or value == "":
+        return None
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m")
+    return str(value)[:7]
+
+
+def month_bounds(month):
+    """Start (inclusive) and end (exclusive) ISO dates of a 'YYYY-MM' month."""
+    year, mon = int(month[:4]), int(month[5:7])
+    nxt = f"{year + 1}-01" if mon == 12 else f"{year}-{mon + 1:02d}"
+    return f"{month}-01", f"{nxt}-01"
+
+
+def empty_row(month):
+    row = {col: 0.0 for col in ROLLUP_COLUMNS}
+    row["projects"] = 0
+    row["month"] = month
+    return row
+
+
+def project_pl(client_row, global_settings, est=None):
+    """
+    Project-based P&L of one completed client, as shown in the P&L tab.
+
+    Revenue is the amount collected, or the estimate grand total when no
+    payment has been recorded. Costs come from the stored estimate totals.
+
+    Returns:
+        dict: revenue, quoted, collected, est_cost, material_cost, labor_cost, profit.
+    """
+    try:
+        totals = helpers.get_estimate_totals(client_row, global_settings, est=est)
+    except Exception:
+        totals = None
+    collected = payments.paid_amount(client_row)
+    revenue = collected if collected else (totals["est_grand_total"] if totals else 0.0)
+    est_cost = totals["est_base_cost"] if totals else 0.0
+    labor = totals["est_labor_cost"] if totals else 0.0
+    return {
+        "revenue": revenue,
+        "quoted": totals["est_grand_total"] if totals else 0.0,
+        "collected": collected,
+        "est_cost": est_cost,
+        "material_cost": est_cost - labor,
+        "labor_cost": labor,
+        "profit": revenue - est_cost if totals else 0.0,
+    }
+
+
+def select_all(query, page_size=PAGE_SIZE):
+    """
+    Every row of a select, a page at a time (PostgREST caps one response at its max-rows).
+
+    Args:
+        query (callable): Returns a new filtered select builder, e.g.
+                          lambda: supabase.table("t").select("id, cost").gte("d", start).
+        page_size (int): Rows fetched per request.
+    """
+    rows, start = [], 0
+    while True:
+        res = query().order("id").range(start, start + page_size - 1).execute()
+        page = res.data if res and res.data else []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        start += page_size
+
+
+def project_table(supabase, global_settings, item_names=None, page_size=PAGE_SIZE):
+    """
+    Per-project P&L rows of every completed client, oldest first.
+
+    Reads only PROJECT_COLUMNS, a page at a time; the estimate JSON is fetched
+    just for rows saved before the total columns existed.
+
+    Args:
+        supabase: Supabase client.
+        global_settings (dict): Used for estimates without stored totals.
+        item_names (dict): Inventory id -> item name (see estimates.inventory_maps).
+        page_size (int): Rows fetched per request.
+
+    Returns:
+        list: Dicts with client_id, Client, Revenue, Cost, Profit, Material Cost, Labor Cost
+              and created_at (the layout of AnalyticsStore.client_profitability).
+    """
+    rows = select_all(lambda: supabase.table("clients").select(PROJECT_COLUMNS).in_("status", helpers.INACTIVE_STATUSES), page_size)
+    missing = [r['id'] for r in rows if r.get('est_grand_total') is None]
+    parsed = {}
+    for i in range(0, len(missing), 200):
+        res = supabase.table("clients").select("id, internal_estimate").in_("id", missing[i:i + 200]).execute()
+        for r in res.data if res and res.data else []:
+            try:
+                parsed[r['id']] = estimates.parse_estimate(r.get('internal_estimate'), item_names)
+            except ValueError:
+                pass
+    out = []
+    for row in sorted(rows, key=lambda r: str(r.get('created_at') or "")):
+        proj = project_pl(row, global_settings, est=parsed.get(row['id']))
+        out.append({
+            "client_id": row['id'],
+            "Client": row.get('name'),
+            "Revenue": proj["revenue"],
+            "Cost": proj["est_cost"],
+            "Profit": proj["profit"],
+            "Material Cost": proj["material_cost"],
+            "Labor Cost": proj["labor_cost"],
+            "created_at": row.get('created_at'),
+        })
+    return out
+
+
+def compute_rollups(client_rows, purchase_rows, global_settings, parsed_estimates=None):
+    """
+    Builds monthly rollup rows from client and supplier purchase rows.
+
+    Args:
+        client_rows (list): `clients` rows (only Work Done / Closed ones are counted).
+        purchase_rows (list): `supplier_purchases` rows with cost and purchase_date.
+        global_settings (dict): Used for estimates without stored totals.
+        parsed_estimates (dict): Optional client id -> Estimate from estimates.parse_clients.
+
+    Returns:
+        dict: month -> rollup row.
+    """
+    parsed_estimates = parsed_estimates or {}
+    months = {}
+    for row in client_rows or []:
+        month = month_of(row.get('created_at'))
+        if month is None or row.get('status') not in helpers.INACTIVE_STATUSES:
+            continue
+        out = months.setdefault(month, empty_row(month))
+        for col, val in project_pl(row, global_settings, est=parsed_estimates.get(row.get('id'))).items():
+            out[col] += val
+        out["projects"] += 1
+    for p in purchase_rows or []:
+        month = month_of(p.get('purchase_date'))
+        if month is None:
+            continue
+        months.setdefault(month, empty_row(month))["purchases"] += estimates.to_float(p.get('cost'))
+    return months
+
+
+# --- PERSISTENCE ---
+def get_rollups(supabase):
+    res = supabase.table("pl_monthly").select("*").order("month").execute()
+    return res.data if res and res.data else []
+
+
+def _save(supabase, rows):
+    now = datetime.now().isoformat()
+    for r in rows:
+        r["updated_at"] = now
+    if rows:
+        supabase.table("pl_monthly").upsert(rows, on_conflict="month").execute()
+
+
+def refresh_month(supabase, month, global_settings):
+    """
+    Recomputes a single month from its own clients and purchases and upserts it.
+
+    Returns:
+        dict or None: The stored row, None if `month` is empty.
+    """
+    if not month:
+        return None
+    start, end = month_bounds(month)
+    cl = select_all(lambda: supabase.table("clients").select(CLIENT_COLUMNS).in_("status", helpers.INACTIVE_STATUSES)
+                    .gte("created_at", start).lt("created_at", end))
+    sp = select_all(lambda: supabase.table("supplier_purchases").select("id, cost, purchase_date").gte("purchase_date", start).lt("purchase_date", end))
+    row = compute_rollups(cl, sp, global_settings).get(month, empty_row(month))
+    _save(supabase, [row])
+    return row
+
+
+def refresh_for_client(supabase, client_id, global_settings):
+    """Refreshes the month a client belongs to (after a status, payment or estimate change)."""
+    res = supabase.table("clients").select("created_at").eq("id", client_id).execute()
+    if res and res.data:
+        return refresh_month(supabase, month_of(res.data[0].get('created_at')), global_settings)
+    return None
+
+
+def rebuild(supabase, global_settings, batch_size=200, progress=None):
+    """
+    Recomputes every month from scratch and replaces the table contents.
+
+    Returns:
+        int: Number of month rows written.
+    """
+    from utils import maintenance
+    months = {}
+    for rows in maintenance.iter_client_batches(supabase, CLIENT_COLUMNS, batch_size):
+        for month, row in compute_rollups(rows, [], global_settings).items():
+            out = months.setdefault(month, empty_row(month))
+            for col in ROLLUP_COLUMNS:
+                out[col] += row[col]
+        if progress:
+            progress(len(months))
+    sp = select_all(lambda: supabase.table("supplier_purchases").select("id, cost, purchase_date"))
+    for month, row in compute_rollups([], sp, global_settings).items():
+        months.setdefault(month, empty_row(month))["purchases"] += row["purchases"]
+    stale = [r['month'] for r in get_rollups(supabase) if r['month'] not in months]
+    if stale:
+        supabase.table("pl_monthly").delete().in_("month", stale).execute()
+    _save(supabase, list(months.values()))
+    return len(months)
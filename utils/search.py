@@ -0,0 +1,413 @@
+"""
+Search helpers for pickers and lookups.
+"""
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+
+
+def match_rank(name, query):
+    """
+    Ranks how well `name` matches a typed query (lower is better, None = no match).
+
+    0: name starts with the query, 1: a word in the name starts with it,
+    2: the query appears anywhere in the name.
+    """
+    n, q = name.lower(), query.lower()
+    if n.startswith(q):
+        return 0
+    if any(w.startswith(q) for w in n.split()):
+        return 1
+    if q in n:
+        return 2
+    return None
+
+
+def filter_rows(rows, query, key='name', limit=None):
+    """
+    Filters and orders rows for a typeahead box.
+
+    Args:
+        rows (list): Dicts to search.
+        query (str): Text typed by the user; empty returns all rows unchanged.
+        key (str): Field holding the searchable name.
+        limit (int): Maximum number of rows to return.
+
+    Returns:
+        list: Matching rows, best matches first (stable within a rank).
+    """
+    query = (query or "").strip()
+    if not query:
+        return rows[:limit] if limit else rows
+    ranked = []
+    for i, r in enumerate(rows):
+        rank = match_rank(str(r.get(key) or ""), query)
+        if rank is not None:
+            ranked.append((rank, i, r))
+    ranked.sort(key=lambda t: (t[0], t[1]))
+    out = [r for _, _, r in ranked]
+    return out[:limit] if limit else out
+
+
+def picker_labels(rows, key='name'):
+    """id -> display label, adding the id only where names are duplicated."""
+    counts = {}
+    for r in rows:
+        counts[r.get(key)] = counts.get(r.get(key), 0) + 1
+    return {r['id']: (f"{r.get(key)} (#{r['id']})" if counts[r.get(key)] > 1 else str(r.get(key))) for r in rows}
+
+
+# ---------------------------
+# INVENTORY ITEM INDEX
+# ---------------------------
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+def _trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ItemSearchIndex:
+    """
+    Typeahead index over inventory items.
+
+    Matches by token prefix (every query word must prefix some word of the
+    item name), falls back to trigram fuzzy matching for typos, and boosts
+    recently used items. Items are added/renamed/removed incrementally; `sync`
+    diffs a fresh inventory fetch against the index instead of rebuilding it.
+    """
+
+    USAGE_HALF_LIFE = 7 * 86400  # seconds; usage boost halves every week
+    FUZZY_MIN_SIMILARITY = 0.35
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.rows = {}            # id -> inventory row
+        self._names = {}          # id -> lowercased name
+        self._tokens = {}         # token -> set(ids)
+        self._sorted_tokens = []  # for prefix range scans
+        self._trigrams = {}       # trigram -> set(tokens)
+        self._usage = {}          # id -> (score, last_update_ts)
+        self._synced_rows = None
+
+    # --- maintenance ---
+    def _add_token(self, token, item_id):
+        ids = self._tokens.get(token)
+        if ids is None:
+            self._tokens[token] = ids = set()
+            bisect.insort(self._sorted_tokens, token)
+            for g in _trigrams(token):
+                self._trigrams.setdefault(g, set()).add(token)
+        ids.add(item_id)
+
+    def _remove_token(self, token, item_id):
+        ids = self._tokens.get(token)
+        if not ids:
+            return
+        ids.discard(item_id)
+        if not ids:
+            del self._tokens[token]
+            i = bisect.bisect_left(self._sorted_tokens, token)
+            if i < len(self._sorted_tokens) and self._sorted_tokens[i] == token:
+                del self._sorted_tokens[i]
+            for g in _trigrams(token):
+                toks = self._trigrams.get(g)
+                if toks:
+                    toks.discard(token)
+                    if not toks:
+                        del self._trigrams[g]
+
+    def upsert(self, row):
+        """Adds an item or re-indexes it after a rename."""
+        with self._lock:
+            item_id = row['id']
+            old = self._names.get(item_id)
+            new = str(row.get('item_name') or "").lower()
+            self.rows[item_id] = row
+            if old == new:
+                return
+            if old is not None:
+                for t in set(tokenize(old)):
+                    self._remove_token(t, item_id)
+            self._names[item_id] = new
+            for t in set(tokenize(new)):
+                self._add_token(t, item_id)
+
+    def remove(self, item_id):
+        with self._lock:
+            old = self._names.pop(item_id, None)
+            self.rows.pop(item_id, None)
+            self._usage.pop(item_id, None)
+            if old is not None:
+                for t in set(tokenize(old)):
+                    self._remove_token(t, item_id)
+
+    def sync(self, inventory_rows):
+        """Brings the index in line with a fresh inventory fetch (no-op for the same fetch)."""
+        with self._lock:
+            if inventory_rows is self._synced_rows:
+                return self
+            seen = set()
+            for row in inventory_rows or []:
+                seen.add(row['id'])
+                self.upsert(row)
+            for item_id in [i for i in self.rows if i not in seen]:
+                self.remove(item_id)
+            self._synced_rows = inventory_rows
+            return self
+
+    def record_use(self, item_id, now=None):
+        """Boosts an item after it is added to an estimate or purchased."""
+        now = now or time.time()
+        with self._lock:
+            self._usage[item_id] = (self.usage_score(item_id, now) + 1.0, now)
+
+    def usage_score(self, item_id, now=None):
+        score, ts = self._usage.get(item_id, (0.0, 0.0))
+        if not score:
+            return 0.0
+        return score * 0.5 ** (((now or time.time()) - ts) / self.USAGE_HALF_LIFE)
+
+    # --- queries ---
+    def _prefix_ids(self, q):
+        ids = set()
+        i = bisect.bisect_left(self._sorted_tokens, q)
+        while i < len(self._sorted_tokens) and self._sorted_tokens[i].startswith(q):
+            ids |= self._tokens[self._sorted_tokens[i]]
+            i += 1
+        return ids
+
+    def _fuzzy_ids(self, q):
+        grams = _trigrams(q)
+        counts = {}
+        for g in grams:
+            for tok in self._trigrams.get(g, ()):
+                counts[tok] = counts.get(tok, 0) + 1
+        ids = {}
+        for tok, shared in counts.items():
+            sim = shared / (len(grams) + len(_trigrams(tok)) - shared)
+            if sim >= self.FUZZY_MIN_SIMILARITY:
+                for item_id in self._tokens[tok]:
+                    ids[item_id] = max(ids.get(item_id, 0.0), sim)
+        return ids
+
+    def search(self, query, limit=20):
+        """
+        Returns up to `limit` inventory rows for a typed query, best first.
+
+        An empty query returns the most recently used items, then the rest alphabetically.
+        """
+        now = time.time()
+        with self._lock:
+            q_tokens = tokenize(query or "")
+            if not q_tokens:
+                ordered = heapq.nsmallest(limit, self.rows, key=lambda i: (-self.usage_score(i, now), self._names[i]))
+                return [self.rows[i] for i in ordered]
+
+            q_full = " ".join(q_tokens)
+            scores = {}
+            exact = None
+            for q in q_tokens:
+                ids = self._prefix_ids(q)
+                exact = ids if exact is None else exact & ids
+            for item_id in exact or ():
+                name = self._names[item_id]
+                score = 3.0 if name.startswith(q_full) else 2.0
+                scores[item_id] = score
+            if len(scores) < limit:
+                # Fuzzy: each query word must fuzzily match some word of the item
+                fuzzy = None
+                for q in q_tokens:
+                    matches = self._fuzzy_ids(q) if len(q) >= 3 else {}
+                    matches.update(dict.fromkeys(self._prefix_ids(q), 1.0))
+                    if fuzzy is None:
+                        fuzzy = matches
+                    else:
+                        fuzzy = {i: min(s, matches[i]) for i, s in fuzzy.items() if i in matches}
+                for item_id, sim in (fuzzy or {}).items():
+                    scores.setdefault(item_id, sim)
+            ranked = heapq.nsmallest(limit, scores, key=lambda i: (-(scores[i] + math.log1p(self.usage_score(i, now))), self._names[i]))
+            return [self.rows[i] for i in ranked]
+
+
+_item_index = ItemSearchIndex()
+
+
+def item_index(inventory_rows):
+    """Process-wide inventory index, synced with the given fetch."""
+    return _item_index.sync(inventory_rows)
+
+
+# ---------------------------
+# GLOBAL SEARCH INDEX
+# ---------------------------
+class GlobalSearchIndex:
+    """
+    In-memory inverted index over clients, estimates, inventory items, suppliers and staff.
+
+    Documents are keyed by (kind, id). Each source is synced against its
+    cached fetch: only documents whose indexed text changed are re-indexed,
+    and documents missing from the fetch are dropped.
+    """
+
+    PREFIX_MIN_LEN = 2      # single characters only match whole words
+    PREFIX_MAX_TOKENS = 500  # cap on expanded tokens per query word
+    PREFIX_WEIGHT = 0.8
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.docs = {}            # key -> {"kind", "id", "title", "subtitle", "weights"}
+        self._postings = {}       # token -> {key: weight}
+        self._sorted_tokens = []
+        self._synced = {}         # kind -> rows object last synced
+
+    def _index_tokens(self, key, weights):
+        for tok, w in weights.items():
+            posting = self._postings.get(tok)
+            if posting is None:
+                self._postings[tok] = posting = {}
+                bisect.insort(self._sorted_tokens, tok)
+            posting[key] = w
+
+    def _unindex_tokens(self, key, weights):
+        for tok in weights:
+            posting = self._postings.get(tok)
+            if posting is None:
+                continue
+            posting.pop(key, None)
+            if not posting:
+                del self._postings[tok]
+                i = bisect.bisect_left(self._sorted_tokens, tok)
+                if i < len(self._sorted_tokens) and self._sorted_tokens[i] == tok:
+                    del self._sorted_tokens[i]
+
+    def upsert(self, kind, doc_id, title, subtitle="", fields=()):
+        """
+        Adds or updates one document.
+
+        Args:
+            fields: (text, weight) pairs; the title is always indexed with weight 3.
+        """
+        weights = {}
+        for text, w in ((title, 3.0),) + tuple(fields):
+            for tok in tokenize(text or ""):
+                if w > weights.get(tok, 0.0):
+                    weights[tok] = w
+        key = (kind, doc_id)
+        with self._lock:
+            old = self.docs.get(key)
+            if old and old["weights"] == weights and old["title"] == title and old["subtitle"] == subtitle:
+                return
+            if old:
+                self._unindex_tokens(key, old["weights"])
+            self.docs[key] = {"kind": kind, "id": doc_id, "title": title, "subtitle": subtitle, "weights": weights}
+            self._index_tokens(key, weights)
+
+    def remove(self, kind, doc_id):
+        with self._lock:
+            old = self.docs.pop((kind, doc_id), None)
+            if old:
+                self._unindex_tokens((kind, doc_id), old["weights"])
+
+    def sync(self, kind, rows, make_doc):
+        """
+        Syncs all documents of one kind with a fetch.
+
+        Args:
+            kind (str): Document kind, e.g. "client".
+            rows (list): Source rows; the same object is only synced once.
+            make_doc (callable): row -> (id, title, subtitle, fields), or None to skip the row.
+        """
+        with self._lock:
+            if rows is not None and self._synced.get(kind) is rows:
+                return
+            seen = set()
+            for row in rows or []:
+                doc = make_doc(row)
+                if doc is None:
+                    continue
+                seen.add(doc[0])
+                self.upsert(kind, *doc)
+            for key in [k for k in self.docs if k[0] == kind and k[1] not in seen]:
+                self.remove(*key)
+            self._synced[kind] = rows
+
+    def _matches(self, q):
+        matches = dict(self._postings.get(q, {}))
+        if len(q) >= self.PREFIX_MIN_LEN:
+            i = bisect.bisect_left(self._sorted_tokens, q)
+            end = min(len(self._sorted_tokens), i + self.PREFIX_MAX_TOKENS)
+            while i < end and self._sorted_tokens[i].startswith(q):
+                tok = self._sorted_tokens[i]
+                if tok != q:
+                    for key, w in self._postings[tok].items():
+                        w *= self.PREFIX_WEIGHT
+                        if w > matches.get(key, 0.0):
+                            matches[key] = w
+                i += 1
+        return matches
+
+    def search(self, query, limit=20):
+        """
+        Returns ranked hits for a query; every query word must match (as a word or word prefix).
+
+        Returns:
+            list: Dicts with kind, id, title, subtitle and score, best first.
+        """
+        q_tokens = list(dict.fromkeys(tokenize(query or "")))
+        if not q_tokens:
+            return []
+        with self._lock:
+            per_token = sorted((self._matches(q) for q in q_tokens), key=len)
+            scores = per_token[0]
+            for m in per_token[1:]:
+                scores = {k: s + m[k] for k, s in scores.items() if k in m}
+                if not scores:
+                    return []
+            top = heapq.nlargest(limit, scores.items(), key=lambda kv: (kv[1], -len(self.docs[kv[0]]["title"])))
+            return [{"kind": k[0], "id": k[1], "title": self.docs[k]["title"], "subtitle": self.docs[k]["subtitle"], "score": round(s, 2)} for k, s in top]
+
+
+_global_index = GlobalSearchIndex()
+
+
+def global_index(clients=None, inventory=None, suppliers=None, staff=None, parsed_estimates=None):
+    """
+    Process-wide global search index, synced with the given cached fetches.
+
+    Args:
+        clients, inventory, suppliers, staff (list): Rows from the cached data functions (None skips a source).
+        parsed_estimates (dict): client id -> estimates.Estimate, for estimate line-item documents.
+    """
+    idx = _global_index
+    if clients is not None:
+        idx.sync("client", clients, lambda r: (r['id'], r.get('name') or "", r.get('status') or "",
+                                              ((r.get('phone'), 1.0), (r.get('address'), 1.0), (r.get('status'), 0.5))))
+        if parsed_estimates is not None:
+            names = {r['id']: r.get('name') or "" for r in clients}
+            status = {r['id']: r.get('status') or "" for r in clients}
+
+            def estimate_doc(r):
+                est = parsed_estimates.get(r['id'])
+                if est is None or not est.items:
+                    return None
+                lines = " ".join(li.item for li in est.items)
+                return (r['id'], f"Estimate: {names[r['id']]}", f"{len(est.items)} items · {status[r['id']]}", ((lines, 1.0),))
+            idx.sync("estimate", clients, estimate_doc)
+    if inventory is not None:
+        idx.sync("item", inventory, lambda r: (r['id'], r.get('item_name') or "", f"Stock: {r.get('stock_quantity', 0)} {r.get('unit', '')}", ((r.get('unit'), 0.5),)))
+    if suppliers is not None:
+        idx.sync("supplier", suppliers, lambda r: (r['id'], r.get('name') or "", r.get('contact_person') or "",
+                                                  ((r.get('contact_person'), 1.5), (r.get('phone'), 1.0), (r.get('gstin'), 1.0))))
+    if staff is not None:
+        idx.sync("staff", staff, lambda r: (r['id'], r.get('name') or "", f"{r.get('role', '')} · {r.get('status', '')}",
+                                           ((r.get('role'), 1.0), (r.get('phone'), 1.0), (r.get('status'), 0.5))))
+    return idx
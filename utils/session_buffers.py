@@ -0,0 +1,177 @@
+import json
+import sys
+from collections import OrderedDict
+
+# ---------------------------
+# PER-CLIENT SESSION BUFFERS
+# ---------------------------
+# The Dashboard (dash_est_{id}), the Estimator (est_{id}) and the location
+# button (loc_update_{id}) keep per-client buffers in st.session_state. Without
+# cleanup, a long session keeps one set for every client it ever rendered.
+#
+# The app creates each buffer with ensure() (or registers it with track())
+# when it renders the client, and evict() runs at the end of every rerun.
+# When more than MAX_CLIENTS clients are tracked, the least recently rendered
+# ones are dropped. Clients rendered in the current run and buffers with
+# unsaved edits are never evicted. A buffer counts as edited when its item
+# rows differ from the rows it was created with, or when it is pending
+# (there is nothing saved to compare it to).
+
+STATE_KEY = "_buffers"
+MAX_CLIENTS = 25
+# Item fields the user can change; computed columns (prices, Sr No) are ignored when comparing
+ITEM_FIELDS = ("Item", "Qty", "Unit", "Base Rate")
+# Widget keys that belong to a client; dropped with its buffers (Streamlit has already
+# discarded the values of widgets that were not rendered in the run)
+WIDGET_PREFIXES = ("de_", "sv_", "pay_", "pay_date_", "pay_method_", "pay_note_", "pay_hist_", "save_pay_",
+                   "paste_loc_", "geo_edit_", "del_", "t_", "pe_", "rev_a_", "rev_b_", "rev_restore_", "est_target_", "int_pdf_")
+PENDING = "pending"
+
+
+def _state(session_state):
+    s = session_state.get(STATE_KEY)
+    if s is None:
+        s = {"run": 0, "clients": OrderedDict(), "evicted": 0}
+        session_state[STATE_KEY] = s
+    return s
+
+
+def _fingerprint(value):
+    if isinstance(value, list) and all(isinstance(r, dict) for r in value):
+        rows = []
+        for r in value:
+            row = []
+            for f in ITEM_FIELDS:
+                v = r.get(f)
+                try: v = float(v) if f in ("Qty", "Base Rate") else ("" if v is None else str(v))
+                except (TypeError, ValueError): v = str(v)
+                row.append(v)
+            rows.append(row)
+        value = rows
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def begin_run(session_state):
+    """Called at the top of every rerun (after login)."""
+    _state(session_state)["run"] += 1
+
+
+def _touch(session_state, client_id):
+    s = _state(session_state)
+    entry = s["clients"].pop(client_id, None) or {"keys": {}}
+    entry["run"] = s["run"]
+    s["clients"][client_id] = entry
+    return entry
+
+
+def ensure(session_state, client_id, key, default):
+    """
+    Returns the buffer `key` of `client_id`, creating it from `default` (the
+    saved rows, which become its baseline) when it is missing, and marks the
+    client as rendered in this run.
+    """
+    entry = _touch(session_state, client_id)
+    if key not in session_state:
+        session_state[key] = default
+        entry["keys"][key] = _fingerprint(default)
+    elif key not in entry["keys"]:
+        entry["keys"][key] = PENDING  # created before tracking; keep it until saved
+    return session_state[key]
+
+
+def track(session_state, client_id, key):
+    """
+    Marks `client_id` as rendered and registers `key` as a pending buffer: a
+    change with no saved counterpart (e.g. a pasted location) that is kept
+    until the app removes it.
+    """
+    _touch(session_state, client_id)["keys"][key] = PENDING
+
+
+def mark_clean(session_state, client_id, key):
+    """Call after saving a buffer: its current contents become the new baseline."""
+    entry = _state(session_state)["clients"].get(client_id)
+    if entry is not None and key in session_state:
+        entry["keys"][key] = _fingerprint(session_state[key])
+
+
+def is_dirty(session_state, client_id, key):
+    entry = _state(session_state)["clients"].get(client_id)
+    if entry is None or key not in entry["keys"] or key not in session_state:
+        return False
+    baseline = entry["keys"][key]
+    return baseline == PENDING or baseline != _fingerprint(session_state[key])
+
+
+def evict(session_state, max_clients=MAX_CLIENTS):
+    """
+    Drops the least recently rendered clients' buffers and widget keys until at
+    most `max_clients` are tracked. Skips clients rendered in this run and
+    clients with unsaved edits.
+
+    Returns:
+        list: The evicted client ids.
+    """
+    s = _state(session_state)
+    clients = s["clients"]
+    for cid in list(clients):
+        # Buffers the app removed itself (after a save) no longer need tracking
+        clients[cid]["keys"] = {k: v for k, v in clients[cid]["keys"].items() if k in session_state}
+        if not clients[cid]["keys"] and clients[cid]["run"] < s["run"]:
+            del clients[cid]
+    evicted = []
+    for cid in list(clients):
+        if len(clients) <= max_clients:
+            break
+        entry = clients[cid]
+        if entry["run"] >= s["run"] or any(is_dirty(session_state, cid, k) for k in entry["keys"]):
+            continue
+        for k in entry["keys"]:
+            session_state.pop(k, None)
+        for p in WIDGET_PREFIXES:
+            session_state.pop(f"{p}{cid}", None)
+        del clients[cid]
+        evicted.append(cid)
+    s["evicted"] += len(evicted)
+    return evicted
+
+
+# --- MEMORY REPORT ---
+def _deep_size(obj, seen):
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if hasattr(obj, "memory_usage") and hasattr(obj, "shape"):  # pandas DataFrame / Series
+        try:
+            usage = obj.memory_usage(deep=True)
+            return int(usage.sum() if hasattr(usage, "sum") else usage)
+        except Exception:
+            pass
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_size(v, seen) for v in obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        size += _deep_size(vars(obj), seen)
+    return size
+
+
+def memory_report(session_state, n=15):
+    """
+    Approximate memory held by this session's state.
+
+    Returns:
+        dict: total_kib, keys, tracked_clients, dirty_clients, evicted, and top
+        (the `n` largest keys as dicts with Key and Size (KiB)).
+    """
+    sizes = []
+    for k in list(session_state.keys()):
+        try: sizes.append((k, _deep_size(session_state[k], set())))
+        except Exception: continue
+    sizes.sort(key=lambda kv: kv[1], reverse=True)
+    s = _state(session_state)
+    dirty = sum(1 for cid, e in s["clients"].items() if any(is_dirty(session_state, cid, k) for k in e["keys"]))
+    return {"total_kib": sum(b for _, b in sizes) / 1024, "keys": len(sizes), "tracked_clients": len(s["clients"]),
+            "dirty_clients": dirty, "evicted": s["evicted"],
+            "top": [{"Key": str(k), "Size (KiB)": b / 1024} for k, b in sizes[:n]]}
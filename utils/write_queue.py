@@ -0,0 +1,426 @@
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from utils import connection
+
+try:
+    import fcntl  # flush lock shared by every worker process on the host
+except ImportError:  # Windows: one process per queue file
+    fcntl = None
+
+# ---------------------------
+# WRITE-BEHIND QUEUE
+# ---------------------------
+# Saves that technicians make on poor connections (status, payments,
+# estimates, staff status) are written to a local SQLite queue and the UI
+# returns at once. The app patches its cached views so the change shows
+# immediately, and a background thread applies queued writes to the backend
+# in order.
+#
+# * Durable: the queue file survives restarts; the flusher resumes on boot.
+# * Ordered: writes are applied in the order they were queued. A transient
+#   failure (backend down) stops the flush and retries later with backoff,
+#   so later writes never overtake earlier ones.
+# * Batching: consecutive writes of the same kind to the same record are
+#   merged into one request when the kind registers a `merge` function.
+# * Conflicts: writes carry the values the user saw (`expected`, usually the
+#   row's `updated_at`). If the row was changed by someone else in the
+#   meantime, the write is not applied and is marked as a conflict.
+# * Failures and conflicts are kept for the user to retry or discard. A write
+#   interrupted mid-flight (process killed, or a timeout after the request
+#   was sent) is retried only if its kind is idempotent; otherwise it is
+#   marked failed so it is never applied twice.
+# * Several worker processes share the queue file. Only one flushes at a
+#   time (a file lock next to the queue), and each write is claimed with a
+#   conditional update, so no write is applied by two processes.
+#
+# Handlers are registered by the app with register(kind, apply, ...); they
+# run in the flusher thread, not in a Streamlit script run.
+
+DEFAULT_QUEUE_PATH = os.path.join(".cache", "jugnoo_writes.sqlite3")
+QUEUE_PATH_ENV = "JUGNOO_WRITE_QUEUE"
+MAX_ATTEMPTS = 8
+BATCH_SIZE = 20
+POLL_SECONDS = 2.0
+KEEP_DONE_SECONDS = 86400
+OWN_MAX_ENTRIES = 4096  # (table, row, column) keys whose last written value is remembered
+
+PENDING, APPLYING, DONE, FAILED, CONFLICT = "pending", "applying", "done", "failed", "conflict"
+INTERRUPTED = "Interrupted while saving; check the record before retrying."
+
+
+class Conflict(Exception):
+    """The record changed on the server after the user loaded it."""
+
+
+class WriteQueue:
+    """The queue table in a local SQLite file (one connection per thread, WAL mode)."""
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and path != ":memory:":
+            os.makedirs(folder, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending_writes ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, entity TEXT, payload TEXT NOT NULL, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL DEFAULT 0, "
+            "error TEXT, label TEXT, created_by TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS pending_writes_status ON pending_writes (status, id)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _exec(self, sql, params=()):
+        conn = self._conn()
+        cur = conn.execute(sql, params)
+        conn.commit()
+        return cur
+
+    def add(self, kind, payload, entity=None, label=None, user=None):
+        now = time.time()
+        cur = self._exec(
+            "INSERT INTO pending_writes (kind, entity, payload, status, label, created_by, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (kind, entity, json.dumps(payload, default=str), PENDING, label, user, now, now))
+        return cur.lastrowid
+
+    @contextlib.contextmanager
+    def flush_lock(self, blocking=False):
+        """Cross-process lock on `<path>.lock`; yields False when another process holds it."""
+        if fcntl is None or self.path == ":memory:":
+            yield True
+            return
+        with open(self.path + ".lock", "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                held = False
+            else:
+                held = True
+            try:
+                yield held
+            finally:
+                if held: fcntl.flock(f, fcntl.LOCK_UN)
+
+    def claim(self, ids):
+        """Marks pending writes `applying`; False (and nothing claimed) if any of them is no longer pending."""
+        conn = self._conn()
+        marks = ",".join("?" * len(ids))
+        try:
+            cur = conn.execute(f"UPDATE pending_writes SET status = ?, updated_at = ? WHERE status = ? AND id IN ({marks})",
+                               (APPLYING, time.time(), PENDING, *ids))
+            if cur.rowcount != len(ids):
+                conn.rollback()
+                return False
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+
+    def due(self, limit=BATCH_SIZE):
+        rows = self._conn().execute(
+            "SELECT * FROM pending_writes WHERE status = ? ORDER BY id LIMIT ?", (PENDING, limit)).fetchall()
+        return [dict(r) for r in rows]
+
+    def set_status(self, ids, status, error=None, retry_in=None):
+        now = time.time()
+        for write_id in ids:
+            if retry_in is not None:
+                self._exec("UPDATE pending_writes SET status = ?, error = ?, attempts = attempts + 1, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                           (status, error, now + retry_in, now, write_id))
+            else:
+                self._exec("UPDATE pending_writes SET status = ?, error = ?, updated_at = ? WHERE id = ?", (status, error, now, write_id))
+
+    def rows(self, statuses, user=None):
+        marks = ",".join("?" * len(statuses))
+        sql = f"SELECT * FROM pending_writes WHERE status IN ({marks})"
+        params = list(statuses)
+        if user is not None:
+            sql += " AND created_by = ?"
+            params.append(user)
+        return [dict(r) for r in self._conn().execute(sql + " ORDER BY id", params).fetchall()]
+
+    def recover(self, idempotent_kinds):
+        """
+        Called once at start: resolves writes left `applying` by a stopped process and purges old ones.
+
+        Runs under the flush lock, so writes another live process is applying are left alone.
+        """
+        with self.flush_lock(blocking=True):
+            for r in self.rows([APPLYING]):
+                if r["kind"] in idempotent_kinds:
+                    self.set_status([r["id"]], PENDING)
+                else:
+                    self.set_status([r["id"]], FAILED, INTERRUPTED)
+        self._exec("DELETE FROM pending_writes WHERE status = ? AND updated_at < ?", (DONE, time.time() - KEEP_DONE_SECONDS))
+
+
+# --- HANDLERS ---
+_handlers = {}  # kind -> {"apply", "merge", "on_failed", "after", "idempotent"}
+_own = OrderedDict()  # (table, row id, column) -> last value this process wrote (not a conflict for later writes), LRU
+_own_lock = threading.Lock()
+
+
+def register(kind, apply, merge=None, on_failed=None, after=None, idempotent=False):
+    """
+    Registers how to apply a kind of write.
+
+    Args:
+        kind (str): Name stored with each queued write.
+        apply: apply(payload) performs the write; raises Conflict, a transient
+            error (retried) or any other error (marked failed).
+        merge: merge(earlier, later) -> payload that applies both at once, or
+            None when they cannot be combined.
+        on_failed: on_failed(payload) undoes the optimistic view (e.g. clears
+            caches) when a write fails for good or conflicts.
+        after: after(payload) runs once the write is applied (cache and rollup
+            refreshes); its errors are logged and never make the write retry.
+        idempotent (bool): Safe to apply twice (retried after an interrupted
+            flush or a timeout). Other kinds are retried only when the request
+            certainly did not reach the backend.
+    """
+    _handlers[kind] = {"apply": apply, "merge": merge, "on_failed": on_failed, "after": after, "idempotent": idempotent}
+
+
+def remember(table, row_id, row):
+    """
+    Records the values this process last wrote to a row, so later queued writes don't see them as conflicts.
+
+    Only the last value per column is kept: an earlier value of ours that is
+    back on the server was put there by someone else, so it is a conflict.
+    """
+    with _own_lock:
+        for col, value in (row or {}).items():
+            key = (table, row_id, col)
+            _own[key] = json.dumps(value, default=str)
+            _own.move_to_end(key)
+        while len(_own) > OWN_MAX_ENTRIES:
+            _own.popitem(last=False)
+
+
+def check_expected(supabase, table, row_id, expected):
+    """Raises Conflict when a column in `expected` was changed on the server by someone else."""
+    if not expected:
+        return
+    res = supabase.table(table).select(",".join(expected)).eq("id", row_id).execute()
+    if not res or not res.data:
+        raise Conflict(f"{table} #{row_id} no longer exists")
+    current = res.data[0]
+    for col, seen in expected.items():
+        now = json.dumps(current.get(col), default=str)
+        if now == json.dumps(seen, default=str):
+            continue
+        with _own_lock:
+            if _own.get((table, row_id, col)) == now:
+                continue
+        raise Conflict(f"{table} #{row_id} was changed by someone else ({col})")
+
+
+def apply_update(supabase, table, row_id, values, expected=None):
+    """Conflict-checked `update ... where id = row_id`; remembers the written row (incl. trigger columns)."""
+    check_expected(supabase, table, row_id, expected)
+    res = supabase.table(table).update(values).eq("id", row_id).execute()
+    remember(table, row_id, values)
+    if res and res.data:
+        remember(table, row_id, res.data[0])
+    return res
+
+
+def remember_current(supabase, table, row_id, columns=("updated_at",)):
+    """After a write that changed trigger columns without returning them (e.g. an RPC), records their new values."""
+    res = supabase.table(table).select(",".join(columns)).eq("id", row_id).execute()
+    if res and res.data:
+        remember(table, row_id, res.data[0])
+
+
+def merge_updates(earlier, later):
+    """merge for payloads shaped {"values": {...}, "expected": {...}, ...}: later values win, earlier expectations are kept."""
+    merged = {**earlier, **later}
+    merged["values"] = {**earlier.get("values", {}), **later.get("values", {})}
+    merged["expected"] = earlier.get("expected") or later.get("expected")
+    return merged
+
+
+# --- QUEUE FRONT ---
+_queue = None
+_queue_lock = threading.Lock()
+_wake = threading.Event()
+_flusher = None
+
+
+def configure(path=None):
+    global _queue
+    with _queue_lock:
+        _queue = WriteQueue(path or os.environ.get(QUEUE_PATH_ENV) or DEFAULT_QUEUE_PATH)
+    return _queue
+
+
+def is_configured():
+    return _queue is not None
+
+
+def get_queue():
+    if _queue is None:
+        configure()
+    return _queue
+
+
+def enqueue(kind, payload, entity=None, label=None, user=None):
+    """
+    Queues a write and wakes the flusher. Returns the write id.
+
+    Args:
+        kind (str): A registered kind.
+        payload (dict): JSON-serializable arguments for the handler.
+        entity (str): The record written (e.g. "clients:12"); consecutive writes to it may be merged.
+        label (str): Shown in the pending/failed list.
+        user (str): Username of the author.
+    """
+    if kind not in _handlers:
+        raise KeyError(f"No handler registered for write kind {kind!r}")
+    write_id = get_queue().add(kind, payload, entity, label, user)
+    _wake.set()
+    return write_id
+
+
+def _groups(rows):
+    """Consecutive mergeable writes (same kind and entity) as (ids, payload)."""
+    groups = []
+    for r in rows:
+        payload = json.loads(r["payload"])
+        merge = _handlers.get(r["kind"], {}).get("merge")
+        if groups and merge and r["entity"] and groups[-1][0] == (r["kind"], r["entity"]):
+            merged = merge(groups[-1][2], payload)
+            if merged is not None:
+                groups[-1][1].append(r["id"])
+                groups[-1] = (groups[-1][0], groups[-1][1], merged, groups[-1][3])
+                continue
+        groups.append(((r["kind"], r["entity"]), [r["id"]], payload, r))
+    return groups
+
+
+def flush_once():
+    """
+    Applies due writes in order. Returns (applied, failed, retrying) counts;
+    stops at the first transient failure. Does nothing while another process is flushing.
+    """
+    q = get_queue()
+    with q.flush_lock() as held:
+        if not held:
+            return 0, 0, 0
+        return _flush(q)
+
+
+def _flush(q):
+    rows = q.due()
+    now = time.time()
+    if rows and rows[0]["next_attempt_at"] > now:
+        return 0, 0, len(rows)  # head of the queue is backing off; keep order
+    applied = failed = 0
+    for (kind, _), ids, payload, head in _groups([r for r in rows if r["next_attempt_at"] <= now]):
+        handler = _handlers.get(kind)
+        if handler is None:
+            break  # registered on the first script run; try again later
+        if not q.claim(ids):
+            break  # taken by another process; re-read the queue on the next flush
+        try:
+            handler["apply"](payload)
+        except Conflict as e:
+            q.set_status(ids, CONFLICT, str(e))
+            _failed(handler, payload)
+            failed += len(ids)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if connection.is_transient(e):
+                # A timeout may come after the backend committed: only safe writes are sent again
+                if (handler["idempotent"] or connection._not_sent(e)) and head["attempts"] + 1 < MAX_ATTEMPTS:
+                    q.set_status(ids, PENDING, error, retry_in=connection.backoff(head["attempts"] + 1, base=1.0, cap=60.0))
+                    return applied, failed, len(ids)
+                if not handler["idempotent"]:
+                    error = f"{error}. {INTERRUPTED}"
+            q.set_status(ids, FAILED, error)
+            _failed(handler, payload)
+            failed += len(ids)
+        else:
+            q.set_status(ids, DONE)
+            applied += len(ids)
+            _after(handler, payload)
+    return applied, failed, 0
+
+
+def _failed(handler, payload):
+    if handler.get("on_failed"):
+        try: handler["on_failed"](payload)
+        except Exception as e: print(f"Write rollback failed: {e}")
+
+
+def _after(handler, payload):
+    if handler.get("after"):
+        try: handler["after"](payload)
+        except Exception as e: print(f"Post-write refresh failed: {e}")
+
+
+def start():
+    """Starts the background flusher once per process (recovering writes interrupted by a restart)."""
+    global _flusher
+    with _queue_lock:
+        if _flusher is not None:
+            return
+        get_queue().recover({k for k, h in _handlers.items() if h["idempotent"]})
+
+        def run():
+            while True:
+                _wake.wait(POLL_SECONDS)
+                _wake.clear()
+                try:
+                    flush_once()
+                except Exception as e:
+                    print(f"Write queue flush failed: {e}")
+
+        _flusher = threading.Thread(target=run, name="write-queue-flusher", daemon=True)
+        _flusher.start()
+
+
+# --- STATUS ---
+def pending(user=None):
+    """Queued and in-flight writes (oldest first)."""
+    return get_queue().rows([PENDING, APPLYING], user)
+
+
+def failures(user=None):
+    """Writes that failed for good or conflicted, waiting for retry/discard."""
+    return get_queue().rows([FAILED, CONFLICT], user)
+
+
+def retry(write_id):
+    """Queues a failed write again. A conflicted write is retried without its conflict check (overwrites)."""
+    q = get_queue()
+    row = q._conn().execute("SELECT status, payload FROM pending_writes WHERE id = ?", (write_id,)).fetchone()
+    if row is None or row["status"] not in (FAILED, CONFLICT):
+        return
+    payload = json.loads(row["payload"])
+    if row["status"] == CONFLICT:
+        payload.pop("expected", None)
+    q._exec("UPDATE pending_writes SET status = ?, payload = ?, attempts = 0, next_attempt_at = 0, error = NULL WHERE id = ?",
+            (PENDING, json.dumps(payload, default=str), write_id))
+    _wake.set()
+
+
+def discard(write_id):
+    get_queue()._exec("DELETE FROM pending_writes WHERE id = ? AND status IN (?, ?)", (write_id, FAILED, CONFLICT))